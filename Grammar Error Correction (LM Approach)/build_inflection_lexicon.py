@@ -0,0 +1,44 @@
+"""
+Builds the inflection lexicon for inflection.get_inflected_words from a list of words:
+the paradigm of the lemma of every word is inflected once and written to the table
+(see inflection.InflectionLexicon), which is then set as inflection.inflection_lexicon_path.
+
+Usage:
+    python build_inflection_lexicon.py words.txt inflection_lexicon.tsv
+
+words.txt - any UTF-8 text (e.g. the vocabulary or a corpus of the texts to be corrected).
+"""
+import argparse
+
+import regex as re
+
+from inflection import get_lemma_key, inflect_paradigm, parse_word
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('words', help='UTF-8 text with the words')
+    parser.add_argument('output', help='file of the lexicon')
+    args = parser.parse_args()
+
+    words = set()
+    with open(args.words, encoding='utf-8') as f:
+        for line in f:
+            words.update(word.lower() for word in re.findall(r'\p{Cyrillic}+(?:-\p{Cyrillic}+)*', line))
+
+    lines = {}
+    for word in words:
+        p = parse_word(word)
+        key = get_lemma_key(p)
+        if key not in lines:
+            lines[key] = key + '\t' + ' '.join(inflect_paradigm(p)) + '\n'
+
+    # Lines are sorted by bytes of the key, as they are compared by the bisection
+    with open(args.output, 'wb') as f:
+        for key in sorted(lines, key=lambda key: (key + '\t').encode('utf-8')):
+            f.write(lines[key].encode('utf-8'))
+    print('Words: %d, lemmas: %d' % (len(words), len(lines)))
+
+
+if __name__ == '__main__':
+    main()
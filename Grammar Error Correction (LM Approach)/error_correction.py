@@ -1,14 +1,14 @@
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from silero import silero_te
-import language_tool_python
-import pymorphy2
 import string
 import torch
 import copy
 import requests
-import itertools
+import threading
 import os
+from concurrent.futures import ThreadPoolExecutor
 from wrappers import WrapperSegm, WrapperMorph, WrapperToken, WrapperSyntax
+from inflection import get_inflected_words, get_morph_analyzer, parse_word, numbers, genders, tenses
 
 import torch.nn.functional as F
 from nltk.stem.snowball import SnowballStemmer
@@ -18,14 +18,29 @@ from nltk.stem.snowball import SnowballStemmer
 # Number of attempts for correcting ending of the word
 attempts_change_ending = 50000
 
+# Number of masked contexts passed to BERT in one forward pass
+bert_batch_size = 32
+
 #proba_gce_treshold = 0.01
 
 # Directory with models
 # 172.16.211.106
 models_dir = '/opt/models'
 
-# LanguageTool
+# LanguageTool server (a local one for testing: docker run -p 8081:8010 erikvl87/languagetool)
 host = 'http://172.16.211.111:8081'
+# Number of concurrent requests to the server for one language and timeout of a request, in seconds
+languagetool_workers = 8
+languagetool_timeout = 60
+
+# Punctuation is restored on windows of punctuation_window words of the text,
+# neighbouring windows overlap by punctuation_overlap words
+punctuation_window = 150
+punctuation_overlap = 20
+
+# If True, spelling requests to LanguageTool run in a thread pool while punctuation and grammar
+# are processed by the models in the main thread; otherwise methods run one after another
+parallel_methods = True
 
 # list of languages to load
 languages = ['ru']  # ['ru', 'en', 'es', 'de', 'fr', 'ar', 'tr', 'uk']
@@ -38,12 +53,6 @@ ner_models = {}
 porter_stem = None
 silero_model = None
 
-if 'ru' in languages:
-    cases = ['nomn', 'gent', 'datv', 'accs', 'ablt', 'loct']
-    numbers = ['sing', 'plur']
-    genders = ['masc', 'femn', 'neut']
-    tenses = ['past', 'pres', 'futr']
-
 def init():
     global languages, porter_stem, silero_model, tokenizer_bert, model_bert,\
     PRE_TRAINED_MODEL_NAME_BERT, wr_segm, wr_token, wr_morph, wr_syntax
@@ -67,50 +76,6 @@ def init():
 # --------------------------------------------------
 
 # ------------- WORD ENDING CORRECTION -------------
-def get_word(p, param):
-    if len(param) == 3:
-        word = p.inflect({param[0], param[1], param[2]})
-    else:
-        word = p.inflect({param[0], param[1]})
-    if word is not None:
-        return word.word
-    else:
-        return None
-
-
-def get_inflected_words(keyword):
-    morph = pymorphy2.MorphAnalyzer()
-    p = morph.parse(keyword)[0]
-    inflected_words = []
-    if 'VERB' in p.tag or 'INFN' in p.tag:
-        for param in itertools.product(numbers, tenses, genders):
-            word = get_word(p, param)
-            if word is not None:
-                inflected_words.append(word)
-        for param in itertools.product(numbers, tenses):
-            word = get_word(p, param)
-            if word is not None:
-                inflected_words.append(word)
-        for param in itertools.product(tenses, genders):
-            word = get_word(p, param)
-            if word is not None:
-                inflected_words.append(word)
-    else:
-        for param in itertools.product(numbers, cases, genders):
-            word = get_word(p, param)
-            if word is not None:
-                inflected_words.append(word)
-        for param in itertools.product(numbers, cases):
-            word = get_word(p, param)
-            if word is not None:
-                inflected_words.append(word)
-        for param in itertools.product(cases, genders):
-            word = get_word(p, param)
-            if word is not None:
-                inflected_words.append(word)
-    return list(set(inflected_words))
-
-
 def correct_stem(stem, tokenizer_bert):
     bert_predicted_index = tokenizer_bert.encode(stem)[1:-1]
     roberta_tokens = []
@@ -188,8 +153,43 @@ def get_corrected_keyword(keyword, keyword_stem, predicted_token, lang):
     return ''
 
 
+def get_keyword_stem(keyword, tokenizer_bert):
+    # Stem of the keyword from the BERT tokens: all tokens except the last one
+    bert_predicted_indexes = tokenizer_bert.encode(keyword)[1:-1]
+    token_list = []
+    for index in bert_predicted_indexes:
+        token_list.append(tokenizer_bert.decode(index))
+    if len(token_list) > 1:
+        if len(token_list[-1]) > 1:
+            keyword_stem = ''.join(token_list[:-1])
+        elif len(token_list[-1]) == 1:
+            keyword_stem = ''
+    elif len(token_list) == 1:
+        keyword_stem = ''
+    else:
+        keyword_stem = None
+    if '##' in keyword_stem:
+        keyword_stem = keyword_stem.replace('##', '')
+    return keyword_stem, token_list
+
+
+def predict_masked_tokens(contexts, tokenizer_bert, model_bert):
+    # Contexts are passed to BERT in padded batches; returns for every context indexes of the tokens
+    # predicted at the mask position, the most probable first (at most attempts_change_ending)
+    device = next(model_bert.parameters()).device
+    predictions = []
+    for i in range(0, len(contexts), bert_batch_size):
+        inputs = tokenizer_bert(contexts[i:i + bert_batch_size], padding=True, return_tensors='pt').to(device)
+        mask_token_index = (inputs['input_ids'] == tokenizer_bert.mask_token_id).int().argmax(dim=1)
+        with torch.no_grad():
+            logits = model_bert(**inputs).logits
+        masked_token_logits = logits[torch.arange(len(mask_token_index), device=device), mask_token_index]
+        top_k = min(attempts_change_ending, masked_token_logits.shape[-1])
+        predictions.extend(torch.topk(masked_token_logits, top_k, dim=-1).indices.cpu().tolist())
+    return predictions
+
+
 def correct_keywords_col_bert(text, keywords_col, start_position, tokenizer_bert, model_bert, lang):
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     messages_segm = wr_segm.do([{'text': text, 'lang': lang}])
     sentences = [sentence['text'] for sentence in messages_segm[0]['sentences']]
     predicted_keywords = []
@@ -217,55 +217,50 @@ def correct_keywords_col_bert(text, keywords_col, start_position, tokenizer_bert
 
             for j in reversed(range(first_noun_index + 1, len(keyword_col_token_pos))):
                 tail = ' ' + keyword_col_token_pos[j][0] + tail
+
+            # Contexts of all keywords are predicted in one batch, assuming that the keywords after
+            # the masked one are not changed; if a keyword is changed, the contexts before it
+            # differ and are predicted again
+            keyword_stems = {}
+            contexts = []
+            tail_speculative = tail
+            for i in reversed(range(first_noun_index + 1)):
+                keyword = keyword_col_token_pos[i][0]
+                keyword_stems[i] = get_keyword_stem(keyword, tokenizer_bert)
+                contexts.append(prefix + ''.join([' ' + x[0] for x in keyword_col_token_pos[:i]]) + ' ' +
+                                keyword_stems[i][0] + tokenizer_bert.mask_token + tail_speculative)
+                if keyword not in tail_speculative:
+                    tail_speculative = ' ' + keyword + tail_speculative
+            predictions = dict(zip(contexts, predict_masked_tokens(contexts, tokenizer_bert, model_bert)))
+
             for i in reversed(range(first_noun_index + 1)):
                 keyword = keyword_col_token_pos[i][0]
                 keyword_stem_nltk = porter_stem.stem(keyword)
                 #keyword_stem = correct_stem(keyword_stem, tokenizer_bert)
-                bert_predicted_indexes = tokenizer_bert.encode(keyword)[1:-1]
-                token_list = []
-                for index in bert_predicted_indexes:
-                    token_list.append(tokenizer_bert.decode(index))
-                if len(token_list) > 1:
-                    last_token = token_list[-1].replace('##', '')
-                    if len(token_list[-1]) > 1:
-                        keyword_stem = ''.join(token_list[:-1])
-                    elif len(token_list[-1]) == 1:
-                        keyword_stem = ''
-                elif len(token_list) == 1:
-                    keyword_stem = ''
-                else:
-                    keyword_stem = None
-                if '##' in keyword_stem:
-                    keyword_stem = keyword_stem.replace('##', '')
+                keyword_stem, token_list = keyword_stems[i]
                 context = prefix + ''.join(
                     [' ' + x[0] for x in keyword_col_token_pos[:i]]) + ' ' + keyword_stem + tokenizer_bert.mask_token + tail
 
                 print('\t\tContext: ' + context)
 
-                indexed_tokens = tokenizer_bert.encode(context)
-                tokens_tensor = torch.tensor([indexed_tokens])
-                tokens_tensor = tokens_tensor.to(device)
-
-                mask_token_index = torch.where(tokens_tensor == tokenizer_bert.mask_token_id)[1]
-
-                with torch.no_grad():
-                    outputs = model_bert(tokens_tensor)
-
-                del tokens_tensor
-                torch.cuda.empty_cache()
-
-                logits = outputs.logits.to(device).cpu().detach()
-                masked_token_logits = logits[0, mask_token_index.to(device).cpu().detach(), :]
-                index_logit = [(k, masked_token_logits[0, k]) for k in range(len(masked_token_logits[0]))]
-                index_logit.sort(key=lambda x: x[1], reverse=True)
+                if context not in predictions:
+                    predictions[context] = predict_masked_tokens([context], tokenizer_bert, model_bert)[0]
+                predicted_indexes = predictions[context]
 
                 print('\t\tKeyword stem: ' + keyword_stem_nltk)
                 k = 0
                 found = False
                 final_predicted_keyword = ''
                 inflected_words = get_inflected_words(keyword)
-                while k < attempts_change_ending:
-                    predicted_token = tokenizer_bert.decode([index_logit[k][0]])
+                if len(inflected_words) > 0:
+                    # POS of the keyword and of its forms do not depend on the predicted token
+                    keyword_pos = parse_word(keyword).tag.POS
+                    pos_compare = False
+                    for word in inflected_words:
+                        if keyword_pos == parse_word(word).tag.POS:
+                            pos_compare = True
+                while k < len(predicted_indexes):
+                    predicted_token = tokenizer_bert.decode([predicted_indexes[k]])
                     if predicted_token.startswith('##'):
                         predicted_token = predicted_token.replace('##', '')
                     punct = string.punctuation + '...'
@@ -282,13 +277,7 @@ def correct_keywords_col_bert(text, keywords_col, start_position, tokenizer_bert
 
                     if len(predicted_keyword) > 0 and not found and len(predicted_keyword.split()) == 1:
                         if len(inflected_words) > 0:
-                            morph = pymorphy2.MorphAnalyzer()
-                            keyword_pos = morph.parse(keyword)[0].tag.POS
-                            predicted_keyword_pos = morph.parse(predicted_keyword)[0].tag.POS
-                            pos_compare = False
-                            for word in inflected_words:
-                                if keyword_pos == morph.parse(word)[0].tag.POS:
-                                    pos_compare = True
+                            predicted_keyword_pos = parse_word(predicted_keyword).tag.POS
                             if pos_compare and predicted_keyword.lower() in inflected_words \
                                 and check_match_feats(keyword, predicted_keyword, keyword_pos, predicted_keyword_pos, lang):
                                 final_predicted_keyword = predicted_keyword
@@ -320,43 +309,111 @@ def correct_keywords_col_bert(text, keywords_col, start_position, tokenizer_bert
 
 # --------------------------------------------------
 
+# ------------------ LANGUAGETOOL ------------------
+
+class LanguageToolClient:
+    """
+    Client of the LanguageTool server for one language.
+    The session keeps up to languagetool_workers HTTP connections alive between the requests
+    """
+
+    def __init__(self, lang):
+        self.lang = lang if lang else 'auto'
+        self.url = host.rstrip('/') + '/v2/check'
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=languagetool_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def check(self, text):
+        # Returns matches of the server (dicts with fields offset, length, replacements, ...)
+        response = self.session.post(self.url, data={'text': text, 'language': self.lang},
+                                     timeout=languagetool_timeout)
+        response.raise_for_status()
+        return to_code_points(text, response.json()['matches'])
+
+
+def to_code_points(text, matches):
+    # The server counts offset and length in UTF-16 code units, astral characters (e.g. emoji) take two of them;
+    # they are converted to indexes of the Python string
+    if len(text.encode('utf-16-le')) == 2 * len(text):
+        return matches
+    code_points = []
+    for index, char in enumerate(text):
+        code_points.append(index)
+        if ord(char) > 0xFFFF:
+            code_points.append(index)
+    code_points.append(len(text))
+    for match in matches:
+        start = code_points[match['offset']]
+        end = code_points[match['offset'] + match['length']]
+        match['offset'] = start
+        match['length'] = end - start
+    return matches
+
+
+# lang -> LanguageToolClient, clients are created on the first request and then reused
+tools = {}
+tools_lock = threading.Lock()
+
+
+def get_tool(lang):
+    with tools_lock:
+        if lang not in tools:
+            tools[lang] = LanguageToolClient(lang)
+        return tools[lang]
+
+
+def correct_text(text, matches):
+    # Applies the first replacement of every match, as LanguageTool.correct() does; overlapping matches are skipped
+    matches = [match for match in matches if len(match['replacements']) > 0]
+    chars = list(text)
+    errors = [chars[match['offset']:match['offset'] + match['length']] for match in matches]
+    correct_offset = 0
+    for match, error in zip(matches, errors):
+        start = correct_offset + match['offset']
+        end = start + match['length']
+        if chars[start:end] != error:
+            continue
+        replacement = match['replacements'][0]['value']
+        chars[start:end] = list(replacement)
+        correct_offset += len(replacement) - len(error)
+    return ''.join(chars)
+
+
+def get_errors(text, matches):
+    errors = []
+    for match in matches:
+        errors.append({'error_word': text[match['offset']:match['offset'] + match['length']],
+                       'start': match['offset'], 'end': match['offset'] + match['length'] - 1,
+                       'replacements': [replacement['value'] for replacement in match['replacements']]})
+    return errors
+
+
+def get_grammar_dict(text, matches):
+    grammar_dict = {'corrected_text': correct_text(text, matches), 'number_errors': len(matches)}
+    if len(matches) > 0:
+        grammar_dict['errors'] = get_errors(text, matches)
+    return grammar_dict
+
+
 #исправление грамматических и орфографических ошибок с помощью LanguageTool (локально)
 def grammar_correction(text, lang, replaces_dict=None):
     if replaces_dict != None:
         replaces = replaces_dict['new_string']
         replaces_indexes = [replaces_dict['result_start'], replaces_dict['result_start'] + len(replaces) - 1]
-    if not lang:
-        tool = language_tool_python.LanguageTool('auto', remote_server=host)
-    else:
-        tool = language_tool_python.LanguageTool(lang, remote_server=host)
-    # print(tool.check('Ткст для прверки которя'))
+    tool = get_tool(lang)
     if replaces_dict == None:
-        errors = tool.check(text)
-        matches = []
-        for error in errors:
-            if error.replacements is not None and error.offset is not None:
-                error_dict = {'error_word': text[error.offset:error.offset + error.errorLength],
-                            'start': error.offset, 'end': error.offset + error.errorLength - 1,
-                            'replacements': error.replacements}
-                matches.append(error_dict)
-        text_corrected = tool.correct(text)
-        grammar_dict = {'corrected_text': text_corrected, 'number_errors': len(errors)}
-        if len(errors) > 0:
-            grammar_dict['errors'] = matches
+        # corrected text is made from the matches of the same check
+        grammar_dict = get_grammar_dict(text, tool.check(text))
     else:
         number_errors = 0
         text_corrected = text
-        matches = []
         word = text[replaces_indexes[0]: replaces_indexes[1]]
         errors = tool.check(word)
         number_errors += len(errors)
-        for error in errors:
-            if error.replacements is not None and error.offset is not None:
-                error_dict = {'error_word': text[error.offset:error.offset + error.errorLength],
-                            'start': error.offset, 'end': error.offset + error.errorLength - 1,
-                            'replacements': error.replacements}
-                matches.append(error_dict)
-        word_corrected = tool.correct(word)
+        matches = get_errors(text, errors)
+        word_corrected = correct_text(word, errors)
         text_corrected[replaces_indexes[0]: replaces_indexes[1]] = word_corrected
         text_corrected = correct_sentence(text_corrected)
         grammar_dict = {'corrected_text': text_corrected, 'number_errors': len(errors)}
@@ -365,6 +422,16 @@ def grammar_correction(text, lang, replaces_dict=None):
     return grammar_dict
 
 
+#проверка нескольких текстов одного языка: запросы к LanguageTool отправляются параллельно
+def grammar_correction_batch(texts, lang):
+    tool = get_tool(lang)
+    with ThreadPoolExecutor(max_workers=languagetool_workers) as executor:
+        matches_list = list(executor.map(tool.check, texts))
+    return [get_grammar_dict(text, matches) for text, matches in zip(texts, matches_list)]
+
+# --------------------------------------------------
+
+
 #исправление пунктуционных ошибок в сегментированном тексте на предложения (предварительно очистив его от всех знаков пунктуации)
 def punctuation(text, lang, replaces_dict=None):
     if replaces_dict != None:
@@ -383,13 +450,7 @@ def punctuation(text, lang, replaces_dict=None):
         output_text = text[:replaces_indexes[0]] + output_word + text[replaces_indexes[1]:]
         return output_text
     else:
-        sentences = get_sentences_without_punctuation(text, lang)
-        new_sentences = []
-        for sent in sentences:
-            sent = sent.lower()
-            output_text = silero_model.enhance_text(sent, lang)
-            new_sentences.append(output_text)
-        return correct_sentence(' '.join(new_sentences))
+        return punctuation_batch([text], lang)[0]
 
 
 #удаление пробелов перед знаками препинания
@@ -402,13 +463,116 @@ def correct_sentence(sentence):
 
 #очистка предложений от пунктуации
 def get_sentences_without_punctuation(text, lang):
-    sentences = []
+    return get_sentences_without_punctuation_batch([text], lang)[0]
+
+
+#очистка предложений нескольких текстов от пунктуации (тексты сегментируются одним вызовом)
+def get_sentences_without_punctuation_batch(texts, lang):
     punct = string.punctuation
-    messages_segm = wr_segm.do([{'text': text, 'lang': lang}])
-    for sent in messages_segm[0]['sentences']:
-        sentence = sent['text'].translate(str.maketrans('', '', punct))
-        sentences.append(sentence)
-    return sentences
+    messages_segm = wr_segm.do([{'text': text, 'lang': lang} for text in texts])
+    sentences_list = []
+    for message in messages_segm:
+        sentences = []
+        for sent in message['sentences']:
+            sentence = sent['text'].translate(str.maketrans('', '', punct))
+            sentences.append(sentence)
+        sentences_list.append(sentences)
+    return sentences_list
+
+
+# Signs which the punctuation model may put around the words
+punctuation_chars = string.punctuation + '—–…«»'
+
+# Number of texts processed by windows and number of texts for which the output of the model
+# could not be aligned with the words and sentences were processed separately
+punctuation_stats = {'texts': 0, 'fallbacks': 0}
+
+
+def align_enhanced_words(words, output_text):
+    # Enhanced form of every input word: the model only changes casing and adds punctuation,
+    # so output tokens without punctuation are matched to the input words in order;
+    # words made only of signs (dashes, quotes left by the cleaning) may be kept or dropped by the model.
+    # Returns None if the output can not be aligned with the input
+    keys = [word.strip(punctuation_chars).lower() for word in words]
+    enhanced_words = []
+    for token in output_text.split():
+        key = token.strip(punctuation_chars).lower()
+        while key != '' and len(enhanced_words) < len(words) and keys[len(enhanced_words)] == '':
+            enhanced_words.append(words[len(enhanced_words)])
+        if key == '':
+            if len(enhanced_words) < len(words) and keys[len(enhanced_words)] == '':
+                enhanced_words.append(token)
+            elif len(enhanced_words) > 0:
+                # a separate sign added by the model (e.g. a dash) goes with the previous word
+                enhanced_words[-1] += ' ' + token
+            else:
+                return None
+        elif len(enhanced_words) < len(words) and key == keys[len(enhanced_words)]:
+            enhanced_words.append(token)
+        else:
+            return None
+    while len(enhanced_words) < len(words) and keys[len(enhanced_words)] == '':
+        enhanced_words.append(words[len(enhanced_words)])
+    if len(enhanced_words) != len(words):
+        return None
+    return enhanced_words
+
+
+def enhance_words(words, lang):
+    # Restores punctuation and casing of the words of one text, the model is run on overlapping windows;
+    # every word is taken from the window where it has the most context on both sides
+    enhanced_words = []
+    stride = max(punctuation_window - punctuation_overlap, 1)
+    start = 0
+    while start < len(words):
+        end = min(start + punctuation_window, len(words))
+        enhanced_window = align_enhanced_words(words[start:end], silero_model.enhance_text(' '.join(words[start:end]), lang))
+        if enhanced_window is None:
+            return None
+        low = start + punctuation_overlap // 2 if start > 0 else start
+        high = end - (punctuation_overlap - punctuation_overlap // 2) if end < len(words) else end
+        enhanced_words.extend(enhanced_window[low - start:high - start])
+        if end == len(words):
+            break
+        start += stride
+    return enhanced_words
+
+
+def enhance_sentences(sentences, lang):
+    # Restores punctuation of the segmented text; sentence boundaries found by the segmentation are kept:
+    # the first letter of a sentence is capitalized, the last word ends with a terminal sign
+    sentences_words = [sent.lower().split() for sent in sentences]
+    sentences_words = [words for words in sentences_words if len(words) > 0]
+    words = [word for words in sentences_words for word in words]
+    enhanced_words = enhance_words(words, lang) if len(words) > 0 else []
+    punctuation_stats['texts'] += 1
+    if enhanced_words is None:
+        # the output of the model does not match the words, sentences are processed separately
+        punctuation_stats['fallbacks'] += 1
+        return correct_sentence(' '.join(silero_model.enhance_text(sent.lower(), lang) for sent in sentences))
+
+    index = 0
+    for words_sent in sentences_words:
+        first = index
+        index += len(words_sent)
+        last = index - 1
+        for k in range(first, index):
+            word = enhanced_words[k]
+            letter = next((i for i, char in enumerate(word) if char.isalnum()), None)
+            if letter is not None:
+                enhanced_words[k] = word[:letter] + word[letter].upper() + word[letter + 1:]
+                break
+        word = enhanced_words[last]
+        signs = word[len(word.rstrip(punctuation_chars + ' ')):]
+        if not any(sign in signs for sign in '.!?…'):
+            enhanced_words[last] = word.rstrip(',;:-—– ') + '.'
+    return correct_sentence(' '.join(enhanced_words))
+
+
+#восстановление пунктуации в нескольких текстах одного языка (без замен)
+def punctuation_batch(texts, lang):
+    sentences_list = get_sentences_without_punctuation_batch(texts, lang)
+    return [enhance_sentences(sentences, lang) for sentences in sentences_list]
 
 
 def agreement(text, keywords, start_position, lang):
@@ -456,7 +620,7 @@ def dep_word_agreement(original_text, changed_text, lang, replaces):
                     linked_words_indexes.append(i)
         linked_words_list.append(linked_words)
     #реализация морфологии для слов из unique_changed_words и связанных слов из linked_words
-    morph = pymorphy2.MorphAnalyzer()
+    morph = get_morph_analyzer()
     morph_unique_list = []
     morph_linked_list = []
     for word in unique_changed_words:
@@ -490,10 +654,50 @@ def dep_word_agreement(original_text, changed_text, lang, replaces):
     return grammar_dict
 
 
+#исправление орфографии одного сообщения; None, если в сообщении нет проверяемых замен
+def spelling_correction(message):
+    replaces = message.get('replaces')
+    lang = message.get('lang')
+    grammar_dict = None
+    if replaces == None:
+        grammar_dict = grammar_correction(message['text'], lang)
+    else:
+        for elem in replaces:
+            if elem['check']:
+                if 'text' in elem.keys() and 'result_text' in elem.keys():
+                    grammar_dict = grammar_correction(message['result_text'], lang, elem)
+                else:
+                    grammar_dict = grammar_correction(message['result_text'], lang)
+    return grammar_dict
+
+
 # Parameter method can take one of the values "spelling", "punctuation", "grammar"
 def error_correction(messages, methods=["spelling", 'punctuation', 'grammar']):
     messages_new = copy.deepcopy(messages)
-    for message in messages_new:
+    if parallel_methods and 'spelling' in methods:
+        with ThreadPoolExecutor(max_workers=languagetool_workers) as executor:
+            # LanguageTool requests of all messages are sent first and wait for the server
+            # while the models process the messages
+            spelling_results = [executor.submit(spelling_correction, message) for message in messages_new]
+            return correct_messages(messages_new, methods, spelling_results)
+    return correct_messages(messages_new, methods)
+
+
+def correct_messages(messages_new, methods, spelling_results=None):
+    # Fills 'error_correction' of the messages in place; spelling_results - futures of spelling_correction
+    # for every message (if None, spelling is corrected here)
+
+    # punctuation of the texts without replaces is restored for all messages of a language at once
+    punctuation_texts = {}
+    if 'punctuation' in methods:
+        indexes_by_lang = {}
+        for i, message in enumerate(messages_new):
+            if message.get('replaces') is None and message.get('lang') is not None:
+                indexes_by_lang.setdefault(message['lang'], []).append(i)
+        for lang, indexes in indexes_by_lang.items():
+            texts = punctuation_batch([messages_new[i]['text'] for i in indexes], lang)
+            punctuation_texts.update(zip(indexes, texts))
+    for index_message, message in enumerate(messages_new):
         replaces = None
         lang = None
         if 'replaces' in message.keys():
@@ -503,21 +707,17 @@ def error_correction(messages, methods=["spelling", 'punctuation', 'grammar']):
         grammar_dict = {}
         for method in methods:
             if method == 'spelling':
-                if replaces == None:
-                    text = message['text']
-                    grammar_dict[method] = grammar_correction(text, lang)
+                if spelling_results is not None:
+                    spelling_dict = spelling_results[index_message].result()
                 else:
-                    for elem in replaces:
-                        if elem['check']:
-                            if 'text' in elem.keys() and 'result_text' in elem.keys():
-                                grammar_dict[method] = grammar_correction(message['result_text'], lang, elem)
-                            else:
-                                grammar_dict[method] = grammar_correction(message['result_text'], lang)
+                    spelling_dict = spelling_correction(message)
+                if spelling_dict is not None:
+                    grammar_dict[method] = spelling_dict
             elif method == 'punctuation':
                 if lang is not None:
                     if replaces == None:
                         text = message['text']
-                        grammar_dict[method] = {'corrected_text': punctuation(text, lang)}
+                        grammar_dict[method] = {'corrected_text': punctuation_texts[index_message]}
                     else:
                         for elem in replaces:
                             if elem['check']:
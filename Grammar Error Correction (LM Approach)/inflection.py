@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from functools import lru_cache
+import itertools
+import mmap
+import pymorphy2
+
+# ---------------- SETTINGS SECTION ----------------
+
+# Inflection lexicon built offline by build_inflection_lexicon.py (None - forms are inflected by pymorphy2)
+inflection_lexicon_path = None
+
+# Number of paradigms (inflected forms of one lemma) and of parsed words kept in memory
+paradigm_cache_size = 100000
+parse_cache_size = 200000
+
+# --------------------------------------------------
+
+cases = ['nomn', 'gent', 'datv', 'accs', 'ablt', 'loct']
+numbers = ['sing', 'plur']
+genders = ['masc', 'femn', 'neut']
+tenses = ['past', 'pres', 'futr']
+
+# Grammemes which are changed by get_inflected_words with the same result for any form of the paradigm
+inflected_grammemes = set(cases + numbers + genders)
+
+morph_analyzer = None
+lexicon = None
+
+# lemma key -> list of inflected forms, least recently used first
+paradigms = OrderedDict()
+
+
+def get_morph_analyzer():
+    # One analyzer for all requests: loading of the dictionaries takes much longer than parsing
+    global morph_analyzer
+    if morph_analyzer is None:
+        morph_analyzer = pymorphy2.MorphAnalyzer()
+    return morph_analyzer
+
+
+@lru_cache(maxsize=parse_cache_size)
+def parse_word(word):
+    # The most probable parse of the word
+    return get_morph_analyzer().parse(word)[0]
+
+
+def get_word(p, param):
+    if len(param) == 3:
+        word = p.inflect({param[0], param[1], param[2]})
+    else:
+        word = p.inflect({param[0], param[1]})
+    if word is not None:
+        return word.word
+    else:
+        return None
+
+
+def inflect_paradigm(p):
+    inflected_words = []
+    if 'VERB' in p.tag or 'INFN' in p.tag:
+        params = [itertools.product(numbers, tenses, genders), itertools.product(numbers, tenses),
+                  itertools.product(tenses, genders)]
+    else:
+        params = [itertools.product(numbers, cases, genders), itertools.product(numbers, cases),
+                  itertools.product(cases, genders)]
+    for param in itertools.chain(*params):
+        word = get_word(p, param)
+        if word is not None:
+            inflected_words.append(word)
+    return sorted(set(inflected_words))
+
+
+def get_lemma_key(p):
+    # Lemma and the grammemes of the parse except the inflected ones identify the paradigm:
+    # the normal form alone is not enough, as participles, gerunds and verbs share the infinitive
+    grammemes = sorted(set(p.tag.grammemes) - inflected_grammemes)
+    return p.normal_form + '\t' + ','.join(grammemes)
+
+
+class InflectionLexicon:
+    """
+    Table lemma -> inflected forms built offline (see build_inflection_lexicon.py).
+
+    The file consists of lines 'normal form<TAB>grammemes of the key (see get_lemma_key)<TAB>forms separated by spaces'
+    sorted by bytes; it is memory mapped and searched by bisection, so it is not loaded into memory
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_line(self, position):
+        # Start and end of the line which contains the position
+        start = self.data.rfind(b'\n', 0, position) + 1
+        end = self.data.find(b'\n', position)
+        if end == -1:
+            end = len(self.data)
+        return start, end
+
+    def get(self, key):
+        key = key.encode('utf-8') + b'\t'
+        low = 0
+        high = len(self.data)
+        while low < high:
+            start, end = self.get_line((low + high) // 2)
+            line = self.data[start:end]
+            line_key = line[:line.index(b'\t', line.index(b'\t') + 1) + 1]
+            if line_key == key:
+                return line[len(key):].decode('utf-8').split()
+            elif line_key < key:
+                low = end + 1
+            else:
+                high = start
+        return None
+
+
+def get_lexicon():
+    global lexicon
+    if lexicon is None and inflection_lexicon_path is not None:
+        lexicon = InflectionLexicon(inflection_lexicon_path)
+    return lexicon
+
+
+def get_inflected_words(keyword):
+    """
+    Returns forms of the keyword by numbers, cases (tenses for verbs) and genders.
+    Forms are taken from the lexicon or inflected once for every lemma
+    """
+    p = parse_word(keyword)
+    key = get_lemma_key(p)
+    if key in paradigms:
+        paradigms.move_to_end(key)
+        return list(paradigms[key])
+
+    inflected_words = None
+    if get_lexicon() is not None:
+        inflected_words = get_lexicon().get(key)
+    if inflected_words is None:
+        inflected_words = inflect_paradigm(p)
+    paradigms[key] = inflected_words
+    while len(paradigms) > paradigm_cache_size:
+        paradigms.popitem(last=False)
+    return list(inflected_words)
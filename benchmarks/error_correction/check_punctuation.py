@@ -0,0 +1,78 @@
+"""
+Share of texts for which punctuation restoration on windows falls back to per-sentence calls.
+
+The texts are processed by error_correction.punctuation_batch; the number of texts, fallbacks,
+sentences and calls of the Silero model (the per-sentence baseline makes one call per sentence) is reported.
+
+Usage:
+    python benchmarks/error_correction/check_punctuation.py --corpus news.jsonl [--lang ru]
+
+The corpus is a JSONL file of messages with fields 'text' and 'lang' or a text file with one text per line.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'Grammar Error Correction (LM Approach)'))
+
+import error_correction  # noqa: E402
+
+corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'text_analysis', 'corpus.jsonl')
+
+
+class CountedModel:
+    # Counts calls of the punctuation model
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def enhance_text(self, text, lang):
+        self.calls += 1
+        return self.model.enhance_text(text, lang)
+
+
+def read_texts(path, lang):
+    texts = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            if path.endswith('.jsonl'):
+                message = json.loads(line)
+                if message.get('lang') == lang:
+                    texts.append(message['text'])
+            else:
+                texts.append(line)
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=corpus_path, help='JSONL file of messages or text file')
+    parser.add_argument('--lang', default='ru')
+    args = parser.parse_args()
+
+    texts = read_texts(args.corpus, args.lang)
+    sentences = sum(len(sentences) for sentences in
+                    error_correction.get_sentences_without_punctuation_batch(texts, args.lang))
+
+    model = CountedModel(error_correction.silero_model)
+    error_correction.silero_model = model
+    error_correction.punctuation_stats.update({'texts': 0, 'fallbacks': 0})
+    start = time.perf_counter()
+    error_correction.punctuation_batch(texts, args.lang)
+    seconds = time.perf_counter() - start
+
+    stats = error_correction.punctuation_stats
+    print('texts: %d, fallbacks: %d (%.2f%%)' %
+          (stats['texts'], stats['fallbacks'], 100 * stats['fallbacks'] / max(stats['texts'], 1)))
+    print('sentences: %d, model calls: %d, time: %.2f s' % (sentences, model.calls, seconds))
+
+
+if __name__ == '__main__':
+    main()
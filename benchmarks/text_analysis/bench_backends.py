@@ -0,0 +1,256 @@
+"""
+Benchmark of the text_analysis stages for every backend and language on CPU.
+
+Every measurement runs in a separate process, so the cold start (import and loading
+of the models) and the peak RSS are measured for one stage, backend and language only.
+Inputs of the stages (results of the previous stages) are prepared once with the default
+backends and saved to the output directory.
+
+Results are written to JSON (one file per run), so they can be compared over time:
+docs/sec, tokens/sec (words of the input texts), cold start and peak RSS. If the stage failed
+on any message (see metrics.record_error), the entry is an error with the number of errors instead.
+
+Usage:
+    python benchmarks/text_analysis/bench_backends.py [--stages morphology,syntax] [--backends Stanza,Spacy]
+        [--langs ru,en] [--copies 10] [--repeat 3] [--output benchmarks/text_analysis/results]
+"""
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import regex as re
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, root)
+
+corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.jsonl')
+
+stages = ['segmentation', 'tokenization', 'morphology', 'syntax']
+
+# Backends of every stage; Natasha and Pymorphy are available for Russian only
+backends = {
+    'segmentation': ['Stanza', 'Trankit', 'Spacy', 'NLTK', 'Natasha'],
+    'tokenization': ['Stanza', 'Trankit', 'Spacy', 'NLTK', 'Natasha'],
+    'morphology': ['Stanza', 'StanzaQuantized', 'Trankit', 'Spacy', 'Natasha', 'Pymorphy'],
+    'syntax': ['Stanza', 'StanzaQuantized', 'Trankit', 'Spacy', 'Natasha'],
+}
+ru_only = ['Natasha', 'Pymorphy']
+
+packages = ['stanza', 'trankit', 'spacy', 'natasha', 'slovnet', 'nltk', 'pymorphy2', 'torch']
+
+
+def read_corpus(langs=None):
+    with open(corpus_path, encoding='utf-8') as f:
+        messages = [json.loads(line) for line in f if line.strip()]
+    if langs is not None:
+        messages = [message for message in messages if message['lang'] in langs]
+    return messages
+
+
+def count_words(messages):
+    return sum(len(re.findall(r'\w+', message.get('title', '') + ' ' + message.get('text', ''))) for message in messages)
+
+
+def get_stage(stage):
+    # Stage function and the dict of backends by language of its module
+    if stage == 'segmentation':
+        from text_analysis import segmentation
+        return segmentation.segmentation, segmentation.method
+    elif stage == 'tokenization':
+        from text_analysis import tokenization
+        return tokenization.tokenization, tokenization.model
+    elif stage == 'morphology':
+        from text_analysis import morphology
+        return morphology.morph_analysis, morphology.method
+    elif stage == 'syntax':
+        from text_analysis import syntax
+        return syntax.syntax_analysis, syntax.method
+
+
+def prepare(stage, lang, path):
+    # Results of the stages before the given one, computed with the default backends
+    messages = read_corpus([lang])
+    previous = stages[:stages.index(stage)]
+    if len(previous) > 0:
+        from text_analysis.pipeline import analyze
+        messages = analyze(messages, previous)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(messages, f, ensure_ascii=False)
+
+
+def clear_caches():
+    # Caches of the analyses shared by messages: results of the previous runs would inflate the throughput
+    from text_analysis import cache, morphology
+    morphology.parse_pymorphy.cache_clear()
+    morphology.ner_lemmas_cache.clear()
+    cache.configure(cache.enabled, cache.results.memory_size, cache.results.db_path)
+
+
+def count_errors():
+    # Errors of the messages caught by the stages (see metrics.record_error)
+    from text_analysis import metrics
+    return sum(value for (name, _), value in metrics.snapshot().items() if name == 'text_analysis_errors_total')
+
+
+def measure(stage, backend, lang, path, copies, repeat):
+    # Runs in a separate process and prints the result as JSON
+    with open(path, encoding='utf-8') as f:
+        messages = json.load(f)
+
+    start = time.perf_counter()
+    stage_function, method = get_stage(stage)
+    method[lang] = backend
+    # cold start: import of the modules, loading of the models and the first message
+    errors = count_errors()
+    stage_function(messages[:1])
+    cold_start = time.perf_counter() - start
+    cold_start_errors = count_errors() - errors
+
+    batch = messages * copies
+    times = []
+    repeat_errors = []
+    for _ in range(repeat):
+        # every repeat starts with the caches as cold as the first one
+        clear_caches()
+        errors = count_errors()
+        start = time.perf_counter()
+        output = stage_function(batch)
+        times.append(time.perf_counter() - start)
+        repeat_errors.append(count_errors() - errors)
+
+    result = {
+        'stage': stage,
+        'backend': backend,
+        'lang': lang,
+        'docs': len(batch),
+        'tokens': count_words(batch),
+        'output_docs': len(output),
+        'errors': cold_start_errors + sum(repeat_errors),
+    }
+    if result['errors'] > 0:
+        # the stages catch errors of the messages and go on, so failed messages would be counted as fast ones
+        result['error'] = 'analysis failed: %d errors in the cold start, %s in the repeats' % (
+            cold_start_errors, ', '.join(str(value) for value in repeat_errors))
+        return result
+
+    seconds = min(times)
+    result.update({
+        'seconds': seconds,
+        'docs_per_sec': len(batch) / seconds,
+        'tokens_per_sec': count_words(batch) / seconds,
+        'cold_start_sec': cold_start,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+    return result
+
+
+def run_child(args):
+    # CPU only: CUDA devices are hidden from the child
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES='')
+    process = subprocess.run([sys.executable, os.path.abspath(__file__)] + args, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        lines = process.stderr.strip().split('\n')
+        raise RuntimeError(lines[-1] if len(lines) > 0 else 'exit code %d' % process.returncode)
+    # the result is the last line, models may print to stdout while loading
+    return json.loads(process.stdout.strip().split('\n')[-1])
+
+
+def get_environment():
+    from importlib import metadata
+    versions = {}
+    for package in packages:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'packages': versions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stages', default=','.join(stages))
+    parser.add_argument('--backends', default=None, help='comma separated backends (default - all)')
+    parser.add_argument('--langs', default=None, help='comma separated languages (default - all of the corpus)')
+    parser.add_argument('--copies', type=int, default=10, help='the corpus of a language is repeated in a batch')
+    parser.add_argument('--repeat', type=int, default=3, help='the best of the repeats is reported')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'))
+    # internal: steps run in the child processes
+    parser.add_argument('--prepare', nargs=3, metavar=('STAGE', 'LANG', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--measure', nargs=4, metavar=('STAGE', 'BACKEND', 'LANG', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        prepare(*args.prepare)
+        print(json.dumps({'prepared': args.prepare[2]}))
+        return
+    if args.measure:
+        stage, backend, lang, path = args.measure
+        print(json.dumps(measure(stage, backend, lang, path, args.copies, args.repeat)))
+        return
+
+    langs = sorted(set(message['lang'] for message in read_corpus()))
+    if args.langs:
+        langs = [lang for lang in args.langs.split(',') if lang in langs]
+    inputs_path = os.path.join(args.output, 'inputs')
+    os.makedirs(inputs_path, exist_ok=True)
+
+    results = []
+    for stage in args.stages.split(','):
+        for lang in langs:
+            path = os.path.join(inputs_path, '%s-%s.json' % (stage, lang))
+            if not os.path.exists(path):
+                try:
+                    run_child(['--prepare', stage, lang, path])
+                except RuntimeError as e:
+                    print('%s %s: inputs are not prepared: %s' % (stage, lang, e))
+                    continue
+            for backend in backends[stage]:
+                if args.backends and backend not in args.backends.split(','):
+                    continue
+                if backend in ru_only and lang != 'ru':
+                    continue
+                result = {}
+                try:
+                    result = run_child(['--measure', stage, backend, lang, path,
+                                        '--copies', str(args.copies), '--repeat', str(args.repeat)])
+                    if 'error' in result:
+                        raise RuntimeError(result['error'])
+                    print('%-13s %-9s %-3s %9.1f docs/s %10.1f tokens/s  cold %6.1f s  rss %7.1f MB' %
+                          (stage, backend, lang, result['docs_per_sec'], result['tokens_per_sec'],
+                           result['cold_start_sec'], result['peak_rss_mb']))
+                except RuntimeError as e:
+                    # the child result (with the number of errors) is kept if the stage failed on messages
+                    result = dict(result, stage=stage, backend=backend, lang=lang, error=str(e))
+                    print('%-13s %-9s %-3s error: %s' % (stage, backend, lang, e))
+                results.append(result)
+
+    t = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    report = {'time': t, 'environment': get_environment(),
+              'settings': {'copies': args.copies, 'repeat': args.repeat}, 'results': results}
+    report_path = os.path.join(args.output, 'bench_backends_%s.json' % t)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print('Results are written to %s' % report_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Memory and copy cost of the 'grammar' field: lists [text, lemma, upos, feats, id, head]
+against text_analysis.grammar.Token.
+
+Usage:
+    python benchmarks/text_analysis/bench_grammar.py [--sentences 2000]
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from text_analysis.grammar import pack_messages, unpack_messages  # noqa: E402
+
+upos_values = ['NOUN', 'VERB', 'ADJ', 'ADP', 'PUNCT', 'PROPN', 'ADV', 'PRON', 'NUM', 'CCONJ']
+feats_values = ['', '', 'tense=past', 'tense=pres', 'number=sing|animacy=inan', 'number=plur|animacy=anim']
+
+
+def make_messages(sentences, seed=0):
+    # Upos and feats are built at runtime, as in the output of the models, so they are not shared by default
+    rnd = random.Random(seed)
+    messages = []
+    for i in range(sentences // 10):
+        message = {'id': str(i), 'lang': 'ru', 'sentences': []}
+        for _ in range(10):
+            grammar = []
+            for j in range(20):
+                word = 'слово%d' % rnd.randint(0, 5000)
+                grammar.append([word, word.lower(), ''.join(rnd.choice(upos_values)),
+                                ''.join(rnd.choice(feats_values)), j + 1, rnd.randint(0, 20)])
+            message['sentences'].append({'text': ' '.join(item[0] for item in grammar), 'grammar': grammar})
+        messages.append(message)
+    return messages
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return messages, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentences', type=int, default=2000)
+    args = parser.parse_args()
+
+    tokens = args.sentences * 20
+    messages_list, size_list = measure_memory(lambda: make_messages(args.sentences))
+    messages_packed, size_packed = measure_memory(lambda: pack_messages(make_messages(args.sentences)))
+    assert unpack_messages(copy.deepcopy(messages_packed)) == messages_list
+
+    time_list = min(timeit.repeat(lambda: copy.deepcopy(messages_list), number=1, repeat=3))
+    time_packed = min(timeit.repeat(lambda: copy.deepcopy(messages_packed), number=1, repeat=3))
+
+    print('%10s %16s %16s' % ('', 'bytes per token', 'deepcopy, ms'))
+    print('%10s %16.1f %16.1f' % ('list', size_list / tokens, time_list * 1000))
+    print('%10s %16.1f %16.1f' % ('Token', size_packed / tokens, time_packed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Micro-benchmark of join_tokens(): the previous implementation (patterns
+compiled on every call, windows of tokens scanned for every found complex)
+against the current one (one precompiled pattern, spans mapped to tokens
+by character offsets).
+
+Usage:
+    python benchmarks/text_analysis/bench_join_tokens.py [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import regex as re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from text_analysis.tokenization import join_tokens  # noqa: E402
+
+# Fixed corpus: every sentence contains letter digit complexes
+corpus = [
+    'Самолет Ту-204-300 и истребитель Миг-29 прибыли на авиасалон.',
+    'Экс-премьер-министр встретился с премьер-министром в 2019-2020 годах.',
+    'Инфляция составила 5,8%, а курс вырос до $20 за единицу.',
+    'Об этом сообщает Газета.ру со ссылкой на www.twitter.com.',
+    'Доклад сделал д.т.н. Е.Н.О.Т. Иванов, его коллега А. Петров и A.B. Smith.',
+    'Штамм 2019-nCoV распространился в 25 странах, заявил О\'Нил.',
+    'Бюджет составил 12 млн. руб. и 300 тыс. руб. по ст. 15 закона.',
+    'The Boeing-737 and the F-16 were shown at the show in 2019-2020.',
+]
+
+
+def tokenize(text):
+    return re.findall(r'\w+|[^\w\s]', text)
+
+
+def shift_numbers(text, shift):
+    return re.sub(r'[0-9]+', lambda match: str(int(match.group()) + shift), text)
+
+
+def make_grammar(text):
+    return [[token, '', '', '', -1, -1] for token in tokenize(text)]
+
+
+def join_tokens_legacy(text, grammar, lang=None):
+    letter_digit_complex_patterns = [r'\pL+-\pL*[0-9]+\pL*-\pL*[0-9]+\pL*', r'\pL+-\pL*[0-9]+\pL*',
+                                     r'\pL+-\pL+-\pL+', r'\pL+-\pL+', r'[0-9]+-\pL+', r'[0-9]+-[0-9]+',
+                                     r'[0-9]+,?[0-9]*%', r'\$[0-9]+,?[0-9]*', r'\p{Lu}\'\pL+',
+                                     r'\pL+\.\pL+', r'\pL+\.\pL+\.\pL+',
+                                     r'\pL\.\pL\.\pL\.\pL\.', r'\pL\.\pL\.\pL\.', r'\pL\.\pL\.', r'\p{Lu}\.']
+
+    if lang == 'ru':
+        letter_digit_complex_patterns.extend([r'млн\.', r'тыс\.', r'руб\.', r'ст\.'])
+
+    finds = []
+    for pattern in letter_digit_complex_patterns:
+        finds.extend(re.findall(pattern, text))
+    finds = sorted(list(set(finds)), key=len, reverse=True)
+
+    tokens = [item[0] for item in grammar]
+    for elem in finds:
+        if elem not in tokens:
+            if '-' in elem:
+                complex_len = elem.count('-') * 2 + 1
+                for i in range(len(tokens) - complex_len + 1):
+                    tokens_joined = ''.join(tokens[i:i + complex_len])
+                    if tokens_joined == elem:
+                        tokens[i] = tokens_joined
+                        grammar[i][0] = tokens_joined
+                        del grammar[i + 1: i + complex_len]
+                        del tokens[i + 1: i + complex_len]
+            if '%' in elem or '$' in elem:
+                complex_len = 2
+                for i in range(len(tokens) - complex_len + 1):
+                    tokens_joined = ''.join(tokens[i:i + complex_len])
+                    if tokens_joined == elem:
+                        tokens[i] = tokens_joined
+                        grammar[i][0] = tokens_joined
+                        del grammar[i + 1: i + complex_len]
+                        del tokens[i + 1: i + complex_len]
+            elif '.' in elem:
+                complex_len = elem.count('.') * 2
+                stop = False
+                for complex_len_temp in range(complex_len, 1, -1):
+                    for i in range(len(tokens) - complex_len_temp + 1):
+                        tokens_joined = ''.join(tokens[i:i + complex_len_temp])
+                        if tokens_joined == elem:
+                            stop = True
+                            tokens[i] = tokens_joined
+                            grammar[i][0] = tokens_joined
+                            del grammar[i + 1: i + complex_len_temp]
+                            del tokens[i + 1: i + complex_len_temp]
+                    if stop:
+                        break
+
+    return grammar
+
+
+def check_outputs(texts, lang):
+    mismatches = 0
+    for text in texts:
+        expected = [item[0] for item in join_tokens_legacy(text, make_grammar(text), lang)]
+        actual = [item[0] for item in join_tokens(text, make_grammar(text), lang)]
+        if expected != actual:
+            mismatches += 1
+            print('Mismatch:\n\t%s\n\t%s\n\t%s' % (text, expected, actual))
+    return mismatches
+
+
+def bench(function, text, grammar, lang, repeat):
+    # grammar is copied in every run, because join_tokens changes it
+    timer = timeit.Timer(lambda: function(text, [list(item) for item in grammar], lang))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    texts = corpus + [' '.join(corpus)]
+    mismatches = check_outputs(texts, 'ru') + check_outputs(texts, None)
+    print('Outputs compared on %d texts, mismatches: %d\n' % (len(texts) * 2, mismatches))
+
+    print('%10s %10s %14s %14s %8s' % ('sentences', 'tokens', 'legacy, ms', 'current, ms', 'speedup'))
+    # Long "sentences" are made by concatenating the corpus several times,
+    # numbers are changed in every copy, so that the complexes are different
+    for copies in [1, 4, 16, 64]:
+        text = ' '.join(shift_numbers(sentence, copy) for copy in range(copies) for sentence in corpus)
+        grammar = make_grammar(text)
+        legacy = bench(join_tokens_legacy, text, grammar, 'ru', args.repeat)
+        current = bench(join_tokens, text, grammar, 'ru', args.repeat)
+        print('%10d %10d %14.3f %14.3f %7.1fx' % (len(corpus) * copies, len(grammar),
+                                                 legacy * 1000, current * 1000, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
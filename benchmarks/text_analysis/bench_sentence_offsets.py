@@ -0,0 +1,122 @@
+"""
+Benchmark of the sentence offsets in segmentation.postprocess() on long documents:
+the previous start_position() search (the shortest unique prefix of the sentence is
+grown one character at a time, the rest of the text is split for every prefix)
+against positions given by the model with a forward search as the fallback.
+
+Usage:
+    python benchmarks/text_analysis/bench_sentence_offsets.py [--sizes 10,50,100,200] [--legacy-limit 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from text_analysis import segmentation  # noqa: E402
+
+# Fixed corpus of sentences, news often repeat the same sentences and their beginnings
+corpus = [
+    'Президент провел совещание с членами правительства.',
+    'Президент провел встречу с губернатором области.',
+    'Об этом сообщает пресс-служба Кремля.',
+    'По данным ведомства, инфляция составила 5,8%.',
+    'The company reported record profits for the third quarter.',
+    'The company reported a loss for the second quarter.',
+    'Экс-премьер-министр встретился с делегацией из Ту-204.',
+    'Об этом сообщает агентство "Интерфакс".',
+]
+
+
+def make_document(size_kb, seed=0):
+    # Sentences of the corpus with random numbers, separated by spaces and new lines
+    rnd = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size_kb * 1024:
+        sentence = rnd.choice(corpus)
+        if rnd.random() < 0.5:
+            sentence = sentence[:-1] + ' %d.' % rnd.randint(0, 100)
+        parts.append(sentence)
+        parts.append(rnd.choice([' ', ' ', '\n', '\n\n']))
+        length += len(sentence) + 1
+    return ''.join(parts)
+
+
+def split_document(text, with_starts):
+    # Output of the model: sentences separated by the blank symbols, with or without positions
+    sentences = []
+    start = 0
+    for end in range(len(text)):
+        if text[end] == '.' and (end + 1 == len(text) or text[end + 1] in ' \n'):
+            sentences.append((text[start:end + 1], start if with_starts else None))
+            start = end + 1
+    return sentences
+
+
+def start_position_legacy(sentence, text):
+    symbols = 1
+    try:
+        while len(text.split(sentence[:symbols])) > 2 and symbols < len(sentence):
+            symbols += 1
+    except:
+        while len(text.split()) > 2 and symbols < len(sentence):
+            symbols += 1
+    return text.find(sentence[:symbols])
+
+
+def positions_legacy(text, text_splitted):
+    sentences = []
+    for sentence, _ in text_splitted:
+        if sentence.strip() != '':
+            sentences.append(sentence.strip())
+
+    sentences_temp = []
+    for sentence in sentences:
+        sentences_temp.extend(sentence.split('\n'))
+    sentences = sentences_temp
+
+    positions = []
+    pos = 0
+    for sentence in sentences:
+        pos += start_position_legacy(sentence, text[pos:])
+        positions.append(pos)
+        pos += len(sentence)
+    return positions
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10,50,100,200', help='sizes of the documents in KB')
+    parser.add_argument('--legacy-limit', type=int, default=200, help='maximum size (KB) for the previous version')
+    args = parser.parse_args()
+
+    print('%8s %10s %12s %14s %14s %8s' % ('KB', 'sentences', 'legacy, s', 'spans, s', 'search, s', 'equal'))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        text = make_document(size)
+        with_starts = split_document(text, True)
+        without_starts = split_document(text, False)
+        # min_sent_len = 0 keeps all sentences, so positions of all of them are compared
+        (_, spans), time_spans = measure(segmentation.postprocess, text, 'en', with_starts, 0)
+        (_, search), time_search = measure(segmentation.postprocess, text, 'en', without_starts, 0)
+        if size <= args.legacy_limit:
+            legacy, time_legacy = measure(positions_legacy, text, with_starts)
+            # Sentences are not merged by the postprocessing of the corpus, so positions are comparable
+            equal = str(legacy == spans == search)
+            time_legacy = '%12.3f' % time_legacy
+        else:
+            equal = str(spans == search)
+            time_legacy = '%12s' % '-'
+        print('%8d %10d %s %14.4f %14.4f %8s' % (size, len(with_starts), time_legacy, time_spans, time_search, equal))
+
+
+if __name__ == '__main__':
+    main()
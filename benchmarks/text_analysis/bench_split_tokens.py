@@ -0,0 +1,143 @@
+"""
+Equivalence check and micro-benchmark of splitting of the symbols from the tokens:
+the previous implementation (append_token() with a chain of conditions and re.split()
+for every token) against the current one (split_tokens() with one precompiled pattern).
+
+Outputs are compared on the tokens of a fixed corpus and on random tokens made of
+the split symbols, letters and spaces; any difference is printed.
+
+Usage:
+    python benchmarks/text_analysis/bench_split_tokens.py [--random 200000] [--seed 0] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+import regex as re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from text_analysis.tokenization import split_tokens  # noqa: E402
+
+corpus = [
+    'Об этом сообщает "Интерфакс", ссылаясь на источник (в правительстве).',
+    'Курс [по данным ЦБ] вырос до 90 руб. — это рекорд… Почему? Никто не знает!',
+    'Экс-премьер-министр заявил: «Мы готовы» {цитата} – и ушел.',
+    'The company (NASDAQ: AAPL) said "sales were strong" -- and shares rose.',
+    'Was it -really- the end? Yes: the end... of the [first] part!',
+]
+
+symbols = ['"', '-', '–', '—', '.', ':', '…', '?', '!', '(', ')', '[', ']', '{', '}']
+alphabet = symbols + ['a', 'б', '1', ' ', '\n', ',']
+
+
+def append_token_legacy(token, tokens_list):
+    def replace_symbol(token, symbol, tokens_list):
+        token_splitted = re.split(re.escape(symbol), token)
+        if len(token_splitted) > 1 and len(token) > 1:
+            token_splitted = token.replace(symbol, ' ' + symbol + ' ').strip().split()
+            for item in token_splitted:
+                if len(item) > 0:
+                    tokens_list.append([item, '', '', '', -1, -1])
+        else:
+            tokens_list.append([token, '', '', '', -1, -1])
+        return tokens_list
+
+    if '\"' in token:
+        tokens_list = replace_symbol(token, '\"', tokens_list)
+    elif token.startswith(chr(0x2D)) or token.endswith(chr(0x2D)):
+        tokens_list = replace_symbol(token, chr(0x2D), tokens_list)
+    elif token.startswith(chr(0x2013)) or token.endswith(chr(0x2013)):
+        tokens_list = replace_symbol(token, chr(0x2013), tokens_list)
+    elif token.startswith(chr(0x2014)) or token.endswith(chr(0x2014)):
+        tokens_list = replace_symbol(token, chr(0x2014), tokens_list)
+    elif token.endswith('.'):
+        tokens_list = replace_symbol(token, '.', tokens_list)
+    elif token.endswith(':'):
+        tokens_list = replace_symbol(token, ':', tokens_list)
+    elif token.endswith('…'):
+        tokens_list = replace_symbol(token, '…', tokens_list)
+    elif token.endswith('?'):
+        tokens_list = replace_symbol(token, '?', tokens_list)
+    elif token.endswith('!'):
+        tokens_list = replace_symbol(token, '!', tokens_list)
+    elif token.startswith('('):
+        tokens_list = replace_symbol(token, '(', tokens_list)
+        if token.endswith(')'):
+            tokens_list = replace_symbol(tokens_list[-1][0], ')', tokens_list[:-1])
+    elif token.endswith(')'):
+        tokens_list = replace_symbol(token, ')', tokens_list)
+    elif token.startswith('['):
+        tokens_list = replace_symbol(token, '[', tokens_list)
+        if token.endswith(']'):
+            tokens_list = replace_symbol(tokens_list[-1][0], ']', tokens_list[:-1])
+    elif token.endswith(']'):
+        tokens_list = replace_symbol(token, ']', tokens_list)
+    elif token.startswith('{'):
+        tokens_list = replace_symbol(token, '{', tokens_list)
+        if token.endswith('}'):
+            tokens_list = replace_symbol(tokens_list[-1][0], '}', tokens_list[:-1])
+    elif token.endswith('}'):
+        tokens_list = replace_symbol(token, '}', tokens_list)
+    else:
+        tokens_list.append([token, '', '', '', -1, -1])
+    return tokens_list
+
+
+def split_tokens_legacy(tokens):
+    tokens_list = []
+    for token in tokens:
+        tokens_list = append_token_legacy(token, tokens_list)
+    return tokens_list
+
+
+def random_tokens(count, seed):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 6))) for _ in range(count)]
+
+
+def check_outputs(tokens):
+    mismatches = 0
+    for token in tokens:
+        expected = split_tokens_legacy([token])
+        actual = split_tokens([token])
+        if expected != actual:
+            mismatches += 1
+            print('Mismatch: %r\n\t%s\n\t%s' % (token, expected, actual))
+    # the whole sequence at once: tokens of the previous calls must not be changed
+    if split_tokens_legacy(tokens) != split_tokens(tokens):
+        mismatches += 1
+        print('Mismatch on the whole sequence')
+    return mismatches
+
+
+def bench(function, tokens, repeat):
+    timer = timeit.Timer(lambda: function(tokens))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--random', type=int, default=200000, help='number of random tokens')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus_tokens = [token for text in corpus for token in text.split()]
+    tokens = corpus_tokens + random_tokens(args.random, args.seed)
+    mismatches = check_outputs(tokens)
+    print('Outputs compared on %d tokens, mismatches: %d\n' % (len(tokens), mismatches))
+
+    print('%10s %14s %14s %8s' % ('tokens', 'legacy, ms', 'current, ms', 'speedup'))
+    for copies in [1, 16, 256]:
+        tokens = corpus_tokens * copies
+        legacy = bench(split_tokens_legacy, tokens, args.repeat)
+        current = bench(split_tokens, tokens, args.repeat)
+        print('%10d %14.3f %14.3f %7.1fx' % (len(tokens), legacy * 1000, current * 1000, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Time of the Trankit morphological analysis in two modes (see morphology.trankit_joint_call):
+one call of the full pipeline (which also runs NER for the languages with a Trankit NER model)
+and separate posdep and lemmatize calls. Agreement of lemmas and UPOS of the modes is reported too.
+
+Usage:
+    python benchmarks/text_analysis/bench_trankit_modes.py [--langs en,ru] [--corpus corpus.jsonl] [--repeat 3]
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from text_analysis import morphology  # noqa: E402
+from text_analysis.pipeline import analyze  # noqa: E402
+
+corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.jsonl')
+
+
+def run(messages, joint_call, repeat):
+    morphology.trankit_joint_call = joint_call
+    times = []
+    for _ in range(repeat):
+        messages_copy = copy.deepcopy(messages)
+        start = time.perf_counter()
+        messages_copy = analyze(messages_copy, ['morphology'])
+        times.append(time.perf_counter() - start)
+    grammars = [sentence['grammar'] for message in messages_copy for sentence in message['sentences']]
+    return grammars, min(times)
+
+
+def agreement(grammars, grammars_reference):
+    # Share of tokens with the same lemma and UPOS (grammar fields 1 and 2)
+    total = 0
+    same = [0, 0]
+    for grammar, grammar_reference in zip(grammars, grammars_reference):
+        for token, token_reference in zip(grammar, grammar_reference):
+            total += 1
+            for k, field in enumerate([1, 2]):
+                same[k] += token[field] == token_reference[field]
+    return [value / total if total > 0 else 0.0 for value in same], total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--langs', default='en,ru,es,fr,de,uk,tr,ar')
+    parser.add_argument('--corpus', default=corpus_path, help='JSONL file of messages')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    print('%-4s %8s %8s %8s %12s %12s %8s' % ('lang', 'tokens', 'lemma', 'upos', 'separate, s', 'joint, s', 'speedup'))
+    for lang in args.langs.split(','):
+        messages = [message for message in corpus if message['lang'] == lang]
+        if len(messages) == 0:
+            continue
+        morphology.method[lang] = 'Trankit'
+        messages = analyze(messages, ['segmentation', 'tokenization'])
+        # the first run loads the models and is not measured
+        run(messages[:1], False, 1)
+        run(messages[:1], True, 1)
+        grammars, seconds = run(messages, False, args.repeat)
+        grammars_joint, seconds_joint = run(messages, True, args.repeat)
+        (lemma, upos), total = agreement(grammars_joint, grammars)
+        print('%-4s %8d %8.4f %8.4f %12.3f %12.3f %7.2fx' %
+              (lang, total, lemma, upos, seconds, seconds_joint, seconds / seconds_joint))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Accuracy parity of the 'StanzaQuantized' backend (int8 dynamic quantization on CPU) with 'Stanza'.
+
+Sentences of the held-out set are analyzed by morphology and syntax with both backends;
+agreement of lemmas, UPOS and heads with the Stanza output and the time of both backends
+are reported by language. With --conllu the held-out set is a CoNLL-U file (e.g. the test part
+of a UD treebank), and accuracy of both backends against the gold annotation is reported too.
+
+Usage:
+    python benchmarks/text_analysis/check_stanza_quantized.py [--langs en,ru] [--corpus corpus.jsonl]
+    python benchmarks/text_analysis/check_stanza_quantized.py --conllu ru_syntagrus-ud-test.conllu --langs ru
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from text_analysis import morphology, syntax  # noqa: E402
+from text_analysis.pipeline import analyze  # noqa: E402
+
+corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.jsonl')
+
+
+def read_corpus(path, langs):
+    # Messages of the corpus are segmented and tokenized once, the same tokens go to both backends
+    with open(path, encoding='utf-8') as f:
+        messages = [json.loads(line) for line in f if line.strip()]
+    messages = [message for message in messages if message['lang'] in langs]
+    return analyze(messages, ['segmentation', 'tokenization']), None
+
+
+def read_conllu(path, lang):
+    # Every sentence of the file is a message with one tokenized sentence; multiword tokens are skipped
+    messages = []
+    gold = []
+    words = []
+    with open(path, encoding='utf-8') as f:
+        for line in list(f) + ['']:
+            line = line.strip()
+            if len(line) == 0:
+                if len(words) > 0:
+                    grammar = [[word[1], '', '', '', -1, -1] for word in words]
+                    messages.append({'lang': lang, 'sentences': [{'text': ' '.join(word[1] for word in words),
+                                                                  'grammar': grammar}]})
+                    gold.append([[word[1], word[2].lower(), word[3], '', int(word[0]), int(word[6])] for word in words])
+                words = []
+            elif not line.startswith('#'):
+                word = line.split('\t')
+                if word[0].isdigit():
+                    words.append(word)
+    return messages, gold
+
+
+def run(messages, backend, lang):
+    morphology.method[lang] = backend
+    syntax.method[lang] = backend
+    messages = copy.deepcopy(messages)
+    start = time.perf_counter()
+    messages = analyze(messages, ['morphology', 'syntax'])
+    seconds = time.perf_counter() - start
+    return [sentence['grammar'] for message in messages for sentence in message['sentences']], seconds
+
+
+def agreement(grammars, grammars_reference):
+    # Share of tokens with the same lemma, UPOS and head (grammar fields 1, 2 and 5)
+    total = 0
+    same = [0, 0, 0]
+    for grammar, grammar_reference in zip(grammars, grammars_reference):
+        for token, token_reference in zip(grammar, grammar_reference):
+            total += 1
+            for k, field in enumerate([1, 2, 5]):
+                same[k] += token[field] == token_reference[field]
+    return [value / total if total > 0 else 0.0 for value in same], total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--langs', default=None, help='comma separated languages (default: en,ru,es,fr,de,uk,tr,ar)')
+    parser.add_argument('--corpus', default=corpus_path, help='JSONL file of messages (held-out set)')
+    parser.add_argument('--conllu', default=None, help='CoNLL-U file with gold annotation (one language)')
+    args = parser.parse_args()
+
+    langs = args.langs.split(',') if args.langs else ['en', 'ru', 'es', 'fr', 'de', 'uk', 'tr', 'ar']
+    if args.conllu and (args.langs is None or len(langs) != 1):
+        parser.error('--conllu requires --langs with exactly one language of the file')
+    print('%-4s %8s %8s %8s %8s %10s %10s %8s' %
+          ('lang', 'tokens', 'lemma', 'upos', 'head', 'stanza, s', 'int8, s', 'speedup'))
+    for lang in langs:
+        if args.conllu:
+            messages, gold = read_conllu(args.conllu, lang)
+        else:
+            messages, gold = read_corpus(args.corpus, [lang])
+        if len(messages) == 0:
+            continue
+        # the first run of every backend loads its models and is not measured
+        run(messages[:1], 'Stanza', lang)
+        run(messages[:1], 'StanzaQuantized', lang)
+        grammars, seconds = run(messages, 'Stanza', lang)
+        grammars_quantized, seconds_quantized = run(messages, 'StanzaQuantized', lang)
+
+        (lemma, upos, head), total = agreement(grammars_quantized, grammars)
+        print('%-4s %8d %8.4f %8.4f %8.4f %10.3f %10.3f %7.2fx' %
+              (lang, total, lemma, upos, head, seconds, seconds_quantized, seconds / seconds_quantized))
+        if gold is not None:
+            for backend, grammars_backend in [('Stanza', grammars), ('StanzaQuantized', grammars_quantized)]:
+                (lemma, upos, head), _ = agreement(grammars_backend, gold)
+                print('     gold accuracy of %-15s lemma %.4f  upos %.4f  UAS %.4f' % (backend, lemma, upos, head))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Streaming analysis of the JSONL file of messages.
+
+Usage:
+    python -m text_analysis input.jsonl[.gz] output.jsonl[.gz] [--stages langid,segmentation,tokenization,morphology,syntax]
+        [--chunk-size 256] [--min-sent-len 3] [--workers 0] [--resume] [--cache-db cache.sqlite]
+        [--metrics metrics.prom]
+
+'-' reads messages from stdin / writes results to stdout.
+"""
+import argparse
+
+from . import stream
+from . import cache
+from . import metrics
+from .pipeline import all_stages
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m text_analysis')
+    parser.add_argument('input', help='JSONL file of messages (gzipped if ends with .gz), - for stdin')
+    parser.add_argument('output', help='JSONL file of results (gzipped if ends with .gz), - for stdout')
+    parser.add_argument('--stages', default=','.join(all_stages), help='comma separated stages of the analysis')
+    parser.add_argument('--chunk-size', type=int, default=stream.chunk_size, help='messages analyzed at once')
+    parser.add_argument('--min-sent-len', type=int, default=3, help='minimum number of words in a sentence')
+    parser.add_argument('--workers', type=int, default=0, help='number of worker processes (0 - no workers)')
+    parser.add_argument('--resume', action='store_true', help='continue from the offsets saved in <output>.offset')
+    parser.add_argument('--cache-db', help='SQLite file of the cache of analyzed sentences (enables the cache)')
+    parser.add_argument('--metrics', help='file for timers and counters of the stages in the Prometheus text format')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if len(stage.strip()) > 0]
+    for stage in stages:
+        if stage not in all_stages:
+            parser.error('unknown stage: %s' % stage)
+    if args.resume and (args.input == '-' or args.output == '-'):
+        parser.error('--resume requires input and output files')
+
+    if args.cache_db:
+        cache.configure(True, db_path=args.cache_db)
+
+    executor = None
+    if args.workers > 0:
+        from .executor import ShardedExecutor
+        executor = ShardedExecutor(stages, args.min_sent_len, workers=args.workers)
+    try:
+        with metrics.Profile() as profile:
+            stream.process_file(args.input, args.output, stages, args.min_sent_len, args.chunk_size, executor,
+                                args.resume)
+    finally:
+        if executor is not None:
+            executor.close()
+
+    if args.metrics:
+        with open(args.metrics, 'w') as f:
+            f.write(profile.prometheus())
+
+
+if __name__ == '__main__':
+    main()
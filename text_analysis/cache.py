@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from importlib import metadata
+import threading
+import hashlib
+import sqlite3
+import json
+import os
+
+# ---------------- SETTINGS SECTION ----------------
+
+# The cache is used only if it is enabled
+enabled = False
+
+# Maximum number of results in memory
+memory_size = 100000
+
+# Path to the SQLite file shared by processes (None - results are kept only in memory)
+db_path = None
+
+# Packages whose versions are part of the key, so results of an updated model are not reused
+backend_packages = {
+    'Stanza': ['stanza'],
+    'StanzaQuantized': ['stanza', 'torch'],
+    'Trankit': ['trankit'],
+    'Spacy': ['spacy'],
+    'Natasha': ['natasha', 'slovnet'],
+    'Pymorphy': ['pymorphy2', 'pymorphy2-dicts-ru'],
+    'NLTK': ['nltk']
+}
+
+# Directory of the Stanza resources: resources.json describes the downloaded models
+stanza_resources_dir = os.environ.get('STANZA_RESOURCES_DIR', os.path.join(os.path.expanduser('~'), 'stanza_resources'))
+
+# --------------------------------------------------
+
+versions = {}
+model_versions = {}
+
+
+def get_version(backend):
+    # Versions of the packages of the backend, e.g. 'stanza=1.5.0'
+    if backend not in versions:
+        parts = []
+        for package in backend_packages.get(backend, []):
+            try:
+                parts.append('%s=%s' % (package, metadata.version(package)))
+            except metadata.PackageNotFoundError:
+                parts.append('%s=' % package)
+        versions[backend] = ','.join(parts)
+    return versions[backend]
+
+
+def get_model_version(backend, model):
+    # Version of the model files: spaCy models are packages with their own versions,
+    # Stanza models are identified by the hash of resources.json they were downloaded with
+    if (backend, model) not in model_versions:
+        version = ''
+        if backend == 'Spacy' and model:
+            try:
+                version = metadata.version(model)
+            except metadata.PackageNotFoundError:
+                pass
+        elif backend in ('Stanza', 'StanzaQuantized'):
+            try:
+                with open(os.path.join(stanza_resources_dir, 'resources.json'), 'rb') as f:
+                    version = hashlib.sha1(f.read()).hexdigest()
+            except OSError:
+                pass
+        model_versions[(backend, model)] = version
+    return model_versions[(backend, model)]
+
+
+class ResultCache:
+    """
+    Cache of the analysis results of sentences: in-memory LRU over an optional SQLite file.
+
+    Values are 'grammar' lists, stored as JSON, so every read returns a new copy.
+    """
+
+    def __init__(self, memory_size=memory_size, db_path=db_path):
+        self.memory_size = memory_size
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _get_connection(self):
+        # Connection can not be shared with forked processes, so every process opens its own
+        if self.db_path is None:
+            return None
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT)')
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+            else:
+                connection = self._get_connection()
+                if connection is not None:
+                    row = connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                    if row is not None:
+                        value = row[0]
+                        self._remember(key, value)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, key, grammar):
+        value = json.dumps([list(item) for item in grammar], ensure_ascii=False)
+        with self._lock:
+            self._remember(key, value)
+            connection = self._get_connection()
+            if connection is not None:
+                connection.execute('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)', (key, value))
+                connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+            connection = self._get_connection()
+            if connection is not None:
+                connection.execute('DELETE FROM results')
+                connection.commit()
+
+
+results = ResultCache(memory_size, db_path)
+
+
+def configure(enable=True, memory_size=memory_size, db_path=None):
+    """
+    Enables (or disables) the cache of the analysis results
+    """
+    global enabled, results
+    enabled = enable
+    results = ResultCache(memory_size, db_path)
+
+
+def make_key(stage, lang, backend, text, grammar=None, model=''):
+    """
+    Key of the result of the stage for the sentence: hash of the language, backend, versions of its packages,
+    model (see registry.get_model_id) and the version of its files, text and input grammar.
+    Returns None if the cache is disabled
+    """
+    if not enabled:
+        return None
+    if grammar is not None:
+        grammar = [list(item) for item in grammar]
+    data = json.dumps([stage, lang, backend, get_version(backend), model, get_model_version(backend, model),
+                       text, grammar], ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    """
+    Returns cached grammar by the key from make_key() (None if there is no result)
+    """
+    if key is None:
+        return None
+    return results.get(key)
+
+
+def put(key, grammar):
+    if key is not None:
+        results.put(key, grammar)
+
+
+def stats():
+    return {'hits': results.hits, 'misses': results.misses, 'memory_size': len(results._memory)}
@@ -0,0 +1,305 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import importlib
+import copy
+import multiprocessing
+import traceback
+import os
+
+from . import cache
+from . import metrics
+
+# ---------------- SETTINGS SECTION ----------------
+
+# Number of worker processes (None - number of CPU cores)
+workers = None
+
+# Maximum number of messages and characters in one shard
+shard_size = 64
+shard_chars = 200000
+
+# Number of threads of torch in every worker, so that workers do not compete for the cores
+threads_per_worker = 1
+
+# 'spawn' is safe with torch and models loaded in the main process
+start_method = 'spawn'
+
+# Key under which the original index of the message is passed to the worker
+index_key = '__index__'
+
+# Settings of the modules which are passed to the workers: spawned workers import the modules again,
+# so changes made at runtime in the main process (e.g. morphology.method) would be lost
+worker_settings = {
+    'segmentation': ['method', 'default_batch_size'],
+    'tokenization': ['model'],
+    'morphology': ['method', 'stanza_morph', 'trankit_joint_call', 'spacy_disable'],
+    'syntax': ['method', 'stanza_syntax', 'model_path', 'spacy_disable', 'natasha_batch_size', 'batch_methods'],
+    'pipeline': ['fused_methods', 'spacy_disable'],
+    'registry': ['stanza_packages', 'trankit_languages', 'spacy_models', 'spacy_batch_size', 'spacy_n_process',
+                 'stanza_quantized_processors', 'stanza_quantized_layers'],
+    'metrics': ['enabled'],
+}
+
+# --------------------------------------------------
+
+
+def get_settings():
+    # Values of worker_settings and of the registry budgets in the main process
+    settings = {}
+    for module_name, names in worker_settings.items():
+        module = importlib.import_module('.' + module_name, __package__)
+        settings[module_name] = {name: copy.deepcopy(getattr(module, name)) for name in names}
+    registry = importlib.import_module('.registry', __package__).registry
+    return settings, (registry.memory_budget_mb, registry.max_idle_seconds)
+
+
+def apply_settings(settings, registry_settings):
+    # Dicts and lists are updated in place, as other modules and decorators keep references to them
+    for module_name, values in settings.items():
+        module = importlib.import_module('.' + module_name, __package__)
+        for name, value in values.items():
+            current = getattr(module, name, None)
+            if isinstance(current, dict) and isinstance(value, dict):
+                current.clear()
+                current.update(value)
+            elif isinstance(current, list) and isinstance(value, list):
+                current[:] = value
+            else:
+                setattr(module, name, value)
+    importlib.import_module('.registry', __package__).configure(*registry_settings)
+
+
+def init_worker(threads, warm_langs, stages, cache_settings, settings):
+    # Runs once in every worker: limits the threads, configures the result cache and the modules
+    # as in the main process and loads the models in advance
+    cache.configure(*cache_settings)
+    apply_settings(*settings)
+    # errors of the stages are recorded in the messages and reported by run_shard
+    metrics.record_errors = True
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    if warm_langs:
+        from .pipeline import analyze
+        for lang in warm_langs:
+            analyze([{'lang': lang, 'text': 'Warm up.', 'title': 'Warm up'}], stages, min_sent_len=1)
+
+
+def run_shard(shard, stages, min_sent_len):
+    """
+    Analysis of one shard in the worker
+
+    Returns (results, errors, metrics): results - list of (index, message), errors - list of (index, error),
+    metrics - values collected by the worker since its previous shard (see collect_metrics).
+    If the shard fails, its messages are analyzed one by one, so one message can not break the others.
+    Messages with errors recorded by the stages are returned as errors
+    """
+    results, errors = analyze_shard(shard, stages, min_sent_len)
+    return results, errors, collect_metrics()
+
+
+def analyze_shard(shard, stages, min_sent_len):
+    from .pipeline import analyze
+
+    messages = []
+    for index, message in shard:
+        message = dict(message)
+        message[index_key] = index
+        messages.append(message)
+
+    try:
+        return split_errors(analyze(messages, stages, min_sent_len))
+    except Exception:
+        pass
+
+    results = []
+    errors = []
+    for message in messages:
+        try:
+            results_message, errors_message = split_errors(analyze([message], stages, min_sent_len))
+            results.extend(results_message)
+            errors.extend(errors_message)
+        except Exception:
+            errors.append((message[index_key], traceback.format_exc()))
+    return results, errors
+
+
+# Metrics of the worker already returned to the main process
+reported_metrics = {}
+
+
+def collect_metrics():
+    # Timers and counters collected in the worker (including loading of the models) since the previous call
+    global reported_metrics
+    values = metrics.snapshot()
+    delta = {key: value - reported_metrics.get(key, 0) for key, value in values.items()
+             if value - reported_metrics.get(key, 0) != 0}
+    reported_metrics = values
+    return delta
+
+
+def split_errors(messages):
+    # Analyzed messages -> (results, errors) of run_shard
+    results = []
+    errors = []
+    for message in messages:
+        index = message.pop(index_key)
+        if metrics.errors_key in message:
+            errors.append((index, '\n'.join(message.pop(metrics.errors_key))))
+        else:
+            results.append((index, message))
+    return results, errors
+
+
+def message_len(message):
+    return len(message.get('text', '')) + len(message.get('title', ''))
+
+
+def make_shards(messages, size, chars):
+    """
+    Splits messages into shards of one language and similar length
+
+    Returns list of shards, every shard is a list of (index, message), longest shards first
+    """
+    messages_by_lang = {}
+    for i, message in enumerate(messages):
+        messages_by_lang.setdefault(message.get('lang'), []).append((i, message))
+
+    shards = []
+    for lang, messages_lang in messages_by_lang.items():
+        messages_lang.sort(key=lambda item: message_len(item[1]))
+        shard = []
+        shard_len = 0
+        for item in messages_lang:
+            if len(shard) > 0 and (len(shard) >= size or shard_len + message_len(item[1]) > chars):
+                shards.append(shard)
+                shard = []
+                shard_len = 0
+            shard.append(item)
+            shard_len += message_len(item[1])
+        if len(shard) > 0:
+            shards.append(shard)
+
+    # Long shards are started first, so that workers finish at about the same time
+    shards.sort(key=lambda shard: sum(message_len(message) for _, message in shard), reverse=True)
+    return shards
+
+
+class ShardedExecutor:
+    """
+    Pool of processes for the text_analysis stages.
+
+    Messages are split into shards by language and length, shards are analyzed
+    by text_analysis.pipeline.analyze in the workers, and the results are returned
+    in the original order. Every worker loads models once through the registry
+    and keeps them while the executor is open.
+
+    Errors of the shards and of the stages (see metrics.record_error) are collected
+    in `errors` (list of dicts with fields 'index', 'id', 'error') instead of stopping the analysis.
+    """
+
+    def __init__(self, stages=None, min_sent_len=3, workers=workers, shard_size=shard_size,
+                 shard_chars=shard_chars, warm_langs=None):
+        self.stages = stages
+        self.min_sent_len = min_sent_len
+        self.workers = workers or os.cpu_count()
+        self.shard_size = shard_size
+        self.shard_chars = shard_chars
+        self.warm_langs = warm_langs
+        self.errors = []
+        self._pool = None
+        self._settings = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _get_pool(self):
+        settings = ((cache.enabled, cache.results.memory_size, cache.results.db_path), get_settings())
+        if self._pool is not None and settings != self._settings:
+            # settings were changed after the workers were started, the workers are started again
+            self.close()
+        if self._pool is None:
+            self._settings = settings
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context(start_method),
+                                             initializer=init_worker,
+                                             initargs=(threads_per_worker, self.warm_langs, self.stages) + settings)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def add_error(self, messages, index, error):
+        self.errors.append({'index': index, 'id': messages[index].get('id', ''), 'error': error})
+        t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+        print("%s Module: %s, function: %s, text ID: %s, error: %s" %
+              (t, 'executor', 'analyze', messages[index].get('id', ''), error.strip().split('\n')[-1]))
+
+    def analyze(self, messages):
+        """ Функция анализа входных сообщений в нескольких процессах.
+
+        :param messages: список входных сообщений в формате JSON (dict), как в `text_analysis.pipeline.analyze`.
+
+        :return:
+            список результатов `text_analysis.pipeline.analyze` в порядке входных сообщений. Сообщения, обработка
+            которых завершилась ошибкой, не включаются в результат; ошибки сохраняются в поле `errors`.
+
+        """
+        self.errors = []
+        if self.stages is None or 'langid' in self.stages:
+            # Languages are detected before sharding, so that every shard has messages of one language
+            from .langid import detect_messages
+            messages = detect_messages([dict(message) for message in messages])
+        shards = make_shards(messages, self.shard_size, self.shard_chars)
+        results = {}
+
+        pool = self._get_pool()
+        futures = {pool.submit(run_shard, shard, self.stages, self.min_sent_len): shard for shard in shards}
+        broken = False
+        for future in as_completed(futures):
+            try:
+                shard_results, shard_errors, shard_metrics = future.result()
+                # stages run in the workers, their timers and counters are added to the ones of this process
+                metrics.merge(shard_metrics)
+            except BrokenProcessPool:
+                # A worker was killed (e.g. out of memory): messages of all unfinished shards are lost
+                broken = True
+                shard_results = []
+                shard_errors = [(index, 'Worker process terminated abruptly') for index, _ in futures[future]]
+            except Exception:
+                shard_results = []
+                shard_errors = [(index, traceback.format_exc()) for index, _ in futures[future]]
+            for index, message in shard_results:
+                results[index] = message
+            for index, error in shard_errors:
+                self.add_error(messages, index, error)
+
+        if broken:
+            # The pool can not be used anymore, it is created again on the next call
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+        return [results[i] for i in sorted(results)]
+
+
+def analyze_parallel(messages, stages=None, min_sent_len=3, **kwargs):
+    """ Функция анализа входных сообщений в пуле процессов (см. `ShardedExecutor`).
+
+    :param messages: список входных сообщений в формате JSON (dict).
+    :param stages: список этапов анализа (по умолчанию - все этапы).
+    :param min_sent_len: минимальное количество слов в предложении.
+
+    :return:
+        список проанализированных сообщений в порядке входных сообщений.
+
+    """
+    with ShardedExecutor(stages, min_sent_len, **kwargs) as executor:
+        return executor.analyze(messages)
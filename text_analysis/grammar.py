@@ -0,0 +1,138 @@
+import copy
+import sys
+
+
+# Fields of a token in the 'grammar' list of a sentence
+fields = ('text', 'lemma', 'upos', 'feats', 'id', 'head')
+
+
+class Token:
+    """
+    Compact representation of one token of the 'grammar' field.
+
+    Behaves like the list [text, lemma, upos, feats, id, head]: supports indexing,
+    assignment by index, iteration and comparison with lists, so the stage functions
+    work with it unchanged. Strings are interned, so equal words, lemmas, UPOS and features
+    share one string object.
+    """
+    __slots__ = fields
+
+    def __init__(self, text, lemma='', upos='', feats='', id=-1, head=-1):
+        self.text = sys.intern(text) if type(text) is str else text
+        self.lemma = sys.intern(lemma) if type(lemma) is str else lemma
+        self.upos = sys.intern(upos) if type(upos) is str else upos
+        self.feats = sys.intern(feats) if type(feats) is str else feats
+        self.id = id
+        self.head = head
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        return getattr(self, fields[index])
+
+    def __setitem__(self, index, value):
+        if type(value) is str:
+            value = sys.intern(value)
+        setattr(self, fields[index], value)
+
+    def __len__(self):
+        return len(fields)
+
+    def __iter__(self):
+        return iter((self.text, self.lemma, self.upos, self.feats, self.id, self.head))
+
+    def __eq__(self, other):
+        if isinstance(other, (Token, list, tuple)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return 'Token(%r, %r, %r, %r, %r, %r)' % tuple(self)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        # Fields are strings and numbers (Stanza ids may be tuples of numbers), which are immutable
+        return self.copy()
+
+    def __reduce__(self):
+        return self.__class__, tuple(self)
+
+    def copy(self):
+        token = Token.__new__(Token)
+        token.text = self.text
+        token.lemma = self.lemma
+        token.upos = self.upos
+        token.feats = self.feats
+        token.id = self.id
+        token.head = self.head
+        return token
+
+    def to_list(self):
+        return [self.text, self.lemma, self.upos, self.feats, self.id, self.head]
+
+
+class Grammar(list):
+    """
+    List of Token of one sentence, which is copied without going through copy.deepcopy for every token
+    """
+
+    def __deepcopy__(self, memo):
+        return Grammar([item.copy() if isinstance(item, Token) else copy.deepcopy(item, memo) for item in self])
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+
+def pack_grammar(grammar):
+    """
+    Converts the 'grammar' list of lists [text, lemma, upos, feats, id, head] to the list of Token
+    """
+    return Grammar([item if isinstance(item, Token) else Token(*item) for item in grammar])
+
+
+def unpack_grammar(grammar):
+    """
+    Converts the list of Token back to the list of lists (JSON format of the 'grammar' field)
+    """
+    return [item.to_list() if isinstance(item, Token) else item for item in grammar]
+
+
+def get_analyses(message):
+    """
+    Takes one message and returns list of pairs (text, analysis)
+    for its sentences and title, where analysis is a dict with field 'grammar'
+    """
+    analyses = []
+    for sentence in message.get('sentences', []):
+        if 'grammar' in sentence:
+            analyses.append((sentence['text'], sentence))
+    if 'title_analysis' in message and 'grammar' in message['title_analysis']:
+        analyses.append((message['title'], message['title_analysis']))
+    return analyses
+
+
+def convert_message(message, convert):
+    for _, analysis in get_analyses(message):
+        analysis['grammar'] = convert(analysis['grammar'])
+    return message
+
+
+def pack_messages(messages):
+    """
+    Replaces tokens of sentences and titles of the messages with Token (in place)
+    """
+    for message in messages:
+        convert_message(message, pack_grammar)
+    return messages
+
+
+def unpack_messages(messages):
+    """
+    Replaces Token in sentences and titles of the messages with lists (in place),
+    after this the messages can be serialized to JSON
+    """
+    for message in messages:
+        convert_message(message, unpack_grammar)
+    return messages
@@ -0,0 +1,180 @@
+from collections import Counter
+from datetime import datetime
+import copy
+import math
+import sys
+
+import regex as re
+
+from .registry import get_model
+from .langid_samples import samples
+from . import metrics
+
+# ---------------- SETTINGS SECTION ----------------
+
+# Languages of the analysis stages; other detected languages are not written to the messages
+languages = ['en', 'ru', 'es', 'fr', 'de', 'uk', 'tr', 'ar']
+
+# Languages of every script: one language is detected by the script,
+# several languages are told apart by the character trigram profiles (see langid_samples.py)
+script_languages = {
+    'Latin': ['en', 'es', 'fr', 'de', 'tr'],
+    'Cyrillic': ['ru', 'uk'],
+    'Arabic': ['ar'],
+}
+
+# Path to the fastText language identification model (e.g. lid.176.ftz);
+# None - the built-in trigram classifier is used
+fasttext_model_path = None
+
+# Number of characters of the title and the text used for detection
+max_chars = 1000
+
+# If True, 'lang' of the message is replaced with the detected language
+# when the detection is confident; otherwise 'lang' is only filled if it is missing
+validate = False
+min_confidence = 0.95
+min_letters = 50
+
+# --------------------------------------------------
+
+scripts_re = {script: re.compile(r'\p{%s}' % script) for script in script_languages}
+not_letters_re = re.compile(r'[^\p{L}]+')
+
+# lang -> (dict trigram -> log probability, log probability of unknown trigram)
+profiles = {}
+
+
+def get_trigrams(text):
+    text = ' ' + not_letters_re.sub(' ', text.lower()).strip() + ' '
+    return Counter(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def get_profiles():
+    # Profiles are built on the first request; add-one smoothing over the trigrams of all languages
+    if len(profiles) == 0:
+        counts = {lang: get_trigrams(text) for lang, text in samples.items()}
+        vocabulary_size = len(set().union(*counts.values()))
+        for lang, counts_lang in counts.items():
+            total = sum(counts_lang.values()) + vocabulary_size
+            profiles[lang] = ({trigram: math.log((count + 1) / total) for trigram, count in counts_lang.items()},
+                              math.log(1 / total))
+    return profiles
+
+
+def detect_trigrams(text):
+    """
+    Detects language of the text by the script and the character trigrams
+
+    Returns (lang, confidence); lang is None if the text has no letters of the known scripts
+    """
+    text = text[:max_chars]
+    letters = {script: len(pattern.findall(text)) for script, pattern in scripts_re.items()}
+    script = max(letters, key=letters.get)
+    if letters[script] == 0:
+        return None, 0.0
+    share = letters[script] / sum(letters.values())
+    candidates = [lang for lang in script_languages[script] if lang in languages]
+    if len(candidates) <= 1:
+        return (candidates[0] if len(candidates) > 0 else None), share
+
+    trigrams = get_trigrams(text)
+    scores = {}
+    for lang in candidates:
+        log_probs, log_prob_unknown = get_profiles()[lang]
+        scores[lang] = sum(count * log_probs.get(trigram, log_prob_unknown) for trigram, count in trigrams.items())
+    lang = max(scores, key=scores.get)
+    # posterior probability of the best language among the candidates of the script
+    confidence = 1 / sum(math.exp(score - scores[lang]) for score in scores.values())
+    return lang, confidence * share
+
+
+def detect_fasttext(texts):
+    model = get_model('FastText', '', model_path=fasttext_model_path)
+    labels, probs = model.predict([text[:max_chars].replace('\n', ' ') for text in texts], k=1)
+    results = []
+    for labels_text, probs_text in zip(labels, probs):
+        lang = labels_text[0].replace('__label__', '')
+        results.append((lang if lang in languages else None, float(probs_text[0])))
+    return results
+
+
+def detect_batch(texts):
+    """
+    Detects languages of the texts: with fastText (one call for all texts) if fasttext_model_path is set,
+    otherwise with the trigram classifier
+
+    Returns list of (lang, confidence)
+    """
+    if fasttext_model_path is not None:
+        return detect_fasttext(texts)
+    return [detect_trigrams(text) for text in texts]
+
+
+def get_text(message):
+    return (message.get('title', '') + '\n' + message.get('text', '')).strip()
+
+
+def detect_messages(messages):
+    """
+    Fills 'lang' of the messages in place (see validate)
+    """
+    backend = 'FastText' if fasttext_model_path is not None else 'Trigrams'
+    indexes = [i for i, message in enumerate(messages) if validate or 'lang' not in message]
+    if len(indexes) == 0:
+        return messages
+
+    with metrics.timer('text_analysis_stage_seconds', stage='langid', lang='', backend=backend):
+        try:
+            results = detect_batch([get_text(messages[i]) for i in indexes])
+        except:
+            e = sys.exc_info()[1]
+            t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+            print("%s Module: %s, function: %s, error: %s" % (t, 'langid', 'detect_batch', e))
+            return messages
+
+    for i, (lang, confidence) in zip(indexes, results):
+        message = messages[i]
+        if lang is None:
+            continue
+        if 'lang' not in message:
+            message['lang'] = lang
+        elif message['lang'] != lang and confidence >= min_confidence and \
+                len(not_letters_re.sub('', get_text(message)[:max_chars])) >= min_letters:
+            message['lang'] = lang
+    for lang, messages_lang in group_by_lang([messages[i] for i in indexes]).items():
+        metrics.increment('text_analysis_messages_total', len(messages_lang), stage='langid', lang=lang, backend=backend)
+    return messages
+
+
+def group_by_lang(messages):
+    """
+    Groups messages by language, so that every backend gets messages of one language
+
+    Returns dict lang -> list of messages in the original order; messages without 'lang' are skipped
+    """
+    messages_by_lang = {}
+    for message in messages:
+        if 'lang' in message:
+            messages_by_lang.setdefault(message['lang'], []).append(message)
+    return messages_by_lang
+
+
+def language_identification(messages):
+    """ Функция определения языка входных сообщений.
+
+    Язык определяется по заголовку и тексту сообщения: по алфавиту и по частотам триграмм символов
+    (или моделью fastText, если задан `fasttext_model_path`). Если поле `lang` отсутствует, оно заполняется;
+    если `validate` равно True, имеющееся поле `lang` заменяется определенным языком при достаточной уверенности.
+
+    :param messages: список входных сообщений в формате JSON (dict). Каждое сообщение содержит поле `text`;
+        `title` и `lang` - опционально.
+
+    :return:
+        список входных сообщений, для каждого из которых заполнено поле `lang` - язык из `languages`
+        (если язык сообщения не определен или не поддерживается, поле не добавляется).
+
+    """
+
+    messages_new = copy.deepcopy(messages)
+    return detect_messages(messages_new)
@@ -0,0 +1,114 @@
+# Sample texts from which the character trigram profiles of the languages are built (see langid.py).
+# Languages of the other scripts are detected by the script: Arabic - 'ar'
+samples = {
+    'en': """
+The government said on Monday that it would increase spending on roads and schools next year, after the economy
+grew faster than expected in the first quarter. The minister of finance told reporters that the new budget will
+be presented to the parliament in the coming weeks. According to the report, the number of people who are looking
+for a job has fallen for the third month in a row. Analysts say that the central bank may raise interest rates
+if prices continue to rise. The company announced that its profits were higher than in the same period of the
+previous year, and its shares rose sharply in early trading. The president met with the leaders of several
+countries to discuss the situation in the region and the war, which has forced thousands of people to leave their
+homes. It was the first visit of the new prime minister abroad. Police said that the driver of the car was taken
+to hospital with serious injuries. The weather is expected to be warm and dry for the rest of the week, although
+some rain is possible in the north. Scientists have found that the new vaccine is safe and effective, and they
+hope it will be available to the public by the end of this year. The team won the championship for the first time
+in its history after a difficult match against the best players of the league. What do you think about these
+changes? They should have known what was happening, but nobody wanted to listen to them.
+""",
+    'ru': """
+Правительство России в понедельник объявило о том, что в следующем году расходы на строительство дорог и школ
+будут увеличены, поскольку экономика в первом квартале росла быстрее, чем ожидалось. Министр финансов сообщил
+журналистам, что новый бюджет будет представлен в Государственную думу в ближайшие недели. Согласно докладу,
+число людей, которые ищут работу, снижается уже третий месяц подряд. Аналитики считают, что Центральный банк
+может повысить ключевую ставку, если цены продолжат расти. Компания объявила, что ее прибыль оказалась выше, чем
+за аналогичный период прошлого года, и ее акции резко подорожали в начале торгов. Президент встретился с
+руководителями нескольких стран, чтобы обсудить ситуацию в регионе, из-за которой тысячи людей были вынуждены
+покинуть свои дома. Это был первый зарубежный визит нового премьер-министра. В полиции сообщили, что водитель
+автомобиля был доставлен в больницу с серьезными травмами. До конца недели ожидается теплая и сухая погода, хотя
+на севере возможны небольшие дожди. Ученые выяснили, что новая вакцина безопасна и эффективна, и надеются, что
+она станет доступна населению уже в этом году. Команда впервые в своей истории выиграла чемпионат после тяжелого
+матча против лучших игроков лиги. Что вы думаете об этих изменениях? Они должны были знать, что происходит, но
+никто не хотел их слушать. Объем экспорта вырос, а также увеличилось производство электроэнергии.
+""",
+    'uk': """
+Уряд України в понеділок оголосив про те, що наступного року видатки на будівництво доріг і шкіл буде збільшено,
+оскільки економіка в першому кварталі зростала швидше, ніж очікувалося. Міністр фінансів повідомив журналістам,
+що новий бюджет буде представлено до Верховної Ради найближчими тижнями. Згідно з доповіддю, кількість людей,
+які шукають роботу, зменшується вже третій місяць поспіль. Аналітики вважають, що Національний банк може
+підвищити облікову ставку, якщо ціни й надалі зростатимуть. Компанія оголосила, що її прибуток виявився вищим,
+ніж за аналогічний період минулого року, і її акції різко подорожчали на початку торгів. Президент зустрівся з
+керівниками кількох країн, щоб обговорити ситуацію в регіоні, через яку тисячі людей були змушені залишити свої
+домівки. Це був перший закордонний візит нового прем'єр-міністра. У поліції повідомили, що водія автомобіля
+було доставлено до лікарні з серйозними травмами. До кінця тижня очікується тепла й суха погода, хоча на
+півночі можливі невеликі дощі. Науковці з'ясували, що нова вакцина є безпечною та ефективною, і сподіваються,
+що вона стане доступною для населення вже цього року. Команда вперше у своїй історії виграла чемпіонат після
+важкого матчу проти найкращих гравців ліги. Що ви думаєте про ці зміни? Вони мали знати, що відбувається, але
+ніхто не хотів їх слухати. Обсяг експорту зріс, а також збільшилося виробництво електроенергії та ґрунтових робіт.
+""",
+    'es': """
+El gobierno anunció el lunes que el próximo año aumentará el gasto en carreteras y escuelas, después de que la
+economía creciera más rápido de lo esperado en el primer trimestre. El ministro de Hacienda dijo a los periodistas
+que el nuevo presupuesto será presentado al parlamento en las próximas semanas. Según el informe, el número de
+personas que buscan trabajo ha bajado por tercer mes consecutivo. Los analistas creen que el banco central podría
+subir los tipos de interés si los precios siguen aumentando. La empresa anunció que sus beneficios fueron mayores
+que en el mismo periodo del año anterior, y sus acciones subieron con fuerza al inicio de la sesión. El presidente
+se reunió con los líderes de varios países para hablar de la situación en la región, que ha obligado a miles de
+personas a abandonar sus hogares. Fue la primera visita al extranjero del nuevo primer ministro. La policía
+informó de que el conductor del coche fue trasladado al hospital con heridas graves. Se espera que el tiempo sea
+cálido y seco durante el resto de la semana, aunque no se descartan lluvias en el norte. Los científicos han
+comprobado que la nueva vacuna es segura y eficaz, y esperan que esté disponible para la población antes de que
+termine este año. El equipo ganó el campeonato por primera vez en su historia tras un partido muy difícil contra
+los mejores jugadores de la liga. ¿Qué piensa usted de estos cambios? Ellos deberían haber sabido lo que pasaba,
+pero nadie quería escucharlos. También creció la producción de energía y la exportación de vino y aceite de oliva.
+""",
+    'fr': """
+Le gouvernement a annoncé lundi qu'il augmenterait l'an prochain les dépenses consacrées aux routes et aux écoles,
+après une croissance de l'économie plus rapide que prévu au premier trimestre. Le ministre des Finances a déclaré
+aux journalistes que le nouveau budget serait présenté au Parlement dans les prochaines semaines. Selon le rapport,
+le nombre de personnes qui cherchent un emploi a baissé pour le troisième mois consécutif. Les analystes estiment
+que la banque centrale pourrait relever ses taux d'intérêt si les prix continuent d'augmenter. L'entreprise a
+annoncé que ses bénéfices étaient supérieurs à ceux de la même période de l'année précédente, et son action a
+fortement progressé en début de séance. Le président s'est entretenu avec les dirigeants de plusieurs pays pour
+évoquer la situation dans la région, qui a contraint des milliers de personnes à quitter leur maison. C'était la
+première visite à l'étranger du nouveau Premier ministre. La police a indiqué que le conducteur de la voiture avait
+été transporté à l'hôpital dans un état grave. Le temps devrait rester chaud et sec jusqu'à la fin de la semaine,
+même si quelques averses sont possibles dans le nord. Les chercheurs ont constaté que le nouveau vaccin est sûr et
+efficace, et ils espèrent qu'il sera disponible pour le public avant la fin de cette année. L'équipe a remporté le
+championnat pour la première fois de son histoire après un match très difficile contre les meilleurs joueurs du
+championnat. Que pensez-vous de ces changements ? Ils auraient dû savoir ce qui se passait, mais personne ne
+voulait les écouter. La production d'électricité et les exportations de vin ont également augmenté cette année.
+""",
+    'de': """
+Die Regierung hat am Montag angekündigt, im nächsten Jahr mehr Geld für Straßen und Schulen auszugeben, nachdem
+die Wirtschaft im ersten Quartal schneller gewachsen ist als erwartet. Der Finanzminister sagte den Journalisten,
+dass der neue Haushalt in den kommenden Wochen dem Parlament vorgelegt werden soll. Laut dem Bericht ist die Zahl
+der Menschen, die eine Arbeit suchen, im dritten Monat in Folge gesunken. Analysten gehen davon aus, dass die
+Zentralbank die Zinsen erhöhen könnte, wenn die Preise weiter steigen. Das Unternehmen teilte mit, dass sein
+Gewinn höher war als im gleichen Zeitraum des Vorjahres, und seine Aktien legten zu Beginn des Handels deutlich
+zu. Der Präsident traf sich mit den Staatschefs mehrerer Länder, um über die Lage in der Region zu sprechen, die
+Tausende Menschen gezwungen hat, ihre Häuser zu verlassen. Es war die erste Auslandsreise des neuen
+Ministerpräsidenten. Die Polizei teilte mit, dass der Fahrer des Wagens mit schweren Verletzungen ins Krankenhaus
+gebracht wurde. Für den Rest der Woche wird warmes und trockenes Wetter erwartet, obwohl es im Norden auch regnen
+kann. Wissenschaftler haben festgestellt, dass der neue Impfstoff sicher und wirksam ist, und sie hoffen, dass er
+noch vor dem Ende dieses Jahres für die Bevölkerung verfügbar sein wird. Die Mannschaft gewann zum ersten Mal in
+ihrer Geschichte die Meisterschaft nach einem schwierigen Spiel gegen die besten Spieler der Liga. Was halten Sie
+von diesen Änderungen? Sie hätten wissen müssen, was passiert, aber niemand wollte ihnen zuhören. Auch die
+Produktion von Strom und die Ausfuhr von Maschinen sind in diesem Jahr gestiegen.
+""",
+    'tr': """
+Hükümet pazartesi günü yaptığı açıklamada, ekonominin ilk çeyrekte beklenenden daha hızlı büyümesinin ardından
+gelecek yıl yollar ve okullar için yapılan harcamaları artıracağını duyurdu. Maliye bakanı gazetecilere yaptığı
+açıklamada, yeni bütçenin önümüzdeki haftalarda meclise sunulacağını söyledi. Rapora göre iş arayan kişilerin
+sayısı üst üste üçüncü ay düştü. Analistler, fiyatlar artmaya devam ederse merkez bankasının faiz oranlarını
+yükseltebileceğini düşünüyor. Şirket, kârının geçen yılın aynı dönemine göre daha yüksek olduğunu açıkladı ve
+hisseleri işlemlerin başında sert bir şekilde yükseldi. Cumhurbaşkanı, binlerce kişiyi evlerini terk etmek
+zorunda bırakan bölgedeki durumu görüşmek üzere birçok ülkenin liderleriyle bir araya geldi. Bu, yeni başbakanın
+yurt dışına yaptığı ilk ziyaretti. Polis, otomobilin sürücüsünün ağır yaralı olarak hastaneye kaldırıldığını
+bildirdi. Hafta sonuna kadar havanın sıcak ve kuru olması bekleniyor, ancak kuzeyde yağmur görülebilir. Bilim
+insanları yeni aşının güvenli ve etkili olduğunu tespit etti ve aşının bu yılın sonundan önce halkın kullanımına
+sunulmasını umuyor. Takım, ligin en iyi oyuncularına karşı oynanan zorlu bir maçın ardından tarihinde ilk kez
+şampiyon oldu. Bu değişiklikler hakkında ne düşünüyorsunuz? Neler olduğunu bilmeleri gerekirdi, ama kimse onları
+dinlemek istemedi. Bu yıl elektrik üretimi ve ihracat da arttı.
+""",
+}
@@ -0,0 +1,253 @@
+from contextlib import contextmanager
+import functools
+import threading
+import time
+import traceback
+import sys
+
+# ---------------- SETTINGS SECTION ----------------
+
+# Timers and counters are collected only if enabled
+enabled = True
+
+# If True, errors of the stages are recorded in the messages under errors_key (set in the workers of the executor)
+record_errors = False
+errors_key = '__errors__'
+
+# --------------------------------------------------
+
+# (metric name, labels) -> value; timers are stored as two metrics: <name>_sum and <name>_count
+values = {}
+lock = threading.Lock()
+
+descriptions = {
+    'text_analysis_stage_seconds': 'Time of the analysis stages',
+    'text_analysis_model_load_seconds': 'Time of loading of the models',
+    'text_analysis_messages_total': 'Messages processed by the stages',
+    'text_analysis_sentences_total': 'Sentences and titles processed by the stages',
+    'text_analysis_tokens_total': 'Tokens processed by the stages',
+    'text_analysis_errors_total': 'Messages whose analysis by the stages failed',
+}
+
+
+def make_labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """
+    Adds value to the counter with the given labels
+    """
+    if not enabled:
+        return
+    key = (name, make_labels(labels))
+    with lock:
+        values[key] = values.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """
+    Adds one measurement to the timer with the given labels
+    """
+    if not enabled:
+        return
+    labels = make_labels(labels)
+    with lock:
+        values[(name + '_sum', labels)] = values.get((name + '_sum', labels), 0) + seconds
+        values[(name + '_count', labels)] = values.get((name + '_count', labels), 0) + 1
+
+
+def record_error(message, stage):
+    """
+    Counts the current exception of the stage for the message; if record_errors is set,
+    the traceback is also recorded in the message, so that the caller can report the failed message
+    """
+    increment('text_analysis_errors_total', stage=stage, lang=message.get('lang', ''))
+    if record_errors:
+        message.setdefault(errors_key, []).append(traceback.format_exc())
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def count_analyses(stage, lang, backend, messages):
+    # Number of messages, sentences (with titles) and tokens after the stage
+    sentences = 0
+    tokens = 0
+    for message in messages:
+        analyses = list(message.get('sentences', []))
+        if 'title_analysis' in message:
+            analyses.append(message['title_analysis'])
+        sentences += len(analyses)
+        tokens += sum(len(analysis.get('grammar', [])) for analysis in analyses)
+    increment('text_analysis_messages_total', len(messages), stage=stage, lang=lang, backend=backend)
+    increment('text_analysis_sentences_total', sentences, stage=stage, lang=lang, backend=backend)
+    if tokens > 0:
+        increment('text_analysis_tokens_total', tokens, stage=stage, lang=lang, backend=backend)
+
+
+def timed_message(stage, method):
+    """
+    Decorator of the functions processing one message: measures time
+    and counts sentences and tokens by language and backend (method[lang]).
+    Calls with tagged=True (only named entities are processed) are counted as stage 'ner'
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(message, *args, **kwargs):
+            if not enabled:
+                return function(message, *args, **kwargs)
+            lang = message.get('lang', '')
+            backend = method.get(lang, '')
+            stage_name = 'ner' if kwargs.get('tagged') else stage
+            with timer('text_analysis_stage_seconds', stage=stage_name, lang=lang, backend=backend):
+                result = function(message, *args, **kwargs)
+            count_analyses(stage_name, lang, backend, [message])
+            return result
+        return wrapper
+    return decorator
+
+
+def timed_batch(stage, method):
+    """
+    Decorator of the functions processing messages of one language: function(messages, lang, ...)
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(messages, lang, *args, **kwargs):
+            if not enabled:
+                return function(messages, lang, *args, **kwargs)
+            backend = method.get(lang, '')
+            with timer('text_analysis_stage_seconds', stage=stage, lang=lang, backend=backend):
+                result = function(messages, lang, *args, **kwargs)
+            count_analyses(stage, lang, backend, messages)
+            return result
+        return wrapper
+    return decorator
+
+
+def get_cache_values():
+    # Hits and misses of the caches of the modules which are loaded
+    caches = {}
+    if 'text_analysis.cache' in sys.modules:
+        stats = sys.modules['text_analysis.cache'].stats()
+        caches['results'] = (stats['hits'], stats['misses'])
+    if 'text_analysis.morphology' in sys.modules:
+        info = sys.modules['text_analysis.morphology'].pymorphy_cache_info()
+        caches['pymorphy'] = (info.hits, info.misses)
+    return caches
+
+
+def snapshot():
+    """
+    Returns copy of all collected values: dict (metric name, labels) -> value
+    """
+    with lock:
+        result = dict(values)
+    for cache_name, (hits, misses) in get_cache_values().items():
+        # hits and misses of the workers (see merge) are added to the ones of this process
+        for name, value in [('text_analysis_cache_hits_total', hits), ('text_analysis_cache_misses_total', misses)]:
+            key = (name, (('cache', cache_name),))
+            result[key] = result.get(key, 0) + value
+    return result
+
+
+def merge(data):
+    """
+    Adds values collected elsewhere, e.g. in the workers of the executor: dict (metric name, labels) -> value
+    """
+    if not enabled:
+        return
+    with lock:
+        for key, value in data.items():
+            values[key] = values.get(key, 0) + value
+
+
+def reset():
+    with lock:
+        values.clear()
+
+
+def format_prometheus(data):
+    lines = []
+    described = set()
+    for (name, labels), value in sorted(data.items()):
+        base = name[:-len('_sum')] if name.endswith('_sum') else name[:-len('_count')] if name.endswith('_count') else name
+        if base not in described:
+            described.add(base)
+            if base in descriptions:
+                lines.append('# HELP %s %s' % (base, descriptions[base]))
+            lines.append('# TYPE %s %s' % (base, 'summary' if base.endswith('_seconds') else 'counter'))
+        labels_text = ','.join('%s="%s"' % (key, value.replace('"', '\\"')) for key, value in labels)
+        lines.append('%s{%s} %s' % (name, labels_text, repr(value) if isinstance(value, float) else value))
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus():
+    """
+    Returns all metrics in the Prometheus text format
+    """
+    return format_prometheus(snapshot())
+
+
+class Profile:
+    """
+    Context manager collecting metrics of the code inside it:
+
+        with metrics.Profile() as profile:
+            analyze(messages)
+        print(profile.report())
+    """
+
+    def __init__(self):
+        self.start = {}
+        self.values = {}
+
+    def __enter__(self):
+        self.start = snapshot()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        end = snapshot()
+        self.values = {key: value - self.start.get(key, 0) for key, value in end.items()
+                       if value - self.start.get(key, 0) != 0}
+
+    def prometheus(self):
+        return format_prometheus(self.values)
+
+    def report(self):
+        """
+        Table of the stages by language: time, sentences and tokens per second
+        """
+        rows = {}
+        for (name, labels), value in self.values.items():
+            labels = dict(labels)
+            if 'stage' in labels:
+                row = rows.setdefault((labels['stage'], labels.get('lang', ''), labels.get('backend', '')), {})
+                row[name] = value
+        lines = ['%-20s %-6s %-10s %10s %10s %12s %12s' %
+                 ('stage', 'lang', 'backend', 'seconds', 'messages', 'sent/s', 'tokens/s')]
+        for (stage, lang, backend), row in sorted(rows.items(), key=lambda item: -item[1].get(
+                'text_analysis_stage_seconds_sum', 0)):
+            seconds = row.get('text_analysis_stage_seconds_sum', 0)
+            sentences = row.get('text_analysis_sentences_total', 0)
+            tokens = row.get('text_analysis_tokens_total', 0)
+            lines.append('%-20s %-6s %-10s %10.3f %10d %12.1f %12.1f' %
+                         (stage, lang, backend, seconds, row.get('text_analysis_messages_total', 0),
+                          sentences / seconds if seconds > 0 else 0, tokens / seconds if seconds > 0 else 0))
+        for (name, labels), value in sorted(self.values.items()):
+            if name == 'text_analysis_model_load_seconds_sum':
+                lines.append('model load %s: %.3f s' % (', '.join('%s=%s' % item for item in labels), value))
+        for cache_name in ['results', 'pymorphy']:
+            hits = self.values.get(('text_analysis_cache_hits_total', (('cache', cache_name),)), 0)
+            misses = self.values.get(('text_analysis_cache_misses_total', (('cache', cache_name),)), 0)
+            if hits + misses > 0:
+                lines.append('cache %s: hit rate %.1f%% (%d of %d)' %
+                             (cache_name, 100.0 * hits / (hits + misses), hits, hits + misses))
+        return '\n'.join(lines)
@@ -1,38 +1,24 @@
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
 from spacy.tokens import Doc as spacy_doc
 import regex as re
 import stanza
 import copy
-import trankit
-import spacy
-import pymorphy2
 import string
 import sys
-from natasha import (
-    Segmenter,
-    NewsEmbedding,
-    NewsMorphTagger,
-    MorphVocab,
-    Doc,
-)
-
-# ---------------- SETTINGS SECTION ----------------
-
-# set True if you need to use model for specific language
-need_load_model_ru = False
-need_load_model_en = False
-need_load_model_es = False
-need_load_model_fr = False
-need_load_model_de = False
-need_load_model_uk = False
-need_load_model_tr = False
-need_load_model_ar = False
-
-# --------------- LOAD MODELS ----------------
-
-nlp_morph = {}
-nlp_token = {}
+from natasha import Doc
 
+from .registry import get_model, get_model_id, pipe_spacy, stanza_methods, stanza_packages
+from .tokenization import join_tokens, split_tokens
+from .grammar import get_analyses
+from . import cache
+from . import metrics
+
+
+# --------------- MODELS ----------------
+
+# Models are loaded on the first request through the shared registry
 method = {
     'en': 'Stanza',
     'ru': 'Pymorphy',
@@ -44,212 +30,101 @@ method = {
     'ar': 'Stanza',
 }
 
-if need_load_model_en:
-    if method['en'] == 'Stanza':
-        nlp_morph['en'] = stanza.Pipeline(lang="en", package='ewt', processors="tokenize,mwt,pos,lemma",
-                                          tokenize_pretokenized=True)
-        nlp_token['en'] = stanza.Pipeline(lang="en", package='ewt', processors="tokenize")
-    elif method['en'] == 'Trankit':
-        nlp_morph['en'] = trankit.Pipeline('english')
-        nlp_token['en'] = trankit.Pipeline('english')
-    elif method['en'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_morph['en'] = spacy.load("en_core_web_sm")
-        nlp_token['en'] = spacy.load("en_core_web_sm")
-
-if need_load_model_ru:
-    if method['ru'] == 'Stanza':
-        nlp_morph['ru'] = stanza.Pipeline(lang="ru", package='syntagrus', processors="tokenize,pos,lemma",
-                                        tokenize_pretokenized=True)
-        nlp_token['ru'] = stanza.Pipeline(lang="ru", package='gsd', processors="tokenize")
-    elif method['ru'] == 'Trankit':
-        nlp_morph['ru'] = trankit.Pipeline('russian')
-        nlp_token['ru'] = trankit.Pipeline('russian')
-    elif method['ru'] == 'Natasha':
-        segmenter = Segmenter()
-        morph_vocab = MorphVocab()
-        emb = NewsEmbedding()
-        morph_tagger = NewsMorphTagger(emb)
-    elif method['ru'] == 'Pymorphy':
-        '''
-        'ADJF' (имя прил. полное) -> 'ADJ' (имя прил.)
-        'ADJS' (имя прил. краткое) -> 'ADJ' (имя прил.)
-        'COMP' (сравн. степень прил.) -> 'ADV' (наречие)
-        'ADVB' (наречие) -> 'ADV' (наречие)
-        'PREP' (предлог) -> 'ADP' (предлог)
-        'GRND' (деепричастие) -> 'AUX' (вспомогательный глагол)
-        'CONJ' (союз) -> 'CCONJ' (союз)
-        'NUMR' (числительное) -> 'NUM' (числительное)
-        'PRCL' (частица) -> 'PART' (частица)
-        'NPRO' (местоимение-существительное) -> 'PRON' (местоимение)
-        'INFN' (инфинитив) -> 'VERB' (глагол)
-        'PRTF' (причастие полное) -> 'VERB' (глагол)
-        'PRTS' (причастие краткое) -> 'VERB' (глагол)
-        '''
-        pos_list = ['ADJF', 'ADJS', 'COMP', 'ADVB', 'PREP', 'GRND', 'CONJ', 'NUMR', 'PRCL', 'NPRO', 'INFN', 'PRTF', 'PRTS']
-        upos_list = ['ADJ', 'ADJ', 'ADV', 'ADV', 'ADP', 'AUX', 'CCONJ', 'NUM', 'PART', 'PRON', 'VERB', 'VERB', 'VERB']
-        tenses_dict = {'past': 'past', 'pres': 'pres', 'futr': 'fut'}
-        nlp_token['ru'] = stanza.Pipeline(lang="ru", package='gsd', processors="tokenize")
-        nlp_morph_pymorphy = pymorphy2.MorphAnalyzer(lang='ru')
-
-if need_load_model_es:
-    if method['es'] == 'Stanza':
-        nlp_morph['es'] = stanza.Pipeline(lang="es", package='gsd', processors="tokenize,mwt,pos,lemma",
-                                          tokenize_pretokenized=True)
-        nlp_token['es'] = stanza.Pipeline(lang="es", package='gsd', processors="tokenize")
-    elif method['es'] == 'Trankit':
-        nlp_morph['es'] = trankit.Pipeline('spanish')
-        nlp_token['es'] = trankit.Pipeline('spanish')
-    elif method['es'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_morph['es'] = spacy.load("es_core_news_sm")
-        nlp_token['es'] = spacy.load("es_core_news_sm")
-
-if need_load_model_fr:
-    if method['fr'] == 'Stanza':
-        nlp_morph['fr'] = stanza.Pipeline(lang="fr", package='gsd', processors="tokenize,mwt,pos,lemma",
-                                          tokenize_pretokenized=True)
-        nlp_token['fr'] = stanza.Pipeline(lang="fr", package='gsd', processors="tokenize")
-    elif method['fr'] == 'Trankit':
-        nlp_morph['fr'] = trankit.Pipeline('french')
-        nlp_token['fr'] = trankit.Pipeline('french')
-    elif method['fr'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_morph['fr'] = spacy.load("fr_core_news_sm")
-        nlp_token['fr'] = spacy.load("fr_core_news_sm")
-
-if need_load_model_de:
-    if method['de'] == 'Stanza':
-        nlp_morph['de'] = stanza.Pipeline(lang="de", package='gsd', processors="tokenize,mwt,pos,lemma",
-                                          tokenize_pretokenized=True)
-        nlp_token['de'] = stanza.Pipeline(lang="de", package='gsd', processors="tokenize")
-    elif method['de'] == 'Trankit':
-        nlp_morph['de'] = trankit.Pipeline('german')
-        nlp_token['de'] = trankit.Pipeline('german')
-    elif method['de'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_morph['de'] = spacy.load("de_core_news_sm")
-        nlp_token['de'] = spacy.load("de_core_news_sm")
-
-if need_load_model_uk:
-    if method['uk'] == 'Stanza':
-        nlp_morph['uk'] = stanza.Pipeline(lang="uk", package='iu', processors="tokenize,mwt,pos,lemma",
-                                          tokenize_pretokenized=True)
-        nlp_token['uk'] = stanza.Pipeline(lang="uk", package='iu', processors="tokenize")
-    elif method['uk'] == 'Trankit':
-        nlp_morph['uk'] = trankit.Pipeline('ukrainian')
-        nlp_token['uk'] = trankit.Pipeline('ukrainian')
-    elif method['uk'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_morph['uk'] = spacy.load("uk_core_news_sm")
-        nlp_token['uk'] = spacy.load("uk_core_news_sm")
-
-if need_load_model_tr:
-    if method['tr'] == 'Stanza':
-        nlp_morph['tr'] = stanza.Pipeline(lang="tr", package='imst', processors="tokenize,mwt,pos,lemma",
-                                          tokenize_pretokenized=True)
-        nlp_token['tr'] = stanza.Pipeline(lang="tr", package='imst', processors="tokenize")
-    elif method['tr'] == 'Trankit':
-        nlp_morph['tr'] = trankit.Pipeline('turkish')
-        nlp_token['tr'] = trankit.Pipeline('turkish')
-
-if need_load_model_ar:
-    if method['ar'] == 'Stanza':
-        nlp_morph['ar'] = stanza.Pipeline(lang="ar", package='padt', processors="tokenize,mwt,pos,lemma",
-                                          tokenize_pretokenized=True)
-        nlp_token['ar'] = stanza.Pipeline(lang="ar", package='padt', processors="tokenize")
-    elif method['ar'] == 'Trankit':
-        nlp_morph['ar'] = trankit.Pipeline('arabic')
-        nlp_token['ar'] = trankit.Pipeline('arabic')
-
-# --------------------------------------------------
-
-
-def replace_symbol(token, symbol, tokens_list):
-    token_splitted = re.split(re.escape(symbol), token)
-    if len(token_splitted) > 1 and len(token) > 1:
-        # split tokens, e.g. "Интерфакс\""
-        token_splitted = token.replace(symbol, ' ' + symbol + ' ').strip().split()
-        for item in token_splitted:
-            if len(item) > 0:
-                tokens_list.append([item, '', '', '', -1, -1])
-    else:
-        tokens_list.append([token, '', '', '', -1, -1])
-    return tokens_list
+# Stanza packages and processors for morphological analysis
+stanza_morph = {
+    'en': ('ewt', 'tokenize,mwt,pos,lemma'),
+    'ru': ('syntagrus', 'tokenize,pos,lemma'),
+    'es': ('gsd', 'tokenize,mwt,pos,lemma'),
+    'fr': ('gsd', 'tokenize,mwt,pos,lemma'),
+    'de': ('gsd', 'tokenize,mwt,pos,lemma'),
+    'uk': ('iu', 'tokenize,mwt,pos,lemma'),
+    'tr': ('imst', 'tokenize,mwt,pos,lemma'),
+    'ar': ('padt', 'tokenize,mwt,pos,lemma'),
+}
 
+# Maximum number of word forms in the cache of Pymorphy analyses (None - no limit)
+pymorphy_cache_size = 200000
+
+# Maximum number of lemmas of named entities kept between messages
+ner_cache_size = 50000
+
+# Trankit: tag and lemmatize with one call of the pipeline (the lemmatizer uses the tags of the same pass),
+# otherwise posdep and lemmatize are called separately. The full pipeline also runs NER for languages
+# with a Trankit NER model (en, ru, es, fr, de, ar), so it is not faster by default
+# (see benchmarks/text_analysis/bench_trankit_modes.py)
+trankit_joint_call = False
+
+# Components of spaCy models which are not needed for morphological analysis
+spacy_disable = ['parser', 'ner']
+
+'''
+'ADJF' (имя прил. полное) -> 'ADJ' (имя прил.)
+'ADJS' (имя прил. краткое) -> 'ADJ' (имя прил.)
+'COMP' (сравн. степень прил.) -> 'ADV' (наречие)
+'ADVB' (наречие) -> 'ADV' (наречие)
+'PREP' (предлог) -> 'ADP' (предлог)
+'GRND' (деепричастие) -> 'AUX' (вспомогательный глагол)
+'CONJ' (союз) -> 'CCONJ' (союз)
+'NUMR' (числительное) -> 'NUM' (числительное)
+'PRCL' (частица) -> 'PART' (частица)
+'NPRO' (местоимение-существительное) -> 'PRON' (местоимение)
+'INFN' (инфинитив) -> 'VERB' (глагол)
+'PRTF' (причастие полное) -> 'VERB' (глагол)
+'PRTS' (причастие краткое) -> 'VERB' (глагол)
+'''
+pos_list = ['ADJF', 'ADJS', 'COMP', 'ADVB', 'PREP', 'GRND', 'CONJ', 'NUMR', 'PRCL', 'NPRO', 'INFN', 'PRTF', 'PRTS']
+upos_list = ['ADJ', 'ADJ', 'ADV', 'ADV', 'ADP', 'AUX', 'CCONJ', 'NUM', 'PART', 'PRON', 'VERB', 'VERB', 'VERB']
+tenses_dict = {'past': 'past', 'pres': 'pres', 'futr': 'fut'}
+
+
+def get_nlp_morph(lang):
+    if method[lang] in stanza_methods:
+        package, processors = stanza_morph[lang]
+        return get_model(method[lang], lang, processors, package=package, tokenize_pretokenized=True)
+    elif method[lang] == 'Trankit':
+        return get_model('Trankit', lang)
+    elif method[lang] == 'Spacy':
+        return get_model('Spacy', lang)
+    elif method[lang] == 'Pymorphy':
+        return get_model('Pymorphy', lang)
+
+
+def get_model_id_morph(lang):
+    # Identifier of the model of the morphological analysis for the cache keys
+    return get_model_id(method[lang], lang, stanza_morph.get(lang))
+
+
+def get_nlp_token(lang):
+    # Pymorphy works with tokens produced by Stanza
+    if method[lang] in stanza_methods + ['Pymorphy']:
+        return get_model('Stanza', lang, 'tokenize', package=stanza_packages[lang])
+    elif method[lang] == 'Trankit':
+        return get_model('Trankit', lang)
+    elif method[lang] == 'Spacy':
+        return get_model('Spacy', lang)
+
+
+def get_natasha(processors):
+    # processors: 'segmenter', 'morph_vocab' or 'morph_tagger'
+    return get_model('Natasha', 'ru', processors)
 
-def append_token(token, tokens_list):
-    if '\"' in token:
-        tokens_list = replace_symbol(token, '\"', tokens_list)
-    # chr(0x2D) = '-'
-    elif token.startswith(chr(0x2D)) or token.endswith(chr(0x2D)):
-        tokens_list = replace_symbol(token, chr(0x2D), tokens_list)
-    # chr(0x2013) = '–'
-    elif token.startswith(chr(0x2013)) or token.endswith(chr(0x2013)):
-        tokens_list = replace_symbol(token, chr(0x2013), tokens_list)
-    # chr(0x2014) = '—'
-    elif token.startswith(chr(0x2014)) or token.endswith(chr(0x2014)):
-        tokens_list = replace_symbol(token, chr(0x2014), tokens_list)
-    elif token.endswith('.'):
-        tokens_list = replace_symbol(token, '.', tokens_list)
-    elif token.endswith(':'):
-        tokens_list = replace_symbol(token, ':', tokens_list)
-    elif token.endswith('…'):
-        tokens_list = replace_symbol(token, '…', tokens_list)
-    elif token.endswith('?'):
-        tokens_list = replace_symbol(token, '?', tokens_list)
-    elif token.endswith('!'):
-        tokens_list = replace_symbol(token, '!', tokens_list)
-    elif token.startswith('('):
-        tokens_list = replace_symbol(token, '(', tokens_list)
-        if token.endswith(')'):
-            tokens_list = replace_symbol(tokens_list[-1][0], ')', tokens_list[:-1])
-    elif token.endswith(')'):
-        tokens_list = replace_symbol(token, ')', tokens_list)
-    elif token.startswith('['):
-        tokens_list = replace_symbol(token, '[', tokens_list)
-        if token.endswith(']'):
-            tokens_list = replace_symbol(tokens_list[-1][0], ']', tokens_list[:-1])
-    elif token.endswith(']'):
-        tokens_list = replace_symbol(token, ']', tokens_list)
-    elif token.startswith('{'):
-        tokens_list = replace_symbol(token, '{', tokens_list)
-        if token.endswith('}'):
-            tokens_list = replace_symbol(tokens_list[-1][0], '}', tokens_list[:-1])
-    elif token.endswith('}'):
-        tokens_list = replace_symbol(token, '}', tokens_list)
-    else:
-        tokens_list.append([token, '', '', '', -1, -1])
-    return tokens_list
+# --------------------------------------------------
 
 
 def get_tokens_stanza(doc):
-    tokens_list = []
-    for sentence in doc.sentences:
-        for token in sentence.tokens:
-            tokens_list = append_token(token.text, tokens_list)
-    return tokens_list
+    return split_tokens(token.text for sentence in doc.sentences for token in sentence.tokens)
 
 
 def get_tokens_trankit(tokens):
-    tokens_list = []
-    for token in tokens['tokens']:
-        tokens_list = append_token(token['text'], tokens_list)
-    return tokens_list
+    return split_tokens(token['text'] for token in tokens['tokens'])
 
 
 def get_tokens_spacy(doc):
-    tokens_list = []
-    for token in doc:
-        tokens_list = append_token(token.text, tokens_list)
-    return tokens_list
+    return split_tokens(token.text for token in doc)
 
 def get_tokens_natasha(doc):
-    tokens_list = []
-    doc.segment(segmenter)
-    for token in doc.tokens:
-        tokens_list = append_token(token.text, tokens_list)
-    return tokens_list
+    doc.segment(get_natasha('segmenter'))
+    return split_tokens(token.text for token in doc.tokens)
 
 def get_tokens_from_grammar(message):
     """
@@ -350,6 +225,19 @@ def get_morph_trankit(tagged_sentence, lemmatized_sentence, grammar, message_id)
     return morph_list
 
 
+def analyze_trankit(tokens, lang):
+    """
+    Tags and lemmatizes all pretokenized sentences with one call of Trankit
+
+    Returns (tagged sentences, lemmatized sentences) in the order of tokens
+    """
+    nlp = get_nlp_morph(lang)
+    if trankit_joint_call:
+        sentences = nlp(tokens)['sentences']
+        return sentences, sentences
+    return nlp.posdep(tokens)['sentences'], nlp.lemmatize(tokens)['sentences']
+
+
 def get_morph_spacy(doc, grammar, message_id):
     morph_list = []
     for i, token in enumerate(doc):
@@ -388,7 +276,7 @@ def get_morph_natasha(doc, grammar, message_id):
     morph_list = []
     for i in range(len(doc.tokens)):
         token = doc.tokens[i]
-        token.lemmatize(morph_vocab)
+        token.lemmatize(get_natasha('morph_vocab'))
         word_feats = ''
         if token.pos == 'VERB' and token.feats is not None:
             feats = ''
@@ -413,41 +301,63 @@ def get_morph_natasha(doc, grammar, message_id):
     return morph_list
 
 
+def analyze_word_pymorphy(word):
+    """
+    Returns (lemma, upos, feats) of the word form given by Pymorphy,
+    lemma is None if it is undefined, feats is None if the word has no features
+    """
+    morph = get_model('Pymorphy', 'ru').parse(word)[0]
+    upos = morph.tag.POS
+    if morph.normal_form is None:
+        return None, upos, None
+    lemma = morph.normal_form.lower().replace('ё', 'е')
+    if word in string.punctuation + '–—':
+        return lemma, 'PUNCT', None
+    elif upos is not None:
+        if upos in pos_list:
+            upos = upos_list[pos_list.index(upos)]
+
+        if upos == 'NOUN':
+            for tag in ['Surn', 'Patr', 'Name', 'Geox']:
+                if tag in morph.tag:
+                    upos = 'PROPN'
+                    break
+
+        feats = ''
+        if upos == 'VERB' and morph.tag.tense is not None:
+            feats = 'tense=' + tenses_dict.get(morph.tag.tense, morph.tag.tense)
+        elif upos == 'NOUN' and morph.tag.number is not None and morph.tag.animacy is not None:
+            feats = 'number=' + morph.tag.number + '|animacy=' + morph.tag.animacy
+        return lemma, upos, feats
+    elif sum([1 if ch.isalpha() else 0 for ch in word]) == 0 and \
+            sum([1 if ch.isdigit() else 0 for ch in word]) > 0:
+        return lemma, 'NUM', None
+    else:
+        return lemma, 'X', None
+
+
+# Analyses of word forms are shared by all messages: frequent words are parsed once
+parse_pymorphy = lru_cache(maxsize=pymorphy_cache_size)(analyze_word_pymorphy)
+
+
+def set_pymorphy_cache_size(maxsize):
+    # Replaces the cache of Pymorphy analyses with an empty one of the given size
+    global parse_pymorphy, pymorphy_cache_size
+    pymorphy_cache_size = maxsize
+    parse_pymorphy = lru_cache(maxsize=maxsize)(analyze_word_pymorphy)
+
+
+def pymorphy_cache_info():
+    # Hits, misses, maximum and current size of the cache of Pymorphy analyses
+    return parse_pymorphy.cache_info()
+
+
 def get_morph_pymorphy(grammar, message_id):
     morph_list = []
     for word in grammar:
-        morph = nlp_morph_pymorphy.parse(word[0])[0]
-        upos = morph.tag.POS
-        if morph.normal_form is not None:
-            # print('morph tag:', morph.tag)
-            lemma = morph.normal_form.lower().replace('ё', 'е')
-            if word[0] in string.punctuation + '–—':
-                morph_list.append([word[0], lemma, 'PUNCT', word[3], word[4], word[5]])
-            elif upos is not None:
-                if upos in pos_list:
-                    upos = upos_list[pos_list.index(upos)]
-                
-                if upos == 'NOUN':
-                    for tag in ['Surn', 'Patr', 'Name', 'Geox']:
-                        if tag in morph.tag:
-                            upos = 'PROPN'
-                            break
-                
-                feats = ''
-                if upos == 'VERB' and morph.tag.tense is not None:
-                    feats = 'tense='
-                    if morph.tag.tense == 'futr':
-                        feats += 'fut'
-                    else:
-                        feats += morph.tag.tense
-                elif upos == 'NOUN' and morph.tag.number is not None and morph.tag.animacy is not None:
-                    feats = 'number=' + morph.tag.number + '|animacy=' + morph.tag.animacy
-                morph_list.append([word[0], lemma, upos, feats, word[4], word[5]])
-            elif sum([1 if ch.isalpha() else 0 for ch in word[0]]) == 0 and \
-                    sum([1 if ch.isdigit() else 0 for ch in word[0]]) > 0:
-                morph_list.append([word[0], lemma, 'NUM', word[3], word[4], word[5]])
-            else:
-                morph_list.append([word[0], lemma, 'X', word[3], word[4], word[5]])
+        lemma, upos, feats = parse_pymorphy(word[0])
+        if lemma is not None:
+            morph_list.append([word[0], lemma, upos, feats if feats is not None else word[3], word[4], word[5]])
         else:
             morph_list.append([word[0], word[0].lower(), upos, word[3], word[4], word[5]])
             t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
@@ -482,7 +392,7 @@ def correct_morph(grammar, text, method_name, nlp_morph):
             if word.isupper():
                 continue
             lemma = ''
-            if method_name == 'Stanza':
+            if method_name in stanza_methods:
                 doc = nlp_morph(word)
                 lemma = doc.sentences[0].words[0].lemma
             elif method_name == 'Trankit':
@@ -492,13 +402,12 @@ def correct_morph(grammar, text, method_name, nlp_morph):
                 lemma = doc[0].lemma_
             elif method_name == 'Natasha':
                 doc_complex = Doc(word)
-                doc_complex.segment(segmenter)
-                doc_complex.tag_morph(morph_tagger)
-                doc_complex.tokens[0].lemmatize(morph_vocab)
+                doc_complex.segment(get_natasha('segmenter'))
+                doc_complex.tag_morph(get_natasha('morph_tagger'))
+                doc_complex.tokens[0].lemmatize(get_natasha('morph_vocab'))
                 lemma = doc_complex.tokens[0].lemma
             elif method_name == 'Pymorphy':
-                morph = pymorphy2.MorphAnalyzer()
-                lemma = morph.parse(word)[0].normal_form
+                lemma = parse_pymorphy(word)[0]
             if is_digit:
                 complex_new = lemma + '-' + '-'.join(complex.split('-')[1:])
             else:
@@ -515,63 +424,6 @@ def correct_morph(grammar, text, method_name, nlp_morph):
     return grammar
 
 
-def join_tokens(text, grammar):
-    # Regular expressions for
-    # Ту-204-300, Миг-29,
-    # экс-премьер-министр, премьер-министр, 2019-nCoV, 2019-2020,
-    # 5,8%, $20, О'Нил,
-    # Газета.ру, www.twitter.com,
-    # Е.Н.О.Т., д.т.н., A.B., А.
-    letter_digit_complex_patterns = [r'\pL+-\pL*[0-9]+\pL*-\pL*[0-9]+\pL*', r'\pL+-\pL*[0-9]+\pL*',
-                                     r'\pL+-\pL+-\pL+', r'\pL+-\pL+', '[0-9]+-\pL+', r'[0-9]+-[0-9]+',
-                                     r'[0-9]+,?[0-9]*%', r'\$[0-9]+,?[0-9]*', r'\p{Lu}\'\pL+',
-                                     r'\pL+\.\pL+', r'\pL+\.\pL+\.\pL+',
-                                     r'\pL\.\pL\.\pL\.\pL\.', r'\pL\.\pL\.\pL\.', r'\pL\.\pL\.', r'\p{Lu}\.']
-
-    finds = []
-    for pattern in letter_digit_complex_patterns:
-        finds.extend(re.findall(pattern, text))
-    finds = sorted(list(set(finds)), key=len, reverse=True)
-
-    tokens = [item[0] for item in grammar]
-    for elem in finds:
-        if elem not in tokens:
-            if '-' in elem:
-                complex_len = elem.count('-') * 2 + 1
-                for i in range(len(tokens) - complex_len + 1):
-                    tokens_joined = ''.join(tokens[i:i + complex_len])
-                    if tokens_joined == elem:
-                        tokens[i] = tokens_joined
-                        grammar[i][0] = tokens_joined
-                        del grammar[i + 1: i + complex_len]
-                        del tokens[i + 1: i + complex_len]
-            if '%' in elem or '$' in elem:
-                complex_len = 2
-                for i in range(len(tokens) - complex_len + 1):
-                    tokens_joined = ''.join(tokens[i:i + complex_len])
-                    if tokens_joined == elem:
-                        tokens[i] = tokens_joined
-                        grammar[i][0] = tokens_joined
-                        del grammar[i + 1: i + complex_len]
-                        del tokens[i + 1: i + complex_len]
-            elif '.' in elem:
-                complex_len = elem.count('.') * 2
-                stop = False
-                for complex_len_temp in range(complex_len, 1, -1):
-                    for i in range(len(tokens) - complex_len_temp + 1):
-                        tokens_joined = ''.join(tokens[i:i + complex_len_temp])
-                        if tokens_joined == elem:
-                            stop = True
-                            tokens[i] = tokens_joined
-                            grammar[i][0] = tokens_joined
-                            del grammar[i + 1: i + complex_len_temp]
-                            del tokens[i + 1: i + complex_len_temp]
-                    if stop:
-                        break
-
-    return grammar
-
-
 def remove_symbols_ent(lemmas_ent):
     # Remove symbols \"[]() from lemma of the entity
     for symbol in '\"[]()':
@@ -657,6 +509,293 @@ def change_ner_format(ner):
     return entities, dates
 
 
+# Lemmas of named entities which are not found in the grammar: (method, lang, entity) -> lemma
+ner_lemmas_cache = OrderedDict()
+
+
+def get_unresolved_entities(analysis):
+    """
+    Returns named entities of the sentence (or title) which have no position
+    in the grammar, so their lemmas can not be taken from the sentence
+    """
+    entities = []
+    if 'ner' not in analysis or analysis['ner'] is None:
+        return entities
+    for ner_type in analysis['ner'].keys():
+        for ent in analysis['ner'][ner_type].keys():
+            entries = analysis['ner'][ner_type][ent]['entries']
+            if len(entries) == 0 or entries[0]['start_grammar'] == -1 or entries[0]['end_grammar'] == -1:
+                entities.append(ent)
+    return entities
+
+
+def lemmatize_entities_stanza(entities, lang, message_id):
+    in_docs = [stanza.Document([], text=ent) for ent in entities]
+    docs = get_nlp_token(lang).bulk_process(in_docs)
+    grammars = [join_tokens(ent, get_tokens_stanza(doc)) for ent, doc in zip(entities, docs)]
+    # one call of the pretokenized pipeline for all entities
+    doc_ner = get_nlp_morph(lang)([[item[0] for item in grammar] for grammar in grammars])
+    return [[item[1] for item in get_morph_stanza(sentence, grammar, message_id)]
+            for sentence, grammar in zip(doc_ner.sentences, grammars)]
+
+
+def lemmatize_entities_trankit(entities, lang, message_id):
+    grammars = [join_tokens(ent, get_tokens_trankit(get_nlp_token(lang).tokenize(ent, is_sent=True)))
+                for ent in entities]
+    tagged, lemmatized = analyze_trankit([[item[0] for item in grammar] for grammar in grammars], lang)
+    return [[item[1] for item in get_morph_trankit(tagged[k], lemmatized[k], grammars[k], message_id)]
+            for k in range(len(grammars))]
+
+
+def lemmatize_entities_spacy(entities, lang, message_id):
+    grammars = [join_tokens(ent, get_tokens_spacy(doc)) for ent, doc in zip(entities, get_nlp_token(lang).pipe(entities))]
+    docs = [spacy_doc(get_nlp_morph(lang).vocab, [item[0] for item in grammar]) for grammar in grammars]
+    return [[item[1] for item in get_morph_spacy(doc, grammar, message_id)]
+            for doc, grammar in zip(pipe_spacy(get_nlp_morph(lang), docs, spacy_disable), grammars)]
+
+
+def lemmatize_entities_natasha(entities, message_id):
+    lemmas = []
+    for ent in entities:
+        doc_ner = Doc(ent)
+        doc_ner.segment(get_natasha('segmenter'))
+        doc_ner.tag_morph(get_natasha('morph_tagger'))
+        grammar_ner = [[token.text, '', '', '', -1, -1] for token in doc_ner.tokens]
+        grammar_ner = join_tokens(ent, grammar_ner)
+        lemmas.append([item[1] for item in get_morph_natasha(doc_ner, grammar_ner, message_id)])
+    return lemmas
+
+
+def lemmatize_entities_pymorphy(entities, lang, message_id):
+    in_docs = [stanza.Document([], text=ent) for ent in entities]
+    docs = get_nlp_token(lang).bulk_process(in_docs)
+    grammars = [join_tokens(ent, get_tokens_stanza(doc)) for ent, doc in zip(entities, docs)]
+    return [[item[1] for item in get_morph_pymorphy(grammar, message_id)] for grammar in grammars]
+
+
+def lemmatize_entities(entities, lang, message_id=''):
+    """
+    Lemmatizes named entities which are not found in the grammar
+
+    Repeated entities are lemmatized once; all new entities are passed
+    to the model in one call. Returns dict: entity -> lemma
+    """
+    lemmas = {}
+    entities_new = []
+    for ent in entities:
+        key = (method[lang], lang, ent)
+        if key in ner_lemmas_cache:
+            ner_lemmas_cache.move_to_end(key)
+            lemmas[ent] = ner_lemmas_cache[key]
+        elif ent not in lemmas and len(ent.strip()) > 0:
+            lemmas[ent] = None
+            entities_new.append(ent)
+        elif len(ent.strip()) == 0:
+            lemmas[ent] = ''
+    if len(entities_new) == 0:
+        return lemmas
+
+    lemmas_new = []
+    if method[lang] in stanza_methods:
+        lemmas_new = lemmatize_entities_stanza(entities_new, lang, message_id)
+    elif method[lang] == 'Trankit':
+        lemmas_new = lemmatize_entities_trankit(entities_new, lang, message_id)
+    elif method[lang] == 'Spacy':
+        lemmas_new = lemmatize_entities_spacy(entities_new, lang, message_id)
+    elif method[lang] == 'Natasha' and lang == 'ru':
+        lemmas_new = lemmatize_entities_natasha(entities_new, message_id)
+    elif method[lang] == 'Pymorphy' and lang == 'ru':
+        lemmas_new = lemmatize_entities_pymorphy(entities_new, lang, message_id)
+
+    for ent, lemmas_ent in zip(entities_new, lemmas_new):
+        lemmas[ent] = ' '.join(remove_symbols_ent(lemmas_ent))
+        ner_lemmas_cache[(method[lang], lang, ent)] = lemmas[ent]
+    while len(ner_lemmas_cache) > ner_cache_size:
+        ner_lemmas_cache.popitem(last=False)
+    return lemmas
+
+
+def process_ner(analysis, lang, message_id, ner_lemmas=None):
+    """
+    Takes analysis of one sentence (or title) with field 'ner'
+    and fills lemmas of the named entities. Lemmas of the entities not found
+    in the grammar are taken from ner_lemmas (see lemmatize_entities)
+
+    Replaces field 'ner' with fields 'entities' and 'dates'
+    """
+    if ner_lemmas is None:
+        ner_lemmas = lemmatize_entities(get_unresolved_entities(analysis), lang, message_id)
+
+    lemmas = [item[1] for item in analysis['grammar']]
+    for ner_type in analysis['ner'].keys():
+        for ent in analysis['ner'][ner_type].keys():
+            start_grammar = -1
+            end_grammar = -1
+            if len(analysis['ner'][ner_type][ent]['entries']) > 0:
+                start_grammar = analysis['ner'][ner_type][ent]['entries'][0]['start_grammar']
+                end_grammar = analysis['ner'][ner_type][ent]['entries'][0]['end_grammar']
+            if start_grammar != -1 and end_grammar != -1:
+                lemmas_ner = remove_symbols(analysis['ner'][ner_type][ent], lemmas)
+                analysis['ner'][ner_type][ent]['lemma'] = ' '.join(lemmas_ner)
+            elif ner_lemmas.get(ent) is not None:
+                analysis['ner'][ner_type][ent]['lemma'] = ner_lemmas[ent]
+
+    entities, dates = change_ner_format(analysis['ner'])
+    if len(entities.keys()) > 0:
+        analysis['entities'] = entities
+    if len(dates.keys()) > 0:
+        analysis['dates'] = dates
+    del analysis['ner']
+
+
+def morph_units(units, lang):
+    """
+    Morphological analysis of sentences and titles with one call of the model:
+    units - list of (text, analysis, message_id), field 'grammar' of the analysis is replaced
+    """
+    tokens = [[token[0] for token in analysis['grammar']] for _, analysis, _ in units]
+    if method[lang] in stanza_methods:
+        doc = get_nlp_morph(lang)(tokens)  # let pretokeinzed text to model
+        for (text, analysis, message_id), sentence in zip(units, doc.sentences):
+            grammar = get_morph_stanza(sentence, analysis['grammar'], message_id)
+            analysis['grammar'] = correct_morph(grammar, text, method[lang], get_nlp_morph(lang))
+    elif method[lang] == 'Trankit':
+        tagged_sents, lemmatized_sents = analyze_trankit(tokens, lang)
+        for (text, analysis, message_id), tagged_sent, lemmatized_sent in zip(units, tagged_sents, lemmatized_sents):
+            grammar = get_morph_trankit(tagged_sent, lemmatized_sent, analysis['grammar'], message_id)
+            analysis['grammar'] = correct_morph(grammar, text, method[lang], get_nlp_morph(lang))
+    elif method[lang] == 'Spacy':
+        nlp = get_nlp_morph(lang)
+        docs = pipe_spacy(nlp, [spacy_doc(nlp.vocab, words) for words in tokens], spacy_disable)
+        for (text, analysis, message_id), doc in zip(units, docs):
+            grammar = get_morph_spacy(doc, analysis['grammar'], message_id)
+            analysis['grammar'] = correct_morph(grammar, text, method[lang], nlp)
+    elif method[lang] == 'Natasha' and lang == 'ru':
+        for text, analysis, message_id in units:
+            doc = Doc(text)
+            doc.segment(get_natasha('segmenter'))
+            doc.tag_morph(get_natasha('morph_tagger'))
+            grammar = get_morph_natasha(doc, analysis['grammar'], message_id)
+            analysis['grammar'] = correct_morph(grammar, text, method[lang], '')
+    elif method[lang] == 'Pymorphy' and lang == 'ru':
+        for text, analysis, message_id in units:
+            grammar = get_morph_pymorphy(analysis['grammar'], message_id)
+            analysis['grammar'] = correct_morph(grammar, text, method[lang], '')
+
+
+@metrics.timed_batch('morphology', method)
+def morph_messages_spacy(messages, lang):
+    """
+    Morphological analysis of sentences and titles of many messages of one language
+    with one nlp.pipe call. Named entities are processed later by morph_message(message, tagged=True)
+    """
+    units = []
+    cache_keys = []
+    for message in messages:
+        message_id = message.get('id', '')
+        for text, analysis in get_analyses(message):
+            cache_key = cache.make_key('morphology', lang, method[lang], text, analysis['grammar'], get_model_id_morph(lang))
+            grammar_cached = cache.get(cache_key)
+            if grammar_cached is not None:
+                analysis['grammar'] = grammar_cached
+            else:
+                units.append((text, analysis, message_id))
+                cache_keys.append(cache_key)
+
+    morph_units(units, lang)
+    for (_, analysis, _), cache_key in zip(units, cache_keys):
+        cache.put(cache_key, analysis['grammar'])
+
+
+def report_error(message, message_id, function, analysis):
+    # Prints the current exception for a sentence or the title of the message and records it in the message
+    e = sys.exc_info()[1]
+    t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+    field = 'title' if analysis is message.get('title_analysis') else 'sentences'
+    print("%s Module: %s, function: %s, text ID: %s, field: %s, error: %s" %
+          (t, 'morphology', function, message_id, field, e))
+    metrics.record_error(message, 'morphology')
+
+
+@metrics.timed_message('morphology', method)
+def morph_message(message, tagged=False):
+    """
+    Adds morphological analysis to sentences and title of one message in place,
+    the title is analyzed together with the sentences;
+    if tagged is True, grammar is already analyzed and only named entities are processed
+    """
+
+    message_id = ''
+    if 'id' in message.keys():
+        message_id = message['id']
+
+    lang = message['lang']
+    analyses = [analysis for _, analysis in get_analyses(message)]
+
+    units = []
+    cache_keys = []
+    for text, analysis in get_analyses(message) if not tagged else []:
+        try:
+            cache_key = cache.make_key('morphology', lang, method[lang], text, analysis['grammar'], get_model_id_morph(lang))
+            grammar_cached = cache.get(cache_key)
+            if grammar_cached is not None:
+                analysis['grammar'] = grammar_cached
+            else:
+                # only sentences and title without cached results are analyzed by the model
+                units.append((text, analysis, message_id))
+                cache_keys.append(cache_key)
+        except:
+            report_error(message, message_id, 'morph_analysis', analysis)
+
+    # The sentences and the title are analyzed with one call of the model;
+    # if it fails, they are analyzed one by one, so that one text can not break the others
+    analyzed = [True for _ in units]
+    if len(units) > 0:
+        grammars = [analysis['grammar'] for _, analysis, _ in units]
+        try:
+            morph_units(units, lang)
+        except:
+            for i, (unit, grammar) in enumerate(zip(units, grammars)):
+                unit[1]['grammar'] = grammar
+                try:
+                    morph_units([unit], lang)
+                except:
+                    unit[1]['grammar'] = grammar
+                    analyzed[i] = False
+                    report_error(message, message_id, 'morph_analysis', unit[1])
+    for (_, analysis, _), cache_key, analyzed_unit in zip(units, cache_keys, analyzed):
+        if analyzed_unit:
+            try:
+                cache.put(cache_key, analysis['grammar'])
+            except:
+                report_error(message, message_id, 'morph_analysis', analysis)
+
+    # Entities of all sentences and the title are lemmatized together;
+    # if it fails, every sentence and the title lemmatize their entities separately
+    try:
+        entities = []
+        for analysis in analyses:
+            entities.extend(get_unresolved_entities(analysis))
+        ner_lemmas = lemmatize_entities(entities, lang, message_id)
+    except:
+        ner_lemmas = None
+    for analysis in analyses:
+        try:
+            if 'ner' in analysis and analysis['ner'] is not None:
+                process_ner(analysis, lang, message_id, ner_lemmas)
+        except:
+            report_error(message, message_id, 'morph_analysis', analysis)
+
+    try:
+        calc_ner_weight(message)
+    except:
+        e = sys.exc_info()[1]
+        t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+        print("%s Module: %s, function: %s, text ID: %s, error: %s" %
+              (t, 'morphology', 'calc_ner_weight', message_id, e))
+        metrics.record_error(message, 'morphology')
+
+
 def morph_analysis(messages):
     """ Функция морфологического анализа входных сообщений.
     
@@ -692,215 +831,30 @@ def morph_analysis(messages):
 
     messages_new = copy.deepcopy(messages)
 
+    messages_valid = []
     for message in messages_new:
-        message_id = ''
-        if 'id' in message.keys():
-            message_id = message['id']
         if 'lang' not in message or 'sentences' not in message or len(message['sentences']) == 0:
-            break
-
-        sentences = message['sentences']
+            continue
+        messages_valid.append(message)
+
+    # spaCy: sentences and titles of all messages of a language are piped together
+    messages_spacy = {}
+    for message in messages_valid:
+        if method.get(message['lang']) == 'Spacy':
+            messages_spacy.setdefault(message['lang'], []).append(message)
+    tagged = set()
+    for lang, messages_lang in messages_spacy.items():
         try:
-            tokens = get_tokens_from_grammar(message)
-            if method[message['lang']] == 'Stanza':
-                doc = nlp_morph[message['lang']](tokens) # let pretokeinzed text to model
-                for i in range(len(sentences)):
-                    grammar = get_morph_stanza(doc.sentences[i], sentences[i]['grammar'], message_id)
-                    sentences[i]['grammar'] = correct_morph(grammar, sentences[i]['text'],
-                                                            method[message['lang']], nlp_morph[message['lang']])
-            elif method[message['lang']] == 'Trankit':
-                for i in range(len(sentences)):
-                    tagged_sent = nlp_morph[message['lang']].posdep(tokens[i], is_sent=True)
-                    lemmatized_sent = nlp_morph[message['lang']].lemmatize(tokens[i], is_sent=True)
-                    grammar = get_morph_trankit(tagged_sent, lemmatized_sent, sentences[i]['grammar'], message_id)
-                    sentences[i]['grammar'] = correct_morph(grammar, sentences[i]['text'],
-                                                            method[message['lang']], nlp_morph[message['lang']])
-            elif method[message['lang']] == 'Spacy':
-                docs = [spacy_doc(nlp_morph[message['lang']].vocab, tokens[i]) for i in range(len(tokens))]
-                docs = nlp_morph[message['lang']].pipe(docs)
-                for i, doc in enumerate(docs):
-                    grammar = get_morph_spacy(doc, sentences[i]['grammar'], message_id)
-                    sentences[i]['grammar'] = correct_morph(grammar, sentences[i]['text'],
-                                                            method[message['lang']], nlp_morph[message['lang']])
-            elif method[message['lang']] == 'Natasha' and message['lang'] == 'ru':
-                for i in range(len(sentences)):
-                    doc = Doc(sentences[i]['text'])
-                    doc.segment(segmenter)
-                    doc.tag_morph(morph_tagger)
-                    grammar = get_morph_natasha(doc, sentences[i]['grammar'], message_id)
-                    sentences[i]['grammar'] = correct_morph(grammar, sentences[i]['text'],
-                                                            method[message['lang']], '')
-            elif method[message['lang']] == 'Pymorphy' and message['lang'] == 'ru':
-                for i in range(len(sentences)):
-                    grammar = get_morph_pymorphy(sentences[i]['grammar'], message_id)
-                    sentences[i]['grammar'] = correct_morph(grammar, sentences[i]['text'],
-                                                            method[message['lang']], '')
-            for i in range(len(sentences)):
-                if 'ner' in sentences[i]:
-                    for ner_type in sentences[i]['ner'].keys():
-                        for ent in sentences[i]['ner'][ner_type].keys():
-                            lemmas = [item[1] for item in sentences[i]['grammar']]
-
-                            start_grammar = -1
-                            end_grammar = -1
-                            if len(sentences[i]['ner'][ner_type][ent]['entries']) > 0:
-                                start_grammar = sentences[i]['ner'][ner_type][ent]['entries'][0]['start_grammar']
-                                end_grammar = sentences[i]['ner'][ner_type][ent]['entries'][0]['end_grammar']
-                            if start_grammar != -1 and end_grammar != -1:
-                                lemmas_ner = remove_symbols(sentences[i]['ner'][ner_type][ent], lemmas)
-                                sentences[i]['ner'][ner_type][ent]['lemma'] = ' '.join(lemmas_ner)
-                            else:
-                                if method[message['lang']] == 'Stanza':
-                                    grammar_ner = get_tokens_stanza(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(sentences[i]['text'], grammar_ner)
-                                    tokens_ner = [item[0] for item in grammar_ner]
-                                    doc_ner = nlp_morph[message['lang']]([tokens_ner])
-                                    lemmas_ner = [item[1] for item in get_morph_stanza(doc_ner.sentences[0], grammar_ner, message_id)]
-                                    sentences[i]['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Trankit':
-                                    grammar_ner = get_tokens_trankit(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(sentences[i]['text'], grammar_ner)
-                                    tokens_ner = [item[0] for item in grammar_ner]
-                                    doc_ner = nlp_morph[message['lang']]([tokens_ner])
-                                    lemmas_ner = [item[1] for item in get_morph_trankit(doc_ner['tokens'], grammar_ner, message_id)]
-                                    sentences[i]['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Spacy':
-                                    grammar_ner = get_tokens_spacy(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(sentences[i]['text'], grammar_ner)
-                                    tokens_ner = [item[0] for item in grammar_ner]
-                                    doc_ner = spacy_doc(nlp_morph[message['lang']].vocab, tokens_ner)
-                                    doc_ner = nlp_morph[message['lang']](doc_ner)
-                                    lemmas_ner = [item[1] for item in get_morph_spacy(doc_ner, grammar_ner, message_id)]
-                                    sentences[i]['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Natasha' and message['lang'] == 'ru':
-                                    doc_ner = Doc(ent)
-                                    doc_ner.segment(segmenter)
-                                    doc_ner.tag_morph(morph_tagger)
-                                    grammar_ner = [[token.text, '', '', '', -1, -1] for token in doc_ner.tokens]
-                                    grammar_ner = join_tokens(sentences[i]['text'], grammar_ner)
-                                    lemmas_ner = [item[1] for item in get_morph_natasha(doc_ner, grammar_ner, message_id)]
-                                    sentences[i]['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Pymorphy' and message['lang'] == 'ru':
-                                    grammar_ner = get_tokens_stanza(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(sentences[i]['text'], grammar_ner)
-                                    lemmas_ner = [item[1] for item in get_morph_pymorphy(grammar_ner, message_id)]
-                                    sentences[i]['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-
-                    entities, dates = change_ner_format(sentences[i]['ner'])
-                    if len(entities.keys()) > 0:
-                        sentences[i]['entities'] = entities
-                    if len(dates.keys()) > 0:
-                        sentences[i]['dates'] = dates
-                    del sentences[i]['ner']
+            morph_messages_spacy(messages_lang, lang)
+            tagged.update(id(message) for message in messages_lang)
         except:
+            # messages are analyzed one by one
             e = sys.exc_info()[1]
             t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-            print("%s Module: %s, function: %s, text ID: %s, field: %s, error: %s" %
-                  (t, 'morphology', 'morph_analysis', message_id, 'sentences', e))
+            print("%s Module: %s, function: %s, lang: %s, error: %s" %
+                  (t, 'morphology', 'morph_messages_spacy', lang, e))
 
-        if 'title_analysis' in message:
-            try:
-                title_analysis = message['title_analysis']
-                list_sentences = [{'text': message['title'], 'grammar': title_analysis['grammar']}]
-                custom_message = {'sentences': list_sentences}
-                tokens = get_tokens_from_grammar(custom_message)
-                if method[message['lang']] == 'Stanza':
-                    doc = nlp_morph[message['lang']](tokens)  # let pretokeinzed text to model
-                    grammar = get_morph_stanza(doc.sentences[0], title_analysis['grammar'], message_id)
-                    title_analysis['grammar'] = correct_morph(grammar, message['title'],
-                                                              method[message['lang']], nlp_morph[message['lang']])
-                elif method[message['lang']] == 'Trankit':
-                    tagged_sent = nlp_morph[message['lang']].posdep(tokens[0], is_sent=True)
-                    lemmatized_sent = nlp_morph[message['lang']].lemmatize(tokens[0], is_sent=True)
-                    grammar = get_morph_trankit(tagged_sent, lemmatized_sent, title_analysis['grammar'], message_id)
-                    title_analysis['grammar'] = correct_morph(grammar, message['title'],
-                                                              method[message['lang']], nlp_morph[message['lang']])
-                elif method[message['lang']] == 'Spacy':
-                    doc = spacy_doc(nlp_morph[message['lang']].vocab, tokens[0])
-                    doc = nlp_morph[message['lang']](doc)
-                    grammar = get_morph_spacy(doc, title_analysis['grammar'], message_id)
-                    title_analysis['grammar'] = correct_morph(grammar, message['title'],
-                                                              method[message['lang']], nlp_morph[message['lang']])
-                elif method[message['lang']] == 'Natasha' and message['lang'] == 'ru':
-                    doc = Doc(message['title'])
-                    doc.segment(segmenter)
-                    doc.tag_morph(morph_tagger)
-                    grammar = get_morph_natasha(doc, title_analysis['grammar'], message_id)
-                    title_analysis['grammar'] = correct_morph(grammar, message['title'],
-                                                              method[message['lang']], '')
-                elif method[message['lang']] == 'Pymorphy' and message['lang'] == 'ru':
-                    grammar = get_morph_pymorphy(title_analysis['grammar'], message_id)
-                    title_analysis['grammar'] = correct_morph(grammar, message['title'],
-                                                              method[message['lang']], '')
-
-                if 'ner' in title_analysis and title_analysis['ner'] is not None:
-                    for ner_type in title_analysis['ner'].keys():
-                        for ent in title_analysis['ner'][ner_type].keys():
-                            lemmas = [item[1] for item in title_analysis['grammar']]
-
-                            start_grammar = -1
-                            end_grammar = -1
-                            if len(title_analysis['ner'][ner_type][ent]['entries']) > 0:
-                                start_grammar = title_analysis['ner'][ner_type][ent]['entries'][0]['start_grammar']
-                                end_grammar = title_analysis['ner'][ner_type][ent]['entries'][0]['end_grammar']
-                            if start_grammar != -1 and end_grammar != -1:
-                                lemmas_ner = remove_symbols(title_analysis['ner'][ner_type][ent], lemmas)
-                                title_analysis['ner'][ner_type][ent]['lemma'] = ' '.join(lemmas_ner)
-                            else:
-                                if method[message['lang']] == 'Stanza':
-                                    grammar_ner = get_tokens_stanza(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(message['title'], grammar_ner)
-                                    tokens_ner = [item[0] for item in grammar_ner]
-                                    doc_ner = nlp_morph[message['lang']]([tokens_ner])
-                                    lemmas_ner = [item[1] for item in get_morph_stanza(doc_ner.sentences[0], grammar_ner, message_id)]
-                                    title_analysis['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Trankit':
-                                    grammar_ner = get_tokens_trankit(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(message['title'], grammar_ner)
-                                    tokens_ner = [item[0] for item in grammar_ner]
-                                    doc_ner = nlp_morph[message['lang']]([tokens_ner])
-                                    lemmas_ner = [item[1] for item in get_morph_trankit(doc_ner['tokens'], grammar_ner, message_id)]
-                                    title_analysis['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Spacy':
-                                    grammar_ner = get_tokens_spacy(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(message['title'], grammar_ner)
-                                    tokens_ner = [item[0] for item in grammar_ner]
-                                    doc_ner = spacy_doc(nlp_morph[message['lang']].vocab, tokens_ner)
-                                    doc_ner = nlp_morph[message['lang']](doc_ner)
-                                    lemmas_ner = [item[1] for item in get_morph_spacy(doc_ner['tokens'], grammar_ner, message_id)]
-                                    title_analysis['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Natasha' and message['lang'] == 'ru':
-                                    doc_ner = Doc(ent)
-                                    doc_ner.segment(segmenter)
-                                    doc_ner.tag_morph(morph_tagger)
-                                    grammar_ner = [[token.text, '', '', '', -1, -1] for token in doc_ner.tokens]
-                                    grammar_ner = join_tokens(message['title'], grammar_ner)
-                                    lemmas_ner = [item[1] for item in get_morph_natasha(doc_ner, grammar_ner, message_id)]
-                                    title_analysis['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-                                elif method[message['lang']] == 'Pymorphy' and message['lang'] == 'ru':
-                                    grammar_ner = get_tokens_stanza(nlp_token[message['lang']](ent))
-                                    grammar_ner = join_tokens(message['title'], grammar_ner)
-                                    lemmas_ner = [item[1] for item in get_morph_pymorphy(grammar_ner, message_id)]
-                                    title_analysis['ner'][ner_type][ent]['lemma'] = ' '.join(remove_symbols_ent(lemmas_ner))
-
-                    entities, dates = change_ner_format(title_analysis['ner'])
-                    if len(entities.keys()) > 0:
-                        title_analysis['entities'] = entities
-                    if len(dates.keys()) > 0:
-                        title_analysis['dates'] = dates
-                    del title_analysis['ner']
-            except:
-                e = sys.exc_info()[1]
-                t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-                print("%s Module: %s, function: %s, text ID: %s, field: %s, error: %s" %
-                      (t, 'morphology', 'morph_analysis', message_id, 'title_analysis', e))
-
-        try:
-            calc_ner_weight(message)
-        except:
-            e = sys.exc_info()[1]
-            t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-            print("%s Module: %s, function: %s, text ID: %s, error: %s" %
-                  (t, 'morphology', 'calc_ner_weight', message_id, e))
+    for message in messages_valid:
+        morph_message(message, tagged=id(message) in tagged)
 
     return messages_new
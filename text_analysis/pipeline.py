@@ -0,0 +1,215 @@
+from datetime import datetime
+from spacy.tokens import Doc as spacy_doc
+import copy
+import sys
+
+from . import langid
+from . import segmentation
+from . import tokenization
+from . import morphology
+from . import syntax
+from . import cache
+from . import metrics
+from .grammar import get_analyses, pack_messages
+from .registry import pipe_spacy, stanza_methods
+
+# ---------------- SETTINGS SECTION ----------------
+
+# Stages of the analysis in the order of execution
+all_stages = ['langid', 'segmentation', 'tokenization', 'morphology', 'syntax']
+
+# Methods for which morphology and syntax are computed by one model pass
+fused_methods = ['Stanza', 'StanzaQuantized', 'Spacy', 'Trankit']
+
+# Components of spaCy models which are not needed for morphology and syntax
+spacy_disable = ['ner']
+
+# --------------------------------------------------
+
+
+def is_fused(lang):
+    return lang in morphology.method and lang in syntax.method \
+        and morphology.method[lang] == syntax.method[lang] and morphology.method[lang] in fused_methods
+
+
+def fill_syntax(grammar, word_ids, head_ids):
+    for j in range(len(grammar)):
+        grammar[j][4] = word_ids[j]
+        grammar[j][5] = head_ids[j]
+    return grammar
+
+
+def analyze_stanza(units, lang):
+    nlp = syntax.get_nlp_syntax(lang)
+    doc = nlp([[token[0] for token in analysis['grammar']] for _, analysis, _ in units])  # let pretokeinzed text to model
+    for k, (text, analysis, message_id) in enumerate(units):
+        sentence = doc.sentences[k]
+        grammar = morphology.get_morph_stanza(sentence, analysis['grammar'], message_id)
+        grammar = morphology.correct_morph(grammar, text, 'Stanza', nlp)
+        analysis['grammar'] = fill_syntax(grammar, [word.id for word in sentence.words],
+                                          [word.head for word in sentence.words])
+
+
+def analyze_spacy(units, lang):
+    nlp = syntax.get_nlp_syntax(lang)
+    docs = [spacy_doc(nlp.vocab, [token[0] for token in analysis['grammar']]) for _, analysis, _ in units]
+    docs = pipe_spacy(nlp, docs, spacy_disable)  # let pretokeinzed text to model
+    for (text, analysis, message_id), doc in zip(units, docs):
+        grammar = morphology.get_morph_spacy(doc, analysis['grammar'], message_id)
+        grammar = morphology.correct_morph(grammar, text, 'Spacy', nlp)
+        head_ids = [token.head.i + 1 if token.i != token.head.i else 0 for token in doc]
+        analysis['grammar'] = fill_syntax(grammar, [token.i + 1 for token in doc], head_ids)
+
+
+def analyze_trankit(units, lang):
+    # Tags, lemmas and heads of all sentences are taken from one pass of the model
+    tagged_sents, lemmatized_sents = morphology.analyze_trankit(
+        [[token[0] for token in analysis['grammar']] for _, analysis, _ in units], lang)
+    for k, (text, analysis, message_id) in enumerate(units):
+        grammar = morphology.get_morph_trankit(tagged_sents[k], lemmatized_sents[k], analysis['grammar'], message_id)
+        grammar = morphology.correct_morph(grammar, text, 'Trankit', morphology.get_nlp_morph(lang))
+        analysis['grammar'] = fill_syntax(grammar, [token['id'] for token in tagged_sents[k]['tokens']],
+                                          [token['head'] for token in tagged_sents[k]['tokens']])
+
+
+def finish_morph(message, ner_lemmas=None):
+    message_id = message.get('id', '')
+    for _, analysis in get_analyses(message):
+        if 'ner' in analysis and analysis['ner'] is not None:
+            morphology.process_ner(analysis, message['lang'], message_id, ner_lemmas)
+    morphology.calc_ner_weight(message)
+
+
+@metrics.timed_batch('morphology,syntax', morphology.method)
+def analyze_fused(messages, lang):
+    """
+    Morphological and syntax analysis of all sentences and titles
+    of the messages (of one language) with one model call
+    """
+    units = []
+    cache_keys = []
+    for message in messages:
+        message_id = message.get('id', '')
+        for text, analysis in get_analyses(message):
+            cache_key = cache.make_key('morphology,syntax', lang, morphology.method[lang], text, analysis['grammar'],
+                                       syntax.get_model_id_syntax(lang))
+            grammar_cached = cache.get(cache_key)
+            if grammar_cached is not None:
+                analysis['grammar'] = grammar_cached
+            else:
+                units.append((text, analysis, message_id))
+                cache_keys.append(cache_key)
+
+    if len(units) > 0:
+        if morphology.method[lang] in stanza_methods:
+            analyze_stanza(units, lang)
+        elif morphology.method[lang] == 'Spacy':
+            analyze_spacy(units, lang)
+        elif morphology.method[lang] == 'Trankit':
+            analyze_trankit(units, lang)
+        for (_, analysis, _), cache_key in zip(units, cache_keys):
+            cache.put(cache_key, analysis['grammar'])
+
+    # Entities which are not found in the grammar are lemmatized together for all messages
+    try:
+        entities = []
+        for message in messages:
+            for _, analysis in get_analyses(message):
+                entities.extend(morphology.get_unresolved_entities(analysis))
+        ner_lemmas = morphology.lemmatize_entities(entities, lang)
+    except:
+        # every message lemmatizes its entities separately
+        ner_lemmas = None
+
+    for message in messages:
+        try:
+            finish_morph(message, ner_lemmas)
+        except:
+            e = sys.exc_info()[1]
+            t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+            print("%s Module: %s, function: %s, text ID: %s, error: %s" %
+                  (t, 'pipeline', 'analyze', message.get('id', ''), e))
+            metrics.record_error(message, 'morphology')
+
+
+def analyze_grammar(messages, stages):
+    # Group messages by language, so that one model call is made per language
+    messages_by_lang = langid.group_by_lang(message for message in messages if len(message.get('sentences', [])) > 0)
+
+    for lang, messages_lang in messages_by_lang.items():
+        if 'morphology' in stages and 'syntax' in stages and is_fused(lang):
+            try:
+                analyze_fused(messages_lang, lang)
+                continue
+            except:
+                e = sys.exc_info()[1]
+                t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+                print("%s Module: %s, function: %s, lang: %s, error: %s" % (t, 'pipeline', 'analyze_fused', lang, e))
+        # Fall back to the separate stages
+        if 'morphology' in stages:
+            for message in messages_lang:
+                morphology.morph_message(message)
+        if 'syntax' in stages:
+            if syntax.method.get(lang) in syntax.batch_methods:
+                try:
+                    syntax.syntax_messages_batch(messages_lang, lang)
+                    continue
+                except:
+                    e = sys.exc_info()[1]
+                    t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+                    print("%s Module: %s, function: %s, lang: %s, error: %s" %
+                          (t, 'pipeline', 'syntax_messages_batch', lang, e))
+            for message in messages_lang:
+                syntax.syntax_message(message)
+
+
+def analyze(messages, stages=None, min_sent_len=3, compact=False):
+    """ Функция анализа входных сообщений за один проход.
+
+    Заменяет последовательный вызов функций `language_identification`, `segmentation`, `tokenization`, `morph_analysis`
+    и `syntax_analysis`:
+    сообщения копируются один раз, после чего все этапы заполняют поля сообщений на месте. Если для языка
+    морфологический и синтаксический анализ выполняются одной библиотекой (Stanza, spaCy или Trankit), то оба этапа
+    выполняются одним вызовом модели для всех предложений и заголовков сообщений этого языка.
+
+    :param messages: список входных сообщений в формате JSON (dict). Каждое сообщение содержит поле `text`; `title` - опционально;
+        `lang` - опционально, если выполняется этап `langid` (см. `text_analysis.langid`).
+    :param stages: список этапов анализа из `all_stages` (по умолчанию - все этапы).
+    :param min_sent_len: минимальное количество слов в предложении (см. `segmentation`).
+    :param compact: если True, токены поля `grammar` возвращаются в компактном виде (`text_analysis.grammar.Token`);
+        для сериализации в JSON используется `text_analysis.grammar.unpack_messages`.
+
+    :return:
+        список входных сообщений с результатами анализа - поля `sentences` и `title_analysis`, аналогичные результатам функций отдельных этапов.
+
+    """
+
+    if stages is None:
+        stages = all_stages
+
+    messages_new = copy.deepcopy(messages)
+
+    if 'langid' in stages:
+        langid.detect_messages(messages_new)
+
+    if 'segmentation' in stages:
+        sentences_by_index = segmentation.find_sentences(messages_new, min_sent_len)
+        messages_segmented = []
+        for i in range(len(messages_new)):
+            if i in sentences_by_index and len(sentences_by_index[i]) > 0:
+                messages_new[i]['sentences'] = sentences_by_index[i]
+                messages_segmented.append(messages_new[i])
+        messages_new = messages_segmented
+
+    if 'tokenization' in stages:
+        for messages_lang in langid.group_by_lang(messages_new).values():
+            for message in messages_lang:
+                tokenization.tokenize_message(message)
+
+    if 'morphology' in stages or 'syntax' in stages:
+        analyze_grammar(messages_new, stages)
+
+    if compact:
+        pack_messages(messages_new)
+
+    return messages_new
@@ -0,0 +1,269 @@
+from collections import OrderedDict
+import threading
+import time
+import gc
+import os
+
+from . import metrics
+
+# ---------------- SETTINGS SECTION ----------------
+
+# Memory budget for all loaded models, in megabytes (None - no limit).
+# Least recently used models are unloaded when the budget is exceeded
+memory_budget_mb = None
+
+# Models which have not been used for this number of seconds are unloaded (None - never)
+max_idle_seconds = None
+
+# Default Stanza packages for tokenization
+stanza_packages = {
+    'en': 'ewt',
+    'ru': 'gsd',
+    'es': 'gsd',
+    'fr': 'gsd',
+    'de': 'gsd',
+    'uk': 'iu',
+    'tr': 'imst',
+    'ar': 'padt'
+}
+
+trankit_languages = {
+    'en': 'english',
+    'ru': 'russian',
+    'es': 'spanish',
+    'fr': 'french',
+    'de': 'german',
+    'uk': 'ukrainian',
+    'tr': 'turkish',
+    'ar': 'arabic'
+}
+
+spacy_models = {
+    'en': 'en_core_web_sm',
+    'ru': 'ru_core_news_sm',
+    'es': 'es_core_news_sm',
+    'fr': 'fr_core_news_sm',
+    'de': 'de_core_news_sm',
+    'uk': 'uk_core_news_sm',
+    'tr': 'xx_ent_wiki_sm',
+    'ar': 'xx_ent_wiki_sm'
+}
+
+# spaCy: number of documents in one batch and number of processes of nlp.pipe
+spacy_batch_size = 256
+spacy_n_process = 1
+
+# 'StanzaQuantized' backend: Stanza on CPU with weights of the networks of these processors
+# quantized to int8 (torch dynamic quantization of the layers below)
+stanza_quantized_processors = ['pos', 'lemma', 'depparse']
+stanza_quantized_layers = ['Linear', 'LSTM']
+
+# --------------------------------------------------
+
+# Backends which run Stanza pipelines
+stanza_methods = ['Stanza', 'StanzaQuantized']
+
+
+def load_stanza(lang, processors, **kwargs):
+    import stanza
+    return stanza.Pipeline(lang=lang, processors=processors, **kwargs)
+
+
+def load_stanza_quantized(lang, processors, **kwargs):
+    import stanza
+    import torch
+    nlp = stanza.Pipeline(lang=lang, processors=processors, use_gpu=False, **kwargs)
+    layers = {getattr(torch.nn, name) for name in stanza_quantized_layers}
+    for name, processor in nlp.processors.items():
+        # lemmatizers without a seq2seq model (dictionary only) have no network to quantize
+        trainer = getattr(processor, '_trainer', None)
+        if name in stanza_quantized_processors and getattr(trainer, 'model', None) is not None:
+            trainer.model = torch.quantization.quantize_dynamic(trainer.model, layers, dtype=torch.qint8)
+    return nlp
+
+
+def load_trankit(lang, processors, **kwargs):
+    import trankit
+    return trankit.Pipeline(lang=trankit_languages[lang], **kwargs)
+
+
+def load_spacy(lang, processors, **kwargs):
+    import spacy
+    spacy.prefer_gpu()
+    nlp = spacy.load(spacy_models[lang])
+    # Multilingual model has no parser, so sentences are split by rules
+    if 'parser' not in nlp.pipe_names and 'senter' not in nlp.pipe_names:
+        nlp.add_pipe('sentencizer')
+    return nlp
+
+
+def pipe_spacy(nlp, docs, disable=()):
+    """
+    Runs spaCy pipeline on the documents with spacy_batch_size and spacy_n_process,
+    components from disable (if the model has them) are not run
+    """
+    disable = [name for name in disable if name in nlp.pipe_names]
+    return nlp.pipe(docs, batch_size=spacy_batch_size, n_process=spacy_n_process, disable=disable)
+
+
+def load_natasha(lang, processors, model_path='models', **kwargs):
+    if processors == 'segmenter':
+        from natasha import Segmenter
+        return Segmenter()
+    elif processors == 'morph_vocab':
+        from natasha import MorphVocab
+        return MorphVocab()
+    elif processors == 'morph_tagger':
+        from natasha import NewsEmbedding, NewsMorphTagger
+        return NewsMorphTagger(NewsEmbedding())
+    elif processors == 'syntax':
+        from navec import Navec
+        from slovnet import Syntax
+        navec = Navec.load(os.path.join(model_path, 'navec_news_v1_1B_250K_300d_100q.tar'))
+        nlp_syntax_natasha = Syntax.load(os.path.join(model_path, 'slovnet_syntax_news_v1.tar'), **kwargs)
+        nlp_syntax_natasha.navec(navec)
+        return nlp_syntax_natasha
+    raise ValueError('Unknown Natasha processor: %s' % processors)
+
+
+def load_pymorphy(lang, processors, **kwargs):
+    import pymorphy2
+    return pymorphy2.MorphAnalyzer(lang=lang)
+
+
+def load_fasttext(lang, processors, model_path=None, **kwargs):
+    import fasttext
+    return fasttext.load_model(model_path)
+
+
+loaders = {
+    'Stanza': load_stanza,
+    'StanzaQuantized': load_stanza_quantized,
+    'Trankit': load_trankit,
+    'Spacy': load_spacy,
+    'Natasha': load_natasha,
+    'Pymorphy': load_pymorphy,
+    'FastText': load_fasttext
+}
+
+
+def current_rss():
+    # Resident set size of the process in bytes (0 if it can not be measured)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class ModelRegistry:
+    """
+    Thread-safe registry of models shared by all text_analysis modules.
+
+    A model is identified by (backend, lang, processors, loader arguments);
+    it is loaded the first time it is requested and then reused.
+    """
+
+    def __init__(self, memory_budget_mb=None, max_idle_seconds=None):
+        self.memory_budget_mb = memory_budget_mb
+        self.max_idle_seconds = max_idle_seconds
+        self._models = OrderedDict()  # key -> {'model', 'size', 'last_used'}, least recently used first
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, backend, lang, processors='', **kwargs):
+        key = (backend, lang, processors, tuple(sorted(kwargs.items())))
+        with self._lock:
+            model = self._touch(key)
+            if model is not None:
+                return model
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model, other models may be loaded concurrently
+        with key_lock:
+            with self._lock:
+                model = self._touch(key)
+                if model is not None:
+                    return model
+            rss_before = current_rss()
+            with metrics.timer('text_analysis_model_load_seconds', backend=backend, lang=lang, processors=processors):
+                model = loaders[backend](lang, processors, **kwargs)
+            size = max(current_rss() - rss_before, 0)
+            with self._lock:
+                self._models[key] = {'model': model, 'size': size, 'last_used': time.monotonic()}
+                self._evict(key)
+        return model
+
+    def _touch(self, key):
+        entry = self._models.get(key)
+        if entry is None:
+            return None
+        entry['last_used'] = time.monotonic()
+        self._models.move_to_end(key)
+        return entry['model']
+
+    def _evict(self, keep_key):
+        evicted = False
+        if self.max_idle_seconds is not None:
+            now = time.monotonic()
+            for key in list(self._models.keys()):
+                if key != keep_key and now - self._models[key]['last_used'] > self.max_idle_seconds:
+                    del self._models[key]
+                    evicted = True
+        if self.memory_budget_mb is not None:
+            budget = self.memory_budget_mb * 1024 * 1024
+            for key in list(self._models.keys()):
+                if self.memory_size() <= budget:
+                    break
+                if key != keep_key:
+                    del self._models[key]
+                    evicted = True
+        if evicted:
+            gc.collect()
+
+    def memory_size(self):
+        return sum(entry['size'] for entry in self._models.values())
+
+    def loaded(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    def unload(self, backend=None, lang=None):
+        with self._lock:
+            for key in list(self._models.keys()):
+                if (backend is None or key[0] == backend) and (lang is None or key[1] == lang):
+                    del self._models[key]
+        gc.collect()
+
+
+registry = ModelRegistry(memory_budget_mb, max_idle_seconds)
+
+
+def get_model(backend, lang, processors='', **kwargs):
+    """
+    Returns model of the backend ('Stanza', 'StanzaQuantized', 'Trankit', 'Spacy', 'Natasha', 'Pymorphy', 'FastText')
+    for the language, loading it on the first request
+    """
+    return registry.get(backend, lang, processors, **kwargs)
+
+
+def configure(memory_budget_mb=None, max_idle_seconds=None):
+    registry.memory_budget_mb = memory_budget_mb
+    registry.max_idle_seconds = max_idle_seconds
+
+
+def get_model_id(backend, lang, stanza_model=None, model_path=None):
+    """
+    Identifier of the model of the backend for the language, which is a part of the cache keys:
+    Stanza package and processors (stanza_model), spaCy model name, Trankit language or path to the models
+    """
+    if backend in stanza_methods and stanza_model is not None:
+        model_id = '%s:%s' % tuple(stanza_model)
+        if backend == 'StanzaQuantized':
+            model_id += ':int8:%s:%s' % (','.join(stanza_quantized_processors), ','.join(stanza_quantized_layers))
+        return model_id
+    elif backend == 'Spacy':
+        return spacy_models.get(lang, '')
+    elif backend == 'Trankit':
+        return trankit_languages.get(lang, '')
+    return model_path or ''
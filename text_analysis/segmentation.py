@@ -3,32 +3,22 @@ from datetime import datetime
 import stanza
 import string
 import copy
-import trankit
-import spacy
 import sys
 
-from natasha import (
-    Segmenter,
-    Doc
-)
+from natasha import Doc
 
+from .registry import get_model, stanza_packages
+from . import metrics
 
-# ---------------- SETTINGS SECTION ----------------
 
-# set True if you need to use model for specific language
-need_load_model_ru = True
-need_load_model_en = False
-need_load_model_es = False
-need_load_model_fr = False
-need_load_model_de = False
-need_load_model_uk = False
-need_load_model_tr = False
-need_load_model_ar = False
+# ---------------- SETTINGS SECTION ----------------
 
-# --------------- LOAD MODELS ----------------
+# Number of messages of the same language passed to the model in one call
+default_batch_size = 64
 
-nlp_token = {}
+# --------------- MODELS ----------------
 
+# Models are loaded on the first request through the shared registry
 method = {
     'en': 'Stanza',
     'ru': 'Stanza',
@@ -40,115 +30,74 @@ method = {
     'ar': 'Stanza'
 }
 
-if need_load_model_en:
-    if method['en'] == 'Stanza':
-        nlp_token['en'] = stanza.Pipeline(lang="en", package='ewt', processors='tokenize')
-    elif method['en'] == 'Trankit':
-        nlp_token['en'] = trankit.Pipeline(lang='english', embedding='xlm-roberta-large', gpu=True)
-    elif method['en'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['en'] = spacy.load("en_core_web_sm")
-
-if need_load_model_ru:
-    if method['ru'] == 'Stanza':
-        nlp_token['ru'] = stanza.Pipeline(lang="ru", package='gsd', processors='tokenize')
-    elif method['ru'] == 'Trankit':
-        nlp_token['ru'] = trankit.Pipeline(lang='russian', embedding='xlm-roberta-large', gpu=True)
-    elif method['ru'] == 'Natasha':
-        segmenter = Segmenter()
-
-if need_load_model_es:
-    if method['es'] == 'Stanza':
-        nlp_token['es'] = stanza.Pipeline(lang="es", package='gsd', processors='tokenize')
-    elif method['es'] == 'Trankit':
-        nlp_token['es'] = trankit.Pipeline(lang='spanish', embedding='xlm-roberta-large', gpu=True)
-    elif method['es'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['es'] = spacy.load("es_core_news_sm")
-
-if need_load_model_fr:
-    if method['fr'] == 'Stanza':
-        nlp_token['fr'] = stanza.Pipeline(lang="fr", package='gsd', processors='tokenize')
-    elif method['fr'] == 'Trankit':
-        nlp_token['fr'] = trankit.Pipeline(lang='french', embedding='xlm-roberta-large', gpu=True)
-    elif method['fr'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['fr'] = spacy.load("fr_core_news_sm")
-
-if need_load_model_de:
-    if method['de'] == 'Stanza':
-        nlp_token['de'] = stanza.Pipeline(lang="de", package='gsd', processors='tokenize')
-    elif method['de'] == 'Trankit':
-        nlp_token['de'] = trankit.Pipeline(lang='german', embedding='xlm-roberta-large', gpu=True)
-    elif method['de'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['de'] = spacy.load("de_core_news_sm")
-
-if need_load_model_uk:
-    if method['uk'] == 'Stanza':
-        nlp_token['uk'] = stanza.Pipeline(lang="uk", package='iu', processors='tokenize')
-    elif method['uk'] == 'Trankit':
-        nlp_token['uk'] = trankit.Pipeline(lang='ukrainian', embedding='xlm-roberta-large', gpu=True)
-    elif method['uk'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['uk'] = spacy.load("uk_core_news_sm")
-
-if need_load_model_tr:
-    if method['tr'] == 'Stanza':
-        nlp_token['tr'] = stanza.Pipeline(lang="tr", package='imst', processors='tokenize')
-    elif method['tr'] == 'Trankit':
-        nlp_token['tr'] = trankit.Pipeline(lang='turkish', embedding='xlm-roberta-large', gpu=True)
-    elif method['tr'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['tr'] = spacy.load("xx_ent_wiki_sm")
-        nlp_token['tr'].add_pipe('sentencizer')
-
-if need_load_model_ar:
-    if method['ar'] == 'Stanza':
-        nlp_token['ar'] = stanza.Pipeline(lang="ar", package='padt', processors='tokenize')
-    elif method['ar'] == 'Trankit':
-        nlp_token['ar'] = trankit.Pipeline(lang='arabic', embedding='xlm-roberta-large', gpu=True)
-    elif method['ar'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['ar'] = spacy.load("xx_ent_wiki_sm")
-        nlp_token['ar'].add_pipe('sentencizer')
+
+def get_nlp_token(lang):
+    if method[lang] == 'Stanza':
+        return get_model('Stanza', lang, 'tokenize', package=stanza_packages[lang])
+    elif method[lang] == 'Trankit':
+        return get_model('Trankit', lang, embedding='xlm-roberta-large', gpu=True)
+    elif method[lang] == 'Spacy':
+        return get_model('Spacy', lang)
+    elif method[lang] == 'Natasha':
+        return get_model('Natasha', lang, 'segmenter')
 
 # --------------------------------------------------
 
 
+# Sentences are returned as pairs (text, start), where start is the position of the sentence
+# in the input text given by the model (None if the model does not give it)
+
+def stanza_sentence_start(sentence):
+    if len(sentence.tokens) > 0:
+        return sentence.tokens[0].start_char
+    return None
+
+
 def output_sentences_stanza(text, lang):
     sentences = []
-    doc = nlp_token[lang](text)
+    doc = get_nlp_token(lang)(text)
     for sentence in doc.sentences:
-        sentences.append(sentence.text)
+        sentences.append((sentence.text, stanza_sentence_start(sentence)))
     return sentences
 
 
 def output_sentences_spacy(text, lang):
     sentences = []
-    doc = nlp_token[lang](text)
+    doc = get_nlp_token(lang)(text)
     for sentence in doc.sents:
-        sentences.append(sentence.text)
+        sentences.append((sentence.text, sentence.start_char))
     return sentences
 
 
 def output_sentences_trankit(text, lang):
     sentences = []
-    sents = nlp_token[lang].ssplit(text)
+    sents = get_nlp_token(lang).ssplit(text)
     for sent in sents['sentences']:
-        sentences.append(sent['text'])
+        sentences.append((sent['text'], sent['dspan'][0] if 'dspan' in sent else None))
     return sentences
 
 
 def output_sentences_natasha(text):
     sentences = []
     doc = Doc(text)
-    doc.segment(segmenter)
+    doc.segment(get_nlp_token('ru'))
     for sent in doc.sents:
-        sentences.append(sent.text)
+        sentences.append((sent.text, sent.start))
     return sentences
 
 
+def output_sentences_stanza_batch(texts, lang):
+    # Stanza processes a list of documents in one bulk call
+    in_docs = [stanza.Document([], text=text) for text in texts]
+    docs = get_nlp_token(lang).bulk_process(in_docs)
+    return [[(sentence.text, stanza_sentence_start(sentence)) for sentence in doc.sentences] for doc in docs]
+
+
+def output_sentences_spacy_batch(texts, lang, batch_size):
+    docs = get_nlp_token(lang).pipe(texts, batch_size=batch_size)
+    return [[(sentence.text, sentence.start_char) for sentence in doc.sents] for doc in docs]
+
+
 def output_sentences_nltk(text, lang):
     langs = {
         'en': 'english',
@@ -160,18 +109,20 @@ def output_sentences_nltk(text, lang):
         'tr': 'turkish',
         'ar': 'english'
     }
-    return sent_tokenize(text, language=langs[lang])
+    return [(sentence, None) for sentence in sent_tokenize(text, language=langs[lang])]
 
 
-def start_position(sentence, text):
-    symbols = 1
-    try:
-        while len(text.split(sentence[:symbols])) > 2 and symbols < len(sentence):
-            symbols += 1
-    except:
-        while len(text.split()) > 2 and symbols < len(sentence):
-            symbols += 1
-    return text.find(sentence[:symbols])
+def find_position(sentence, text, cursor):
+    """
+    Position of the first occurrence of the sentence in the text after the cursor;
+    if the model has changed the sentence, its first word is searched
+    """
+    start = text.find(sentence, cursor)
+    if start == -1 and len(sentence.split()) > 0:
+        start = text.find(sentence.split()[0], cursor)
+    if start == -1:
+        start = cursor
+    return start
 
 
 def correct_sentences_ru(sentences, positions, text):
@@ -226,35 +177,50 @@ def correct_sentences_all_langs(sentences, positions, text):
     return sentences_corrected, pos_corrected
 
 
-def preprocess(text, lang, min_sent_len):
-    sentences = []
-    if text and lang is not None:
-        text_splitted = []
-        if method[lang] == 'Stanza':
-            text_splitted = output_sentences_stanza(text, lang)
-        elif method[lang] == 'Trankit':
-            text_splitted = output_sentences_trankit(text, lang)
-        elif method[lang] == 'Spacy':
-            text_splitted = output_sentences_spacy(text, lang)
-        elif method[lang] == 'NLTK':
-            text_splitted = output_sentences_nltk(text, lang)
-        elif method[lang] == 'Natasha' and lang == 'ru':
-            text_splitted = output_sentences_natasha(text)
-        for sentence in text_splitted:
-            if sentence.strip() != '':
-                sentences.append(sentence.strip())
-
-    sentences_temp = []
-    for sentence in sentences:
-        sentences_temp.extend(sentence.split('\n'))
-    sentences = sentences_temp
+def split_text(text, lang):
+    text_splitted = []
+    if method[lang] == 'Stanza':
+        text_splitted = output_sentences_stanza(text, lang)
+    elif method[lang] == 'Trankit':
+        text_splitted = output_sentences_trankit(text, lang)
+    elif method[lang] == 'Spacy':
+        text_splitted = output_sentences_spacy(text, lang)
+    elif method[lang] == 'NLTK':
+        text_splitted = output_sentences_nltk(text, lang)
+    elif method[lang] == 'Natasha' and lang == 'ru':
+        text_splitted = output_sentences_natasha(text)
+    return text_splitted
+
+
+def split_texts(texts, lang, batch_size):
+    """
+    Splits a batch of texts of the same language into sentences
+
+    Returns list of lists of sentences in the order of texts
+    """
+    if method[lang] == 'Stanza':
+        return output_sentences_stanza_batch(texts, lang)
+    elif method[lang] == 'Spacy':
+        return output_sentences_spacy_batch(texts, lang, batch_size)
+    # Trankit, NLTK and Natasha have no batched sentence splitting
+    return [split_text(text, lang) for text in texts]
 
+
+def postprocess(text, lang, text_splitted, min_sent_len):
+    sentences = []
     positions = []
-    pos = 0
-    for sentence in sentences:
-        pos += start_position(sentence, text[pos:])
-        positions.append(pos)
-        pos += len(sentence)
+    cursor = 0
+    for sentence, start in text_splitted:
+        # Positions given by the model are checked, the sentence is searched after the previous one otherwise
+        if start is None or text[start:start + len(sentence)] != sentence:
+            start = find_position(sentence, text, cursor)
+        if sentence.strip() != '':
+            start += len(sentence) - len(sentence.lstrip())
+            for line in sentence.strip().split('\n'):
+                sentences.append(line)
+                positions.append(start)
+                start += len(line) + 1
+            cursor = start - 1
 
     sentences, positions = correct_sentences_all_langs(sentences, positions, text)
 
@@ -271,20 +237,100 @@ def preprocess(text, lang, min_sent_len):
     return sentences_filtered, positions_filtered
 
 
-def get_sentences(text, lang, min_sent_len):
+def preprocess(text, lang, min_sent_len):
+    text_splitted = []
+    if text and lang is not None:
+        text_splitted = split_text(text, lang)
+    return postprocess(text, lang, text_splitted, min_sent_len)
+
+
+def to_sentences_dict(sentences, positions):
     sentences_dict = []
-    sentences, positions = preprocess(text, lang, min_sent_len)
     for sentence, start in zip(sentences, positions):
         sentences_dict.append({'text': sentence, 'start': start})
-
     return sentences_dict
 
 
-def segmentation(messages, min_sent_len=3):
+def get_sentences(text, lang, min_sent_len):
+    sentences, positions = preprocess(text, lang, min_sent_len)
+    return to_sentences_dict(sentences, positions)
+
+
+def get_sentences_batch(texts, lang, min_sent_len, batch_size):
+    """
+    Takes texts of the same language and splits all of them
+    with one model call
+
+    Returns list of sentences (as in get_sentences) for every text
+    """
+    texts_splitted = [[] for _ in texts]
+    indexes = [i for i in range(len(texts)) if texts[i]]
+    if len(indexes) > 0 and lang is not None:
+        splitted = split_texts([texts[i] for i in indexes], lang, batch_size)
+        for i, text_splitted in zip(indexes, splitted):
+            texts_splitted[i] = text_splitted
+
+    sentences_batch = []
+    for text, text_splitted in zip(texts, texts_splitted):
+        sentences, positions = postprocess(text, lang, text_splitted, min_sent_len)
+        sentences_batch.append(to_sentences_dict(sentences, positions))
+    return sentences_batch
+
+
+def find_sentences(messages, min_sent_len, batch_size=None):
+    """
+    Splits texts of the messages into sentences, grouping
+    messages of the same language into batches
+
+    Returns dict: index of the message -> list of its sentences
+    """
+    if batch_size is None:
+        batch_size = default_batch_size
+
+    # Group messages by language, so that every model call gets texts of one language
+    indexes_by_lang = {}
+    for i in range(len(messages)):
+        if 'lang' in messages[i] and 'text' in messages[i]:
+            indexes_by_lang.setdefault(messages[i]['lang'], []).append(i)
+
+    sentences_by_index = {}
+    for lang, indexes in indexes_by_lang.items():
+        for batch_start in range(0, len(indexes), batch_size):
+            batch_indexes = indexes[batch_start:batch_start + batch_size]
+            try:
+                texts = [messages[i]['text'] for i in batch_indexes]
+                with metrics.timer('text_analysis_stage_seconds', stage='segmentation', lang=lang,
+                                   backend=method.get(lang, '')):
+                    sentences_batch = get_sentences_batch(texts, lang, min_sent_len, batch_size)
+                for i, sentences in zip(batch_indexes, sentences_batch):
+                    sentences_by_index[i] = sentences
+                metrics.increment('text_analysis_messages_total', len(batch_indexes), stage='segmentation',
+                                  lang=lang, backend=method.get(lang, ''))
+                metrics.increment('text_analysis_sentences_total', sum(len(sentences) for sentences in sentences_batch),
+                                  stage='segmentation', lang=lang, backend=method.get(lang, ''))
+            except:
+                # Process messages of the failed batch one by one to find the erroneous ones
+                for i in batch_indexes:
+                    message_id = ''
+                    if 'id' in messages[i].keys():
+                        message_id = messages[i]['id']
+                    try:
+                        sentences_by_index[i] = get_sentences(messages[i]['text'], lang, min_sent_len)
+                    except:
+                        e = sys.exc_info()[1]
+                        t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+                        print("%s Text ID: %s, Error: %s" % (t, message_id, e))
+                        metrics.record_error(messages[i], 'segmentation')
+
+    return sentences_by_index
+
+
+def segmentation(messages, min_sent_len=3, batch_size=None):
     """ Функция сегментации входных сообщений на предложения.
     
     :param messages: список входных сообщений в формате JSON (dict). Каждое сообщение содержит поле `lang` - язык.
     :param min_sent_len: минимальное количество слов в предложении, при котором оно сохраняется в поле `sentences`.
+    :param batch_size: количество сообщений одного языка, передаваемых модели за один вызов (по умолчанию - `default_batch_size`); при значении 1 каждое сообщение обрабатывается отдельно.
     
     :return:
         список входных сообщений, для каждого из которых добавлено поле `sentences`: список словарей; каждый словарь = предложение; словарь включает поля:
@@ -293,24 +339,14 @@ def segmentation(messages, min_sent_len=3):
     
     """
 
+    sentences_by_index = find_sentences(messages, min_sent_len, batch_size)
+
     messages_new = []
 
     for i in range(len(messages)):
-        message = copy.deepcopy(messages[i])
-
-        message_id = ''
-        if 'id' in message.keys():
-            message_id = message['id']
-        
-        if 'lang' in message and 'text' in message:
-            try:
-                sentences = get_sentences(message['text'], message['lang'], min_sent_len)
-                if len(sentences) > 0:
-                    message['sentences'] = sentences
-                    messages_new.append(message)
-            except:
-                e = sys.exc_info()[1]
-                t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-                print("%s Text ID: %s, Error: %s" % (t, message_id, e))
+        if i in sentences_by_index and len(sentences_by_index[i]) > 0:
+            message = copy.deepcopy(messages[i])
+            message['sentences'] = sentences_by_index[i]
+            messages_new.append(message)
 
     return messages_new
@@ -0,0 +1,151 @@
+from datetime import datetime
+import gzip
+import json
+import os
+import sys
+
+from .pipeline import analyze
+
+# ---------------- SETTINGS SECTION ----------------
+
+# Number of messages read, analyzed and written at once
+chunk_size = 256
+
+# --------------------------------------------------
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin.buffer
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_jsonl(path, offset=0):
+    """
+    Reads messages from the JSONL file (gzipped if the name ends with .gz) one by one
+
+    Yields (message, offset) pairs, where offset is the position in the (uncompressed) file
+    after the message. Reading starts from the given offset
+    """
+    f = open_input(path)
+    try:
+        if offset > 0:
+            f.seek(offset)
+        position = offset
+        for line in f:
+            position += len(line)
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                e = sys.exc_info()[1]
+                t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+                print("%s Module: %s, function: %s, offset: %s, error: %s" % (t, 'stream', 'read_jsonl', position, e))
+                continue
+            yield message, position
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+def read_chunks(items, size):
+    """
+    Groups (message, offset) pairs into chunks of the given size
+
+    Yields (messages, offset) pairs, where offset is the position after the last message of the chunk.
+    The next chunk is read only when the previous one is requested
+    """
+    chunk = []
+    offset = None
+    for message, offset in items:
+        chunk.append(message)
+        if len(chunk) >= size:
+            yield chunk, offset
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk, offset
+
+
+def analyze_stream(messages, stages=None, min_sent_len=3, size=chunk_size, executor=None):
+    """ Функция потокового анализа входных сообщений.
+
+    Сообщения читаются из итератора частями по `size` сообщений; следующая часть читается только после того,
+    как результаты предыдущей получены потребителем, поэтому в памяти находится не более одной части.
+
+    :param messages: итератор входных сообщений (dict) или пар (сообщение, смещение), как в `read_jsonl`.
+    :param stages: список этапов анализа (по умолчанию - все этапы).
+    :param min_sent_len: минимальное количество слов в предложении.
+    :param size: количество сообщений в одной части.
+    :param executor: `text_analysis.executor.ShardedExecutor` для анализа в нескольких процессах (опционально).
+
+    :return:
+        генератор пар (список проанализированных сообщений части, смещение после последнего сообщения части).
+
+    """
+    items = (item if isinstance(item, tuple) else (item, None) for item in messages)
+    for chunk, offset in read_chunks(items, size):
+        if executor is not None:
+            yield executor.analyze(chunk), offset
+        else:
+            yield analyze(chunk, stages, min_sent_len), offset
+
+
+def read_state(path):
+    # State of the processing: {'input_offset', 'output_offset'}
+    if not os.path.exists(path):
+        return {'input_offset': 0, 'output_offset': 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_state(path, state):
+    # The state is replaced atomically, so it is never read half-written after a crash
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def process_file(input_path, output_path, stages=None, min_sent_len=3, size=chunk_size, executor=None,
+                 resume=False):
+    """
+    Analyzes messages of the JSONL input file and writes results to the JSONL output file chunk by chunk
+
+    After every chunk the offsets of the input and output files are saved to `<output_path>.offset`.
+    With resume=True the processing continues from the saved offsets: output written after
+    the last saved chunk is truncated, and the input is read from the first unprocessed message.
+    Output is gzipped if its name ends with .gz (every chunk is a separate gzip member).
+
+    Returns number of written messages
+    """
+    state_path = output_path + '.offset'
+    state = read_state(state_path) if resume else {'input_offset': 0, 'output_offset': 0}
+    if output_path != '-':
+        mode = 'r+b' if resume and os.path.exists(output_path) else 'wb'
+        output = open(output_path, mode)
+        output.seek(state['output_offset'])
+        output.truncate()
+    else:
+        output = sys.stdout.buffer
+    compress = output_path.endswith('.gz')
+
+    written = 0
+    try:
+        items = read_jsonl(input_path, state['input_offset'])
+        for messages, offset in analyze_stream(items, stages, min_sent_len, size, executor):
+            data = ''.join(json.dumps(message, ensure_ascii=False) + '\n' for message in messages).encode('utf-8')
+            output.write(gzip.compress(data) if compress else data)
+            output.flush()
+            written += len(messages)
+            if output is not sys.stdout.buffer:
+                os.fsync(output.fileno())
+                write_state(state_path, {'input_offset': offset, 'output_offset': output.tell()})
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return written
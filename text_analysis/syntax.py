@@ -1,33 +1,31 @@
 from datetime import datetime
-from navec import Navec
-from slovnet import Syntax
 from spacy.tokens import Doc as spacy_doc
-import stanza
-import trankit
-import spacy
 import copy
 import sys
-import os
+
+from .registry import get_model, get_model_id, pipe_spacy, stanza_methods
+from .grammar import get_analyses
+from . import cache
+from . import metrics
+
 
 # ---------------- SETTINGS SECTION ----------------
 
 # Path to the directory with models for Natasha
 model_path = 'models'
 
-# set True if you need to use model for specific language
-need_load_model_ru = False
-need_load_model_en = False
-need_load_model_es = False
-need_load_model_fr = False
-need_load_model_de = False
-need_load_model_uk = False
-need_load_model_tr = False
-need_load_model_ar = False
+# Components of spaCy models which are not needed for syntax analysis
+spacy_disable = ['ner', 'lemmatizer']
 
-# --------------- LOAD MODELS ----------------
+# Number of sentences passed to the Natasha (slovnet) syntax model at once
+natasha_batch_size = 64
 
-nlp_syntax = {}
+# Methods for which sentences of all messages of a language are analyzed together
+batch_methods = ['Spacy', 'Natasha']
 
+# --------------- MODELS ----------------
+
+# Models are loaded on the first request through the shared registry
 method = {
     'en': 'Stanza',
     'ru': 'Stanza',
@@ -39,80 +37,34 @@ method = {
     'ar': 'Stanza'
 }
 
-if need_load_model_en:
-    if method['en'] == 'Stanza':
-        nlp_syntax['en'] = stanza.Pipeline(lang="en", package='ewt', processors='tokenize,mwt,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['en'] == 'Trankit':
-        nlp_syntax['en'] = trankit.Pipeline(lang='english')
-    elif method['en'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_syntax['en'] = spacy.load("en_core_web_sm")
-
-if need_load_model_ru:
-    if method['ru'] == 'Stanza':
-        nlp_syntax['ru'] = stanza.Pipeline(lang="ru", package='syntagrus', processors='tokenize,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['ru'] == 'Trankit':
-        nlp_syntax['ru'] = trankit.Pipeline(lang='russian')
-    elif method['ru'] == 'Natasha':
-        navec = Navec.load(os.path.join(model_path, 'navec_news_v1_1B_250K_300d_100q.tar'))
-        nlp_syntax_natasha = Syntax.load(os.path.join(model_path, 'slovnet_syntax_news_v1.tar'))
-        nlp_syntax_natasha.navec(navec)
-
-if need_load_model_es:
-    if method['es'] == 'Stanza':
-        nlp_syntax['es'] = stanza.Pipeline(lang="es", package='gsd', processors='tokenize,mwt,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['es'] == 'Trankit':
-        nlp_syntax['es'] = trankit.Pipeline(lang='spanish')
-    elif method['es'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_syntax['es'] = spacy.load("es_core_news_sm")
-
-if need_load_model_fr:
-    if method['fr'] == 'Stanza':
-        nlp_syntax['fr'] = stanza.Pipeline(lang="fr", package='gsd', processors='tokenize,mwt,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['fr'] == 'Trankit':
-        nlp_syntax['fr'] = trankit.Pipeline(lang='french')
-    elif method['fr'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_syntax['fr'] = spacy.load("fr_core_news_sm")
-
-if need_load_model_de:
-    if method['de'] == 'Stanza':
-        nlp_syntax['de'] = stanza.Pipeline(lang="de", package='gsd', processors='tokenize,mwt,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['de'] == 'Trankit':
-        nlp_syntax['de'] = trankit.Pipeline(lang='german')
-    elif method['de'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_syntax['de'] = spacy.load("de_core_news_sm")
-
-if need_load_model_uk:
-    if method['uk'] == 'Stanza':
-        nlp_syntax['uk'] = stanza.Pipeline(lang="uk", package='iu', processors='tokenize,mwt,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['uk'] == 'Trankit':
-        nlp_syntax['uk'] = trankit.Pipeline(lang='ukrainian')
-    elif method['uk'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_syntax['de'] = spacy.load("uk_core_news_sm")
-
-if need_load_model_tr:
-    if method['tr'] == 'Stanza':
-        nlp_syntax['tr'] = stanza.Pipeline(lang="tr", package='imst', processors='tokenize,mwt,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['tr'] == 'Trankit':
-        nlp_syntax['tr'] = trankit.Pipeline(lang='turkish')
-
-if need_load_model_ar:
-    if method['ar'] == 'Stanza':
-        nlp_syntax['ar'] = stanza.Pipeline(lang="ar", package='padt', processors='tokenize,mwt,pos,lemma,depparse',
-                                           tokenize_pretokenized=True)
-    elif method['ar'] == 'Trankit':
-        nlp_syntax['ar'] = trankit.Pipeline(lang='arabic')
+# Stanza packages and processors for syntax analysis
+stanza_syntax = {
+    'en': ('ewt', 'tokenize,mwt,pos,lemma,depparse'),
+    'ru': ('syntagrus', 'tokenize,pos,lemma,depparse'),
+    'es': ('gsd', 'tokenize,mwt,pos,lemma,depparse'),
+    'fr': ('gsd', 'tokenize,mwt,pos,lemma,depparse'),
+    'de': ('gsd', 'tokenize,mwt,pos,lemma,depparse'),
+    'uk': ('iu', 'tokenize,mwt,pos,lemma,depparse'),
+    'tr': ('imst', 'tokenize,mwt,pos,lemma,depparse'),
+    'ar': ('padt', 'tokenize,mwt,pos,lemma,depparse')
+}
+
+
+def get_nlp_syntax(lang):
+    if method[lang] in stanza_methods:
+        package, processors = stanza_syntax[lang]
+        return get_model(method[lang], lang, processors, package=package, tokenize_pretokenized=True)
+    elif method[lang] == 'Trankit':
+        return get_model('Trankit', lang)
+    elif method[lang] == 'Spacy':
+        return get_model('Spacy', lang)
+    elif method[lang] == 'Natasha':
+        return get_model('Natasha', lang, 'syntax', model_path=model_path, batch_size=natasha_batch_size)
+
+
+def get_model_id_syntax(lang):
+    # Identifier of the model of the syntax analysis for the cache keys
+    return get_model_id(method[lang], lang, stanza_syntax.get(lang), model_path if method[lang] == 'Natasha' else None)
 
 # --------------------------------------------------
 
@@ -122,7 +74,7 @@ def get_syntax_stanza(grammar, lang):
     for i in range(len(grammar)): 
         tokens.append([token[0] for token in grammar[i]])
     
-    doc = nlp_syntax[lang](tokens)  # let pretokeinzed text to model
+    doc = get_nlp_syntax(lang)(tokens)  # let pretokeinzed text to model
     
     for i in range(len(grammar)):
         word_ids = []
@@ -144,7 +96,7 @@ def get_syntax_trankit(grammar, lang):
     for i in range(len(grammar)): 
         tokens.append([token[0] for token in grammar[i]])
     
-    doc = nlp_syntax[lang].posdep(tokens)  # let pretokeinzed text to model
+    doc = get_nlp_syntax(lang).posdep(tokens)  # let pretokeinzed text to model
     
     for i in range(len(grammar)):
         word_ids = []
@@ -165,8 +117,8 @@ def get_syntax_spacy(grammar, lang):
     for i in range(len(grammar)): 
         tokens.append([token[0] for token in grammar[i]])
 
-    docs = [spacy_doc(nlp_syntax[lang].vocab, tokens[i]) for i in range(len(tokens))]
-    docs = nlp_syntax[lang].pipe(docs) # let pretokeinzed text to model
+    docs = [spacy_doc(get_nlp_syntax(lang).vocab, tokens[i]) for i in range(len(tokens))]
+    docs = pipe_spacy(get_nlp_syntax(lang), docs, spacy_disable) # let pretokeinzed text to model
     
     for i, doc in enumerate(docs):
         word_ids = []
@@ -186,11 +138,10 @@ def get_syntax_spacy(grammar, lang):
 
 
 def get_syntax_natasha(grammar):
-    for i in range(len(grammar)):
-        words = [token[0] for token in grammar[i]]
-        
-        markup_syntax = next(nlp_syntax_natasha.map([words]))
-        
+    # all sentences go through one generator, which is split into batches of natasha_batch_size by the model
+    markups = get_nlp_syntax('ru').map([[token[0] for token in grammar[i]] for i in range(len(grammar))])
+
+    for i, markup_syntax in enumerate(markups):
         word_ids = []
         head_ids = []
         for token in markup_syntax.tokens:
@@ -204,6 +155,103 @@ def get_syntax_natasha(grammar):
     return grammar
 
 
+@metrics.timed_batch('syntax', method)
+def syntax_messages_batch(messages, lang):
+    """
+    Syntax analysis of sentences and titles of many messages of one language
+    with one call of the model (spaCy or Natasha)
+    """
+    analyses = []
+    cache_keys = []
+    for message in messages:
+        for text, analysis in get_analyses(message):
+            cache_key = cache.make_key('syntax', lang, method[lang], text, analysis['grammar'], get_model_id_syntax(lang))
+            grammar_cached = cache.get(cache_key)
+            if grammar_cached is not None:
+                analysis['grammar'] = grammar_cached
+            else:
+                analyses.append(analysis)
+                cache_keys.append(cache_key)
+
+    if len(analyses) > 0:
+        grammar = [analysis['grammar'] for analysis in analyses]
+        if method[lang] == 'Spacy':
+            grammar = get_syntax_spacy(grammar, lang)
+        elif method[lang] == 'Natasha' and lang == 'ru':
+            grammar = get_syntax_natasha(grammar)
+        for analysis, grammar_analysis, cache_key in zip(analyses, grammar, cache_keys):
+            analysis['grammar'] = grammar_analysis
+            cache.put(cache_key, grammar_analysis)
+
+
+def get_syntax(analyses, lang):
+    # Syntax analysis of the grammars of the sentences (and title) with one call of the model
+    grammar = [analysis['grammar'] for analysis in analyses]
+    if method[lang] in stanza_methods:
+        grammar = get_syntax_stanza(grammar, lang)
+    elif method[lang] == 'Trankit':
+        grammar = get_syntax_trankit(grammar, lang)
+    elif method[lang] == 'Spacy':
+        grammar = get_syntax_spacy(grammar, lang)
+    elif method[lang] == 'Natasha' and lang == 'ru':
+        grammar = get_syntax_natasha(grammar)
+    return grammar
+
+
+def report_error(message, message_id):
+    # Prints the current exception for a sentence or the title of the message and records it in the message
+    e = sys.exc_info()[1]
+    t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+    print("%s Module: %s, function: %s, text ID: %s, error: %s" % (t, 'syntax', 'syntax_analysis', message_id, e))
+    metrics.record_error(message, 'syntax')
+
+
+@metrics.timed_message('syntax', method)
+def syntax_message(message):
+    """
+    Adds syntax analysis to sentences and title of one message in place,
+    the title is analyzed together with the sentences
+    """
+
+    message_id = ''
+    if 'id' in message.keys():
+        message_id = message['id']
+    
+    if 'lang' in message:
+        lang = message['lang']
+
+        analyses = []
+        cache_keys = []
+        for text, analysis in get_analyses(message):
+            try:
+                cache_key = cache.make_key('syntax', lang, method[lang], text, analysis['grammar'], get_model_id_syntax(lang))
+                grammar_cached = cache.get(cache_key)
+                if grammar_cached is not None:
+                    analysis['grammar'] = grammar_cached
+                else:
+                    # only sentences and title without cached results are analyzed by the model
+                    analyses.append(analysis)
+                    cache_keys.append(cache_key)
+            except:
+                report_error(message, message_id)
+
+        # The sentences and the title are analyzed with one call of the model;
+        # if it fails, they are analyzed one by one, so that one text can not break the others
+        grammar = None
+        if len(analyses) > 0:
+            try:
+                grammar = get_syntax(analyses, lang)
+            except:
+                grammar = None
+        for i in range(len(analyses)):
+            try:
+                grammar_analysis = grammar[i] if grammar is not None else get_syntax([analyses[i]], lang)[0]
+                analyses[i]['grammar'] = grammar_analysis
+                cache.put(cache_keys[i], grammar_analysis)
+            except:
+                report_error(message, message_id)
+
+
 def syntax_analysis(messages):
     """ Функция синтаксического анализа входных сообщений.
     
@@ -237,49 +285,24 @@ def syntax_analysis(messages):
 
     messages_new = copy.deepcopy(messages)
 
+    # spaCy and Natasha: sentences and titles of all messages of a language are analyzed together
+    messages_batch = {}
     for message in messages_new:
-        message_id = ''
-        if 'id' in message.keys():
-            message_id = message['id']
-        
-        if 'lang' in message:
-            lang = message['lang']
-            
-            if 'sentences' in message and len(message['sentences']) > 0:
-                try:
-                    sentences = message['sentences']
-                    grammar = [sentence['grammar'] for sentence in sentences]
-                    if method[lang] == 'Stanza':
-                        grammar = get_syntax_stanza(grammar, lang)
-                    elif method[lang] == 'Trankit':
-                        grammar = get_syntax_trankit(grammar, lang)
-                    elif method[lang] == 'Spacy':
-                        grammar = get_syntax_spacy(grammar, lang)
-                    elif method[lang] == 'Natasha' and lang == 'ru':
-                        grammar = get_syntax_natasha(grammar)
-                    for i in range(len(sentences)):
-                        sentences[i]['grammar'] = grammar[i]
-                except:
-                    e = sys.exc_info()[1]
-                    t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-                    print("%s Module: %s, function: %s, text ID: %s, error: %s" % (t, 'syntax', 'syntax_analysis', message_id, e))
-
-            if 'title_analysis' in message:
-                try:
-                    title_analysis = message['title_analysis']
-                    grammar = [title_analysis['grammar']]
-                    if method[lang] == 'Stanza':
-                        grammar = get_syntax_stanza(grammar, lang)
-                    elif method[lang] == 'Trankit':
-                        grammar = get_syntax_trankit(grammar, lang)
-                    elif method[lang] == 'Spacy':
-                        grammar = get_syntax_spacy(grammar, lang)
-                    elif method[lang] == 'Natasha' and lang == 'ru':
-                        grammar = get_syntax_natasha(grammar)
-                    title_analysis['grammar'] = grammar[0]
-                except:
-                    e = sys.exc_info()[1]
-                    t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-                    print("%s Module: %s, function: %s, text ID: %s, error: %s" % (t, 'syntax', 'syntax_analysis', message_id, e))
+        if 'lang' in message and method.get(message['lang']) in batch_methods:
+            messages_batch.setdefault(message['lang'], []).append(message)
+    analyzed = set()
+    for lang, messages_lang in messages_batch.items():
+        try:
+            syntax_messages_batch(messages_lang, lang)
+            analyzed.update(id(message) for message in messages_lang)
+        except:
+            # messages are analyzed one by one
+            e = sys.exc_info()[1]
+            t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+            print("%s Module: %s, function: %s, lang: %s, error: %s" % (t, 'syntax', 'syntax_messages_batch', lang, e))
+
+    for message in messages_new:
+        if id(message) not in analyzed:
+            syntax_message(message)
 
     return messages_new
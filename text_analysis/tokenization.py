@@ -1,31 +1,19 @@
 from datetime import datetime
 import regex as re
-import stanza
 import copy
-import trankit
-import spacy
-from natasha import (
-    Segmenter,
-    Doc
-)
+import stanza
+from natasha import Doc
 from nltk.tokenize import word_tokenize
 import sys
 
-# ---------------- SETTINGS SECTION ----------------
+from .registry import get_model, get_model_id, pipe_spacy, stanza_packages
+from . import cache
+from . import metrics
 
-# set True if you need to use model for specific language
-need_load_model_ru = False
-need_load_model_en = False
-need_load_model_es = False
-need_load_model_fr = False
-need_load_model_de = False
-need_load_model_uk = False
-need_load_model_tr = False
-need_load_model_ar = False
 
-# --------------- LOAD MODELS ----------------
+# --------------- MODELS ----------------
 
-nlp_token = {}
+# Models are loaded on the first request through the shared registry
 model = {
     'en': 'Stanza',
     'ru': 'Stanza',
@@ -37,164 +25,85 @@ model = {
     'ar': 'Stanza',
 }
 
-if need_load_model_en:
-    if model['en'] == 'Stanza':
-        nlp_token['en'] = stanza.Pipeline(lang="en", package='ewt', processors='tokenize')
-    elif model['en'] == 'Trankit':
-        nlp_token['en'] = trankit.Pipeline(lang="english", gpu=True)
-    elif model['en'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['en'] = spacy.load("en_core_web_sm")
-
-if need_load_model_ru:
-    if model['ru'] == 'Stanza':
-        nlp_token['ru'] = stanza.Pipeline(lang="ru", package='gsd', processors='tokenize')
-    elif model['ru'] == 'Trankit':
-        nlp_token['ru'] = trankit.Pipeline(lang="russian", gpu=True)
-    elif model['ru'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['ru'] = spacy.load("ru_core_news_sm")
-    elif model['ru'] == 'Natasha':
-        segmenter = Segmenter()
-
-if need_load_model_es:
-    if model['es'] == 'Stanza':
-        nlp_token['es'] = stanza.Pipeline(lang="es", package='gsd', processors='tokenize')
-    elif model['es'] == 'Trankit':
-        nlp_token['es'] = trankit.Pipeline(lang="spanish", gpu=True)
-    elif model['es'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['es'] = spacy.load("es_core_news_sm")
-
-if need_load_model_fr:
-    if model['fr'] == 'Stanza':
-        nlp_token['fr'] = stanza.Pipeline(lang="fr", package='gsd', processors='tokenize')
-    elif model['fr'] == 'Trankit':
-        nlp_token['fr'] = trankit.Pipeline(lang="french", gpu=True)
-    elif model['fr'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['fr'] = spacy.load("fr_core_news_sm")
-
-if need_load_model_de:
-    if model['de'] == 'Stanza':
-        nlp_token['de'] = stanza.Pipeline(lang="de", package='gsd', processors='tokenize')
-    elif model['de'] == 'Trankit':
-        nlp_token['de'] = trankit.Pipeline(lang="german", gpu=True)
-    elif model['de'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['de'] = spacy.load("de_core_news_sm")
-
-if need_load_model_uk:
-    if model['uk'] == 'Stanza':
-        nlp_token['uk'] = stanza.Pipeline(lang="uk", package='iu', processors='tokenize')
-    elif model['uk'] == 'Trankit':
-        nlp_token['uk'] = trankit.Pipeline(lang="ukrainian", gpu=True)
-    elif model['uk'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['uk'] = spacy.load("uk_core_news_sm")
-
-if need_load_model_tr:
-    if model['tr'] == 'Stanza':
-        nlp_token['tr'] = stanza.Pipeline(lang="tr", package='imst', processors='tokenize')
-    elif model['tr'] == 'Trankit':
-        nlp_token['tr'] = trankit.Pipeline(lang="turkish", gpu=True)
-    elif model['tr'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['tr'] = spacy.load("xx_ent_wiki_sm")
-
-if need_load_model_ar:
-    if model['ar'] == 'Stanza':
-        nlp_token['ar'] = stanza.Pipeline(lang="ar", package='padt', processors='tokenize')
-    elif model['ar'] == 'Trankit':
-        nlp_token['ar'] = trankit.Pipeline(lang="arabic", gpu=True)
-    elif model['ar'] == 'Spacy':
-        spacy.prefer_gpu()
-        nlp_token['ar'] = spacy.load("xx_ent_wiki_sm")
+
+def get_nlp_token(lang):
+    if model[lang] == 'Stanza':
+        return get_model('Stanza', lang, 'tokenize', package=stanza_packages[lang])
+    elif model[lang] == 'Trankit':
+        return get_model('Trankit', lang, gpu=True)
+    elif model[lang] == 'Spacy':
+        return get_model('Spacy', lang)
+    elif model[lang] == 'Natasha':
+        return get_model('Natasha', lang, 'segmenter')
+
+
+def get_model_id_token(lang):
+    # Identifier of the tokenizer for the cache keys
+    return get_model_id(model[lang], lang, (stanza_packages.get(lang), 'tokenize'))
 
 # --------------------------------------------------
 
 
-def replace_symbol(token, symbol, tokens_list):
-    token_splitted = re.split(re.escape(symbol), token)
-    if len(token_splitted) > 1 and len(token) > 1:
-        # split tokens, e.g. "Интерфакс\""
-        token_splitted = token.replace(symbol, ' ' + symbol + ' ').strip().split()
-        for item in token_splitted:
-            if len(item) > 0:
-                tokens_list.append([item, '', '', '', -1, -1])
-    else:
-        tokens_list.append([token, '', '', '', -1, -1])
-    return tokens_list
+# Symbols split from the tokens of the tokenizers, e.g. "Интерфакс\"" -> "Интерфакс", "\"".
+# Alternatives are tried in order of priority:
+# '"' anywhere in the token, dashes at the start or at the end, final punctuation and brackets.
+# Groups of the matched alternative are the symbols to split by, the closing bracket
+# is split from the last part of the token after the opening one
+split_pattern = re.compile(r'(?s)[^"]*(")'
+                           r'|(-)|.*(-)\Z'
+                           r'|(–)|.*(–)\Z'
+                           r'|(—)|.*(—)\Z'
+                           r'|.*([.:…?!])\Z'
+                           r'|(\()(?:.*(\))\Z)?|.*(\))\Z'
+                           r'|(\[)(?:.*(\])\Z)?|.*(\])\Z'
+                           r'|(\{)(?:.*(\})\Z)?|.*(\})\Z')
+
+
+def split_symbol(token, symbol):
+    if len(token) > 1 and symbol in token:
+        return token.replace(symbol, ' ' + symbol + ' ').split()
+    return [token]
+
+
+def split_tokens(tokens):
+    """
+    Splits symbols (see split_pattern) from the tokens of the tokenizer
+
+    Returns grammar: list of [token, '', '', '', -1, -1]
+    """
+    grammar = []
+    for token in tokens:
+        match = split_pattern.match(token) if len(token) > 1 else None
+        if match is None:
+            grammar.append([token, '', '', '', -1, -1])
+            continue
+        symbols = [symbol for symbol in match.groups() if symbol is not None]
+        parts = split_symbol(token, symbols[0])
+        if len(symbols) > 1:
+            parts[-1:] = split_symbol(parts[-1], symbols[1])
+        for part in parts:
+            grammar.append([part, '', '', '', -1, -1])
+    return grammar
 
 
 def append_token(token, tokens_list):
-    if '\"' in token:
-        tokens_list = replace_symbol(token, '\"', tokens_list)
-    # chr(0x2D) = '-'
-    elif token.startswith(chr(0x2D)) or token.endswith(chr(0x2D)):
-        tokens_list = replace_symbol(token, chr(0x2D), tokens_list)
-    # chr(0x2013) = '–'
-    elif token.startswith(chr(0x2013)) or token.endswith(chr(0x2013)):
-        tokens_list = replace_symbol(token, chr(0x2013), tokens_list)
-    # chr(0x2014) = '—'
-    elif token.startswith(chr(0x2014)) or token.endswith(chr(0x2014)):
-        tokens_list = replace_symbol(token, chr(0x2014), tokens_list)
-    elif token.endswith('.'):
-        tokens_list = replace_symbol(token, '.', tokens_list)
-    elif token.endswith(':'):
-        tokens_list = replace_symbol(token, ':', tokens_list)
-    elif token.endswith('…'):
-        tokens_list = replace_symbol(token, '…', tokens_list)
-    elif token.endswith('?'):
-        tokens_list = replace_symbol(token, '?', tokens_list)
-    elif token.endswith('!'):
-        tokens_list = replace_symbol(token, '!', tokens_list)
-    elif token.startswith('('):
-        tokens_list = replace_symbol(token, '(', tokens_list)
-        if token.endswith(')'):
-            tokens_list = replace_symbol(tokens_list[-1][0], ')', tokens_list[:-1])
-    elif token.endswith(')'):
-        tokens_list = replace_symbol(token, ')', tokens_list)
-    elif token.startswith('['):
-        tokens_list = replace_symbol(token, '[', tokens_list)
-        if token.endswith(']'):
-            tokens_list = replace_symbol(tokens_list[-1][0], ']', tokens_list[:-1])
-    elif token.endswith(']'):
-        tokens_list = replace_symbol(token, ']', tokens_list)
-    elif token.startswith('{'):
-        tokens_list = replace_symbol(token, '{', tokens_list)
-        if token.endswith('}'):
-            tokens_list = replace_symbol(tokens_list[-1][0], '}', tokens_list[:-1])
-    elif token.endswith('}'):
-        tokens_list = replace_symbol(token, '}', tokens_list)
-    else:
-        tokens_list.append([token, '', '', '', -1, -1])
+    tokens_list.extend(split_tokens([token]))
     return tokens_list
 
 
 def get_tokens_stanza(text, lang):
-    doc = nlp_token[lang](text)
-    tokens_list = []
-    for sentence in doc.sentences:
-        for token in sentence.tokens:
-            tokens_list = append_token(token.text, tokens_list)
-    return tokens_list
+    doc = get_nlp_token(lang)(text)
+    return split_tokens(token.text for sentence in doc.sentences for token in sentence.tokens)
 
 
 def get_tokens_trankit(text, lang):
-    doc = nlp_token[lang].tokenize(text, is_sent=True)
-    tokens_list = []
-    for token in doc['tokens']:
-        tokens_list = append_token(token['text'], tokens_list)
-    return tokens_list
+    doc = get_nlp_token(lang).tokenize(text, is_sent=True)
+    return split_tokens(token['text'] for token in doc['tokens'])
 
 
 def get_tokens_spacy(text, lang):
-    doc = nlp_token[lang](text)
-    tokens_list = []
-    for token in doc:
-        tokens_list = append_token(token.text, tokens_list)
-    return tokens_list
+    doc = get_nlp_token(lang)(text)
+    return split_tokens(token.text for token in doc)
 
 
 def get_tokens_nltk(sent_text, lang):
@@ -208,79 +117,224 @@ def get_tokens_nltk(sent_text, lang):
         'tr': 'turkish',
         'ar': 'english'
     }
-    tokens_list = []
-    for token in word_tokenize(sent_text, language=langs[lang]):
-        tokens_list = append_token(token, tokens_list)
-    return tokens_list
+    return split_tokens(word_tokenize(sent_text, language=langs[lang]))
 
 
 def get_tokens_natasha(text):
     doc = Doc(text)
-    tokens_list = []
-    doc.segment(segmenter)
-    for token in doc.tokens:
-        tokens_list = append_token(token.text, tokens_list)
-    return tokens_list
+    doc.segment(get_nlp_token('ru'))
+    return split_tokens(token.text for token in doc.tokens)
+
 
+# Regular expressions for
+# Ту-204-300, Миг-29,
+# экс-премьер-министр, премьер-министр, 2019-nCoV, 2019-2020,
+# 5,8%, $20, О'Нил,
+# Газета.ру, www.twitter.com,
+# Е.Н.О.Т., д.т.н., A.B., А.
+letter_digit_complex_patterns = [r'\pL+-\pL*[0-9]+\pL*-\pL*[0-9]+\pL*', r'\pL+-\pL*[0-9]+\pL*',
+                                 r'\pL+-\pL+-\pL+', r'\pL+-\pL+', r'[0-9]+-\pL+', r'[0-9]+-[0-9]+',
+                                 r'[0-9]+,?[0-9]*%', r'\$[0-9]+,?[0-9]*', r'\p{Lu}\'\pL+',
+                                 r'\pL+\.\pL+', r'\pL+\.\pL+\.\pL+',
+                                 r'\pL\.\pL\.\pL\.\pL\.', r'\pL\.\pL\.\pL\.', r'\pL\.\pL\.', r'\p{Lu}\.']
 
-def join_tokens(text, grammar, lang):
-    # Regular expressions for
-    # Ту-204-300, Миг-29,
-    # экс-премьер-министр, премьер-министр, 2019-nCoV, 2019-2020,
-    # 5,8%, $20, О'Нил,
-    # Газета.ру, www.twitter.com,
-    # Е.Н.О.Т., д.т.н., A.B., А.
-    letter_digit_complex_patterns = [r'\pL+-\pL*[0-9]+\pL*-\pL*[0-9]+\pL*', r'\pL+-\pL*[0-9]+\pL*',
-                                     r'\pL+-\pL+-\pL+', r'\pL+-\pL+', '[0-9]+-\pL+', r'[0-9]+-[0-9]+',
-                                     r'[0-9]+,?[0-9]*%', r'\$[0-9]+,?[0-9]*', r'\p{Lu}\'\pL+',
-                                     r'\pL+\.\pL+', r'\pL+\.\pL+\.\pL+',
-                                     r'\pL\.\pL\.\pL\.\pL\.', r'\pL\.\pL\.\pL\.', r'\pL\.\pL\.', r'\p{Lu}\.']
+letter_digit_complex_patterns_ru = [r'млн\.', r'тыс\.', r'руб\.', r'ст\.']
 
-    if lang == 'ru':
-        letter_digit_complex_patterns.extend(['млн\.', 'тыс\.', 'руб\.', 'ст\.'])
 
-    finds = []
-    for pattern in letter_digit_complex_patterns:
-        finds.extend(re.findall(pattern, text))
-    finds = sorted(list(set(finds)), key=len, reverse=True)
+def compile_complex_patterns(patterns):
+    # Every pattern is put into an optional lookahead with its own group,
+    # so one match at a position returns matches of all the patterns starting there
+    return re.compile(''.join(r'(?:(?=(%s)))?' % pattern for pattern in patterns))
 
+
+letter_digit_complex_re = compile_complex_patterns(letter_digit_complex_patterns)
+letter_digit_complex_re_ru = compile_complex_patterns(letter_digit_complex_patterns +
+                                                      letter_digit_complex_patterns_ru)
+
+# Every complex contains one of the symbols -%$'. and no spaces
+complex_chunk_re = re.compile(r"\S*[-%$'.]\S*")
+
+
+def get_token_starts(text, tokens):
+    # Start position of every token in the text (None if the token is not found)
+    starts = []
+    cursor = 0
+    for token in tokens:
+        start = text.find(token, cursor)
+        if start == -1:
+            starts.append(None)
+        else:
+            starts.append(start)
+            cursor = start + len(token)
+    return starts
+
+
+def check_complex_len(complex, complex_len):
+    # Number of tokens which can form the complex
+    if '-' in complex:
+        return complex_len == complex.count('-') * 2 + 1
+    if '%' in complex or '$' in complex:
+        return complex_len == 2
+    if '.' in complex:
+        return 2 <= complex_len <= complex.count('.') * 2
+    return False
+
+
+def join_tokens(text, grammar, lang=None):
+    """
+    Joins tokens of the letter digit complexes (e.g. "Ту-204-300", "5,8%", "д.т.н.")
+    found in the text
+
+    Returns new grammar list, where tokens of every complex are merged into one
+    """
     tokens = [item[0] for item in grammar]
-    for elem in finds:
-        if elem not in tokens:
-            if '-' in elem:
-                complex_len = elem.count('-') * 2 + 1
-                for i in range(len(tokens) - complex_len + 1):
-                    tokens_joined = ''.join(tokens[i:i + complex_len])
-                    if tokens_joined == elem:
-                        tokens[i] = tokens_joined
-                        grammar[i][0] = tokens_joined
-                        del grammar[i + 1: i + complex_len]
-                        del tokens[i + 1: i + complex_len]
-            if '%' in elem or '$' in elem:
-                complex_len = 2
-                for i in range(len(tokens) - complex_len + 1):
-                    tokens_joined = ''.join(tokens[i:i + complex_len])
-                    if tokens_joined == elem:
-                        tokens[i] = tokens_joined
-                        grammar[i][0] = tokens_joined
-                        del grammar[i + 1: i + complex_len]
-                        del tokens[i + 1: i + complex_len]
-            elif '.' in elem:
-                complex_len = elem.count('.') * 2
-                stop = False
-                for complex_len_temp in range(complex_len, 1, -1):
-                    for i in range(len(tokens) - complex_len_temp + 1):
-                        tokens_joined = ''.join(tokens[i:i + complex_len_temp])
-                        if tokens_joined == elem:
-                            stop = True
-                            tokens[i] = tokens_joined
-                            grammar[i][0] = tokens_joined
-                            del grammar[i + 1: i + complex_len_temp]
-                            del tokens[i + 1: i + complex_len_temp]
-                    if stop:
-                        break
+    starts = get_token_starts(text, tokens)
+
+    start_index = {}
+    end_index = {}
+    for i, start in enumerate(starts):
+        if start is not None:
+            start_index[start] = i
+            end_index[start + len(tokens[i])] = i
+
+    # gaps[i] - number of pairs of neighbouring tokens before the token i, separated by spaces
+    gaps = [0] * len(tokens)
+    for i in range(1, len(tokens)):
+        adjacent = starts[i - 1] is not None and starts[i] is not None and \
+            starts[i - 1] + len(tokens[i - 1]) == starts[i]
+        gaps[i] = gaps[i - 1] + (0 if adjacent else 1)
+
+    complex_re = letter_digit_complex_re_ru if lang == 'ru' else letter_digit_complex_re
+    # Every complex starts with a letter, a digit or $
+    token_starts = [start for start in sorted(start_index) if text[start].isalnum() or text[start] == '$']
+    spans = set()
+    complexes = set()
+    # End of the last match of every pattern: as in re.findall, matches of one pattern do not overlap
+    pattern_end = [0] * complex_re.groups
+    k = 0
+    for chunk in complex_chunk_re.finditer(text):
+        while k < len(token_starts) and token_starts[k] < chunk.start():
+            k += 1
+        while k < len(token_starts) and token_starts[k] < chunk.end():
+            spans_found = complex_re.match(text, token_starts[k]).regs[1:]
+            for group, (start, end) in enumerate(spans_found):
+                if start != -1:
+                    spans.add((start, end))
+                    if start >= pattern_end[group]:
+                        pattern_end[group] = end
+                        complexes.add(text[start:end])
+            k += 1
+
+    # Longer complexes are joined first
+    used = [False] * len(tokens)
+    complex_end = [None] * len(tokens)
+    for start, end in sorted(spans, key=lambda span: (span[0] - span[1], span[0])):
+        i = start_index.get(start)
+        j = end_index.get(end)
+        # tokens of the complex must follow each other without spaces
+        if i is None or j is None or j <= i or gaps[j] != gaps[i] or any(used[i:j + 1]):
+            continue
+        if text[start:end] not in complexes or not check_complex_len(text[start:end], j - i + 1):
+            continue
+        for k in range(i, j + 1):
+            used[k] = True
+        complex_end[i] = j
+
+    grammar_joined = []
+    i = 0
+    while i < len(grammar):
+        if complex_end[i] is not None:
+            grammar[i][0] = ''.join(tokens[i:complex_end[i] + 1])
+            grammar_joined.append(grammar[i])
+            i = complex_end[i] + 1
+        else:
+            grammar_joined.append(grammar[i])
+            i += 1
+
+    return grammar_joined
+
+
+def get_tokens(texts, lang):
+    """
+    Tokenizes the texts (sentences and title of a message): Stanza and spaCy
+    get all texts in one call of the model, the other tokenizers - one by one
 
-    return grammar
+    Returns list of grammars in the order of the texts
+    """
+    if model[lang] == 'Stanza':
+        docs = get_nlp_token(lang).bulk_process([stanza.Document([], text=text) for text in texts])
+        return [split_tokens(token.text for sentence in doc.sentences for token in sentence.tokens) for doc in docs]
+    elif model[lang] == 'Spacy':
+        return [split_tokens(token.text for token in doc) for doc in pipe_spacy(get_nlp_token(lang), texts)]
+    elif model[lang] == 'Trankit':
+        return [get_tokens_trankit(text, lang) for text in texts]
+    elif model[lang] == 'Natasha' and lang == 'ru':
+        return [get_tokens_natasha(text) for text in texts]
+    elif model[lang] == 'NLTK':
+        return [get_tokens_nltk(text, lang) for text in texts]
+    return [None for _ in texts]
+
+
+@metrics.timed_message('tokenization', model)
+def tokenize_message(message):
+    """
+    Tokenizes sentences and title of one message in place,
+    the title is tokenized together with the sentences
+    """
+
+    message_id = ''
+    if 'id' in message.keys():
+        message_id = message['id']
+    
+    if 'lang' in message:
+        lang = message['lang']
+        # title_analysis is added to the message only if the title is tokenized
+        title_analysis = {}
+        analyses = list(message.get('sentences', []))
+        if 'title' in message and len(message['title']) > 0:
+            analyses.append(title_analysis)
+
+        units = []
+        cache_keys = []
+        for analysis in analyses:
+            try:
+                text = message['title'] if analysis is title_analysis else analysis['text']
+                cache_key = cache.make_key('tokenization', lang, model[lang], text, model=get_model_id_token(lang))
+                grammar = cache.get(cache_key)
+                if grammar is not None:
+                    analysis['grammar'] = grammar
+                else:
+                    # only texts without cached results are tokenized by the model
+                    units.append((text, analysis))
+                    cache_keys.append(cache_key)
+            except:
+                e = sys.exc_info()[1]
+                t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+                print("%s Module: %s, function: %s, text ID: %s, error: %s" % (t, 'tokenization', 'tokenization', message_id, e))
+                metrics.record_error(message, 'tokenization')
+
+        grammars = None
+        if len(units) > 0:
+            try:
+                grammars = get_tokens([text for text, _ in units], lang)
+            except:
+                # the texts are tokenized one by one, so that one text can not break the others
+                grammars = None
+
+        for i, ((text, analysis), cache_key) in enumerate(zip(units, cache_keys)):
+            try:
+                grammar = grammars[i] if grammars is not None else get_tokens([text], lang)[0]
+                if grammar is not None:
+                    analysis['grammar'] = join_tokens(text, grammar, lang)
+                    cache.put(cache_key, analysis['grammar'])
+            except:
+                e = sys.exc_info()[1]
+                t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+                print("%s Module: %s, function: %s, text ID: %s, error: %s" % (t, 'tokenization', 'tokenization', message_id, e))
+                metrics.record_error(message, 'tokenization')
+
+        if 'grammar' in title_analysis:
+            message['title_analysis'] = title_analysis
 
 
 def tokenization(messages):
@@ -309,50 +363,5 @@ def tokenization(messages):
     messages_new = copy.deepcopy(messages)
 
     for message in messages_new:
-        message_id = ''
-        if 'id' in message.keys():
-            message_id = message['id']
-        
-        if 'lang' in message:
-            if 'sentences' in message and len(message['sentences']) > 0:
-                for sentence in message['sentences']:
-                    try:
-                        text = sentence['text']
-                        if model[message['lang']] == 'Stanza':
-                            sentence['grammar'] = get_tokens_stanza(text, message['lang'])
-                        elif model[message['lang']] == 'Trankit':
-                            sentence['grammar'] = get_tokens_trankit(text, message['lang'])
-                        elif model[message['lang']] == 'Natasha' and message['lang'] == 'ru':
-                            sentence['grammar'] = get_tokens_natasha(text)
-                        elif model[message['lang']] == 'Spacy':
-                            sentence['grammar'] = get_tokens_spacy(text, message['lang'])
-                        elif model[message['lang']] == 'NLTK':
-                            sentence['grammar'] = get_tokens_nltk(text, message['lang'])
-                        if 'grammar' in sentence:
-                            sentence['grammar'] = join_tokens(text, sentence['grammar'], message['lang'])
-                    except:
-                        e = sys.exc_info()[1]
-                        t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-                        print("%s Module: %s, function: %s, text ID: %s, error: %s" % (t, 'tokenization', 'tokenization', message_id, e))
-
-            if 'title' in message and len(message['title']) > 0:
-                try:
-                    if model[message['lang']] == 'Stanza':
-                        message['title_analysis'] = {'grammar': get_tokens_stanza(message['title'], message['lang'])}
-                    elif model[message['lang']] == 'Trankit':
-                        message['title_analysis'] = {'grammar': get_tokens_trankit(message['title'], message['lang'])}
-                    elif model[message['lang']] == 'Natasha' and message['lang'] == 'ru':
-                        message['title_analysis'] = {'grammar': get_tokens_natasha(message['title'])}
-                    elif model[message['lang']] == 'Spacy':
-                        message['title_analysis'] = {'grammar': get_tokens_spacy(message['title'], message['lang'])}
-                    elif model[message['lang']] == 'NLTK':
-                        message['title_analysis'] = {'grammar': get_tokens_nltk(message['title'], message['lang'])}
-                    if 'grammar' in message['title_analysis']:
-                        message['title_analysis']['grammar'] = join_tokens(message['title'],
-                                                                           message['title_analysis']['grammar'],
-                                                                           message['lang'])
-                except:
-                    e = sys.exc_info()[1]
-                    t = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-                    print("%s Module: %s, function: %s, text ID: %s, error: %s" % (t, 'tokenization', 'tokenization', message_id, e))
+        tokenize_message(message)
     return messages_new